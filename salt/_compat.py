@@ -141,3 +141,57 @@ if PY3:
     from io import StringIO
 else:
     from StringIO import StringIO
+
+
+class _OrderedDict(dict):
+    '''
+    The parts of the insertion ordered dict of Python 2.7 which salt uses,
+    for Python 2.6
+    '''
+    def __init__(self):
+        dict.__init__(self)
+        self._keys = []
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._keys.append(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._keys.remove(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._keys.remove(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self, last=True):
+        if not self._keys:
+            raise KeyError('dictionary is empty')
+        if last:
+            key = self._keys[-1]
+        else:
+            key = self._keys[0]
+        return key, self.pop(key)
+
+    def clear(self):
+        dict.clear(self)
+        self._keys = []
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = _OrderedDict
@@ -30,9 +30,11 @@ The data structure needs to be:
 
 import os
 import sys
-import glob
 import time
+import Queue
 import getpass
+import logging
+import threading
 
 # Import salt modules
 import salt.config
@@ -40,7 +42,10 @@ import salt.payload
 import salt.utils
 import salt.utils.verify
 import salt.utils.event
-from salt.exceptions import SaltInvocationError
+import salt.utils.jobcache
+from salt.exceptions import SaltInvocationError, SaltReqTimeoutError
+
+log = logging.getLogger(__name__)
 
 # Try to import range from https://github.com/ytoolshed/range
 RANGE = False
@@ -73,6 +78,8 @@ class LocalClient(object):
         self.salt_user = self.__get_user()
         self.key = self.__read_master_key()
         self.event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
+        self.job_cache = salt.utils.jobcache.get_job_cache(self.opts)
+        self.event_backlog = {}
 
     def __read_master_key(self):
         '''
@@ -162,12 +169,13 @@ class LocalClient(object):
         Returns a dict of (checked) pub_data or an empty dict.
         '''
         try:
-            jid = salt.utils.prep_jid(
-                    self.opts['cachedir'],
-                    self.opts['hash_type']
-                    )
+            jid = self.job_cache.prep_jid()
         except Exception:
             jid = ''
+        if jid:
+            # Follow the events of the job before it is published so that no
+            # return is missed
+            self.event.subscribe(jid)
 
         pub_data = self.pub(
             tgt,
@@ -350,6 +358,74 @@ class LocalClient(object):
                     expr_form,
                     verbose))
 
+    def _iter_event_returns(self, jid, wait=1):
+        '''
+        Yield lists of the events of a job from the master event bus, the
+        first list holds the returns which were saved before the subscription
+        and are read once from the job cache. An empty list is yielded when
+        no event arrived within wait seconds.
+        '''
+        self.event.subscribe(jid)
+        # Events of other jobs followed by this client are kept for them
+        backlog = self.event_backlog.setdefault(jid, [])
+        found = set()
+        try:
+            cached = []
+            for id_, data in self.job_cache.get_returns(jid).items():
+                found.add(id_)
+                raw = {'id': id_, 'jid': jid, 'return': data['ret']}
+                if 'out' in data:
+                    raw['out'] = data['out']
+                cached.append(raw)
+            yield cached
+            while True:
+                if backlog:
+                    event = backlog.pop(0)
+                else:
+                    event = self.event.get_event(wait, jid, full=True)
+                if event is None:
+                    yield []
+                    continue
+                if event['tag'] != jid:
+                    if event['tag'] in self.event_backlog:
+                        self.event_backlog[event['tag']].append(event)
+                    continue
+                raw = event['data']
+                if 'id' in raw:
+                    if raw['id'] in found:
+                        # The return was already read from the job cache
+                        continue
+                    found.add(raw['id'])
+                yield [raw]
+        finally:
+            self.event_backlog.pop(jid, None)
+            self.event.unsubscribe(jid)
+
+    def _format_ret(self, raw):
+        '''
+        Return the return data of a minion from a return event
+        '''
+        ret = {'ret': raw['return']}
+        if 'out' in raw:
+            ret['out'] = raw['out']
+        return ret
+
+    def _returns_done(self, jid, found, minions, start, gstart, timeout):
+        '''
+        Return True when the returns of a job are no longer waited for
+        '''
+        now = int(time.time())
+        if (len(found.intersection(minions)) < len(minions)
+                and not now > start + timeout
+                and (found or not now > gstart + timeout)):
+            return False
+        if (self.job_cache.has_wtag(jid)
+                and not now > start + timeout + 1):
+            # The timeout +1 has not been reached and there is still a
+            # write tag for the syndic
+            return False
+        return True
+
     def get_cli_returns(
             self,
             jid,
@@ -371,75 +447,48 @@ class LocalClient(object):
             timeout = self.opts['timeout']
         fret = {}
         inc_timeout = timeout
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
         start = int(time.time())
         found = set()
-        wtag = os.path.join(jid_dir, 'wtag*')
+        minions = set(minions)
         # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(jid):
             yield {}
         # Wait for the hosts to check in
-        while True:
-            for fn_ in os.listdir(jid_dir):
-                ret = {}
-                if fn_.startswith('.'):
+        for raws in self._iter_event_returns(jid):
+            for raw in raws:
+                if 'syndic' in raw:
+                    minions.update(raw['syndic'])
                     continue
-                if fn_ not in found:
-                    retp = os.path.join(jid_dir, fn_, 'return.p')
-                    outp = os.path.join(jid_dir, fn_, 'out.p')
-                    if not os.path.isfile(retp):
-                        continue
-                    while fn_ not in ret:
-                        try:
-                            check = True
-                            ret_data = self.serial.load(open(retp, 'r'))
-                            if ret_data is None:
-                                # Sometimes the ret data is read at the wrong
-                                # time and returns None, do a quick re-read
-                                if check:
-                                    check = False
-                                    continue
-                            ret[fn_] = {'ret': ret_data}
-                            if os.path.isfile(outp):
-                                ret[fn_]['out'] = self.serial.load(open(outp, 'r'))
-                        except Exception:
-                            pass
-                    found.add(fn_)
-                    fret.update(ret)
-                    yield ret
-            if glob.glob(wtag) and not int(time.time()) > start + timeout + 1:
-                # The timeout +1 has not been reached and there is still a
-                # write tag for the syndic
+                ret = {raw['id']: self._format_ret(raw)}
+                found.add(raw['id'])
+                fret.update(ret)
+                yield ret
+            if not self._returns_done(
+                    jid, found, minions, start, start, timeout):
                 continue
             if len(found.intersection(minions)) >= len(minions):
                 # All minions have returned, break out of the loop
                 break
-            if int(time.time()) > start + timeout:
-                # The timeout has been reached, check the jid to see if the
-                # timeout needs to be increased
-                jinfo = self.gather_job_info(jid, tgt, tgt_type, **kwargs)
-                more_time = False
-                for id_ in jinfo:
-                    if jinfo[id_]:
-                        if verbose:
-                            print('Execution is still running on {0}'.format(id_))
-                        more_time = True
-                if more_time:
-                    timeout += inc_timeout
-                    continue
-                if verbose:
-                    if tgt_type == 'glob' or tgt_type == 'pcre':
-                        if len(found.intersection(minions)) >= len(minions):
-                            print('\nThe following minions did not return:')
-                            fail = sorted(list(minions.difference(found)))
-                            for minion in fail:
-                                print(minion)
-                break
-            time.sleep(0.01)
+            # The timeout has been reached, check the jid to see if the
+            # timeout needs to be increased
+            jinfo = self.gather_job_info(jid, tgt, tgt_type, **kwargs)
+            more_time = False
+            for id_ in jinfo:
+                if jinfo[id_]:
+                    if verbose:
+                        print('Execution is still running on {0}'.format(id_))
+                    more_time = True
+            if more_time:
+                timeout += inc_timeout
+                continue
+            if verbose:
+                if tgt_type == 'glob' or tgt_type == 'pcre':
+                    if len(found.intersection(minions)) >= len(minions):
+                        print('\nThe following minions did not return:')
+                        fail = sorted(list(minions.difference(found)))
+                        for minion in fail:
+                            print(minion)
+            break
 
     def get_iter_returns(self, jid, minions, timeout=None):
         '''
@@ -448,109 +497,35 @@ class LocalClient(object):
         '''
         if timeout is None:
             timeout = self.opts['timeout']
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
         start = 999999999999
         gstart = int(time.time())
         found = set()
-        wtag = os.path.join(jid_dir, 'wtag*')
         # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(jid):
             yield {}
-        # Wait for the hosts to check in
-        while True:
-            for fn_ in os.listdir(jid_dir):
-                ret = {}
-                if fn_.startswith('.'):
+        # Wait for the hosts to check in, None is yielded while waiting
+        for raws in self._iter_event_returns(jid, 0.02):
+            for raw in raws:
+                if 'return' not in raw:
                     continue
-                if fn_ not in found:
-                    retp = os.path.join(jid_dir, fn_, 'return.p')
-                    outp = os.path.join(jid_dir, fn_, 'out.p')
-                    if not os.path.isfile(retp):
-                        continue
-                    while fn_ not in ret:
-                        try:
-                            ret_data = self.serial.load(open(retp, 'r'))
-                            ret[fn_] = {'ret': ret_data}
-                            if os.path.isfile(outp):
-                                ret[fn_]['out'] = self.serial.load(open(outp, 'r'))
-                        except Exception:
-                            pass
-                    found.add(fn_)
-                    yield ret
-            if ret and start == 999999999999:
-                start = int(time.time())
-            if glob.glob(wtag) and not int(time.time()) > start + timeout + 1:
-                # The timeout +1 has not been reached and there is still a
-                # write tag for the syndic
-                continue
-            if len(found.intersection(minions)) >= len(minions):
-                break
-            if int(time.time()) > start + timeout:
-                break
-            if int(time.time()) > gstart + timeout and not ret:
-                # No minions have replied within the specified global timeout,
-                # return an empty dict
+                found.add(raw['id'])
+                if start == 999999999999:
+                    start = int(time.time())
+                yield {raw['id']: self._format_ret(raw)}
+            if self._returns_done(jid, found, minions, start, gstart, timeout):
                 break
-            yield None
-            time.sleep(0.02)
+            if not raws:
+                yield None
 
     def get_returns(self, jid, minions, timeout=None):
         '''
         This method starts off a watcher looking at the return data for
         a specified jid
         '''
-        if timeout is None:
-            timeout = self.opts['timeout']
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        start = 999999999999
-        gstart = int(time.time())
-        ret = {}
-        wtag = os.path.join(jid_dir, 'wtag*')
-        # If jid == 0, there is no payload
-        if int(jid) == 0:
-            return ret
-        # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
-            return ret
-        # Wait for the hosts to check in
-        while True:
-            for fn_ in os.listdir(jid_dir):
-                if fn_.startswith('.'):
-                    continue
-                if fn_ not in ret:
-                    retp = os.path.join(jid_dir, fn_, 'return.p')
-                    if not os.path.isfile(retp):
-                        continue
-                    while fn_ not in ret:
-                        try:
-                            ret[fn_] = self.serial.load(open(retp, 'r'))
-                        except Exception:
-                            pass
-            if ret and start == 999999999999:
-                start = int(time.time())
-            if glob.glob(wtag) and not int(time.time()) > start + timeout + 1:
-                # The timeout +1 has not been reached and there is still a
-                # write tag for the syndic
-                continue
-            if len(set(ret.keys()).intersection(minions)) >= len(minions):
-                # All Minions have returned
-                return ret
-            if int(time.time()) > start + timeout:
-                # The timeout has been reached
-                return ret
-            if int(time.time()) > gstart + timeout and not ret:
-                # No minions have replied within the specified global timeout,
-                # return an empty dict
-                return ret
-            time.sleep(0.02)
+        return dict(
+                (id_, data['ret'])
+                for id_, data
+                in self.get_full_returns(jid, minions, timeout).items())
 
     def get_full_returns(self, jid, minions, timeout=None):
         '''
@@ -559,51 +534,26 @@ class LocalClient(object):
         '''
         if timeout is None:
             timeout = self.opts['timeout']
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
         start = 999999999999
         gstart = int(time.time())
         ret = {}
-        wtag = os.path.join(jid_dir, 'wtag*')
+        # If jid == 0, there is no payload
+        if int(jid) == 0:
+            return ret
         # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(jid):
             return ret
         # Wait for the hosts to check in
-        while True:
-            for fn_ in os.listdir(jid_dir):
-                if fn_.startswith('.'):
+        for raws in self._iter_event_returns(jid):
+            for raw in raws:
+                if 'return' not in raw:
                     continue
-                if fn_ not in ret:
-                    retp = os.path.join(jid_dir, fn_, 'return.p')
-                    outp = os.path.join(jid_dir, fn_, 'out.p')
-                    if not os.path.isfile(retp):
-                        continue
-                    while fn_ not in ret:
-                        try:
-                            ret_data = self.serial.load(open(retp, 'r'))
-                            ret[fn_] = {'ret': ret_data}
-                            if os.path.isfile(outp):
-                                ret[fn_]['out'] = self.serial.load(open(outp, 'r'))
-                        except Exception:
-                            pass
-            if ret and start == 999999999999:
-                start = int(time.time())
-            if glob.glob(wtag) and not int(time.time()) > start + timeout + 1:
-                # The timeout +1 has not been reached and there is still a
-                # write tag for the syndic
-                continue
-            if len(set(ret.keys()).intersection(minions)) >= len(minions):
-                return ret
-            if int(time.time()) > start + timeout:
+                ret[raw['id']] = self._format_ret(raw)
+                if start == 999999999999:
+                    start = int(time.time())
+            if self._returns_done(
+                    jid, set(ret), minions, start, gstart, timeout):
                 return ret
-            if int(time.time()) > gstart + timeout and not ret:
-                # No minions have replied within the specified global timeout,
-                # return an empty dict
-                return ret
-            time.sleep(0.02)
 
     def get_cli_static_event_returns(
             self,
@@ -622,48 +572,30 @@ class LocalClient(object):
             print('-' * len(msg) + '\n')
         if timeout is None:
             timeout = self.opts['timeout']
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
         start = int(time.time())
         found = set()
         ret = {}
-        wtag = os.path.join(jid_dir, 'wtag*')
         # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(jid):
             return ret
         # Wait for the hosts to check in
-        while True:
-            raw = self.event.get_event(timeout, jid)
-            if not raw is None:
+        for raws in self._iter_event_returns(jid):
+            for raw in raws:
+                if 'return' not in raw:
+                    continue
                 found.add(raw['id'])
-                ret[raw['id']] = {'ret': raw['return']}
-                if 'out' in raw:
-                    ret[raw['id']]['out'] = raw['out']
-                if len(found.intersection(minions)) >= len(minions):
-                    # All minions have returned, break out of the loop
-                    break
+                ret[raw['id']] = self._format_ret(raw)
+            if not self._returns_done(
+                    jid, found, minions, start, start, timeout):
                 continue
-            # Then event system timeout was reached and nothing was returned
-            if len(found.intersection(minions)) >= len(minions):
-                # All minions have returned, break out of the loop
-                break
-            if glob.glob(wtag) and not int(time.time()) > start + timeout + 1:
-                # The timeout +1 has not been reached and there is still a
-                # write tag for the syndic
-                continue
-            if int(time.time()) > start + timeout:
-                if verbose:
-                    if tgt_type == 'glob' or tgt_type == 'pcre':
-                        if not len(found) >= len(minions):
-                            print('\nThe following minions did not return:')
-                            fail = sorted(list(minions.difference(found)))
-                            for minion in fail:
-                                print(minion)
-                break
-            time.sleep(0.01)
+            if verbose:
+                if tgt_type == 'glob' or tgt_type == 'pcre':
+                    if not len(found) >= len(minions):
+                        print('\nThe following minions did not return:')
+                        fail = sorted(list(minions.difference(found)))
+                        for minion in fail:
+                            print(minion)
+            break
         return ret
 
     def get_cli_event_returns(
@@ -691,63 +623,45 @@ class LocalClient(object):
         if timeout is None:
             timeout = self.opts['timeout']
         inc_timeout = timeout
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
         start = int(time.time())
         found = set()
-        wtag = os.path.join(jid_dir, 'wtag*')
         # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(jid):
             yield {}
         # Wait for the hosts to check in
-        while True:
-            raw = self.event.get_event(timeout, jid)
-            if not raw is None:
+        for raws in self._iter_event_returns(jid):
+            for raw in raws:
                 if 'syndic' in raw:
                     minions.update(raw['syndic'])
                     continue
                 found.add(raw['id'])
-                ret = {raw['id']: {'ret': raw['return']}}
-                if 'out' in raw:
-                    ret[raw['id']]['out'] = raw['out']
-                yield ret
-                if len(found.intersection(minions)) >= len(minions):
-                    # All minions have returned, break out of the loop
-                    break
+                yield {raw['id']: self._format_ret(raw)}
+            if not self._returns_done(
+                    jid, found, minions, start, start, timeout):
                 continue
-            # Then event system timeout was reached and nothing was returned
             if len(found.intersection(minions)) >= len(minions):
                 # All minions have returned, break out of the loop
                 break
-            if glob.glob(wtag) and not int(time.time()) > start + timeout + 1:
-                # The timeout +1 has not been reached and there is still a
-                # write tag for the syndic
+            # The timeout has been reached, check the jid to see if the
+            # timeout needs to be increased
+            jinfo = self.gather_job_info(jid, tgt, tgt_type, **kwargs)
+            more_time = False
+            for id_ in jinfo:
+                if jinfo[id_]:
+                    if verbose:
+                        print('Execution is still running on {0}'.format(id_))
+                    more_time = True
+            if more_time:
+                timeout += inc_timeout
                 continue
-            if int(time.time()) > start + timeout:
-                # The timeout has been reached, check the jid to see if the
-                # timeout needs to be increased
-                jinfo = self.gather_job_info(jid, tgt, tgt_type, **kwargs)
-                more_time = False
-                for id_ in jinfo:
-                    if jinfo[id_]:
-                        if verbose:
-                            print('Execution is still running on {0}'.format(id_))
-                        more_time = True
-                if more_time:
-                    timeout += inc_timeout
-                    continue
-                if verbose:
-                    if tgt_type == 'glob' or tgt_type == 'pcre':
-                        if not len(found) >= len(minions):
-                            print('\nThe following minions did not return:')
-                            fail = sorted(list(minions.difference(found)))
-                            for minion in fail:
-                                print(minion)
-                break
-            time.sleep(0.01)
+            if verbose:
+                if tgt_type == 'glob' or tgt_type == 'pcre':
+                    if not len(found) >= len(minions):
+                        print('\nThe following minions did not return:')
+                        fail = sorted(list(minions.difference(found)))
+                        for minion in fail:
+                            print(minion)
+            break
 
     def get_event_iter_returns(self, jid, minions, timeout=None):
         '''
@@ -756,59 +670,31 @@ class LocalClient(object):
         '''
         if timeout is None:
             timeout = self.opts['timeout']
-        jid_dir = salt.utils.jid_dir(
-                jid,
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        found = set()
         # Check to see if the jid is real, if not return the empty dict
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(jid):
             yield {}
         # Wait for the hosts to check in
-        while True:
-            raw = self.event.get_event(timeout)
-            if raw is None:
+        for ind, raws in enumerate(self._iter_event_returns(jid, timeout)):
+            if ind and not raws:
                 # Timeout reached
                 break
-            found.add(raw['id'])
-            ret = {raw['id']: {'ret': raw['return']}}
-            if 'out' in raw:
-                ret[raw['id']]['out'] = raw['out']
-            yield ret
-            time.sleep(0.02)
-
+            for raw in raws:
+                if 'return' in raw:
+                    yield {raw['id']: self._format_ret(raw)}
 
     def find_cmd(self, cmd):
         '''
         Hunt through the old salt calls for when cmd was run, return a dict:
         {'<jid>': <return_obj>}
         '''
-        job_dir = os.path.join(self.opts['cachedir'], 'jobs')
         ret = {}
-        for jid in os.listdir(job_dir):
-            jid_dir = salt.utils.jid_dir(
-                    jid,
-                    self.opts['cachedir'],
-                    self.opts['hash_type']
-                    )
-            loadp = os.path.join(jid_dir, '.load.p')
-            if os.path.isfile(loadp):
-                try:
-                    load = self.serial.load(open(loadp, 'r'))
-                    if load['fun'] == cmd:
-                        # We found a match! Add the return values
-                        ret[jid] = {}
-                        for host in os.listdir(jid_dir):
-                            host_dir = os.path.join(jid_dir, host)
-                            retp = os.path.join(host_dir, 'return.p')
-                            if not os.path.isfile(retp):
-                                continue
-                            ret[jid][host] = self.serial.load(open(retp))
-                except Exception:
-                    continue
-            else:
-                continue
+        for jid, load in self.job_cache.list_jobs().items():
+            if load.get('fun') == cmd:
+                # We found a match! Add the return values
+                ret[jid] = dict(
+                        (host, data['ret'])
+                        for host, data
+                        in self.job_cache.get_returns(jid).items())
         return ret
 
     def pub(self, 
@@ -896,13 +782,252 @@ class LocalClient(object):
         sreq = salt.payload.SREQ(
                 'tcp://{0[interface]}:{0[ret_port]}'.format(self.opts),
                 )
-        payload = sreq.send('clear', payload_kwargs)
+        try:
+            payload = sreq.send('clear', payload_kwargs)
+        except SaltReqTimeoutError:
+            log.error('The master did not acknowledge the publication')
+            # A jid of 0 is returned when the master cannot be reached
+            return {'jid': '0', 'minions': []}
         if not payload:
             return payload
         return {'jid': payload['load']['jid'],
                 'minions': payload['load']['minions']}
 
 
+class AsyncJob(object):
+    '''
+    The handle of a job published by the AsyncLocalClient, the returns are
+    collected in the background as they arrive. Iterating over the handle
+    yields the returns as they arrive, it can be iterated over once.
+    '''
+    def __init__(self, jid, timeout):
+        self.jid = jid
+        self.timeout = timeout
+        self.minions = set()
+        self.returns = {}
+        self.start = time.time()
+        self.published = False
+        self.queue = Queue.Queue()
+        self.finished = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def _add(self, id_, data):
+        '''
+        Add the return of a minion
+        '''
+        with self.lock:
+            if id_ in self.returns:
+                return
+            self.returns[id_] = data
+        self.queue.put({id_: data})
+
+    def _finish(self):
+        '''
+        Mark the job as finished and run the callbacks
+        '''
+        with self.lock:
+            if self.finished.is_set():
+                return
+            self.finished.set()
+            callbacks = self.callbacks
+            self.callbacks = []
+        self.queue.put(None)
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            log.error(
+                'Callback of job {0} failed'.format(self.jid),
+                exc_info=True
+            )
+
+    def done(self):
+        '''
+        Return True if the job is finished
+        '''
+        return self.finished.is_set()
+
+    def add_done_callback(self, callback):
+        '''
+        Call the callback with the handle once the job is finished, it is
+        called from the thread which reads the events
+        '''
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def result(self, timeout=None, full=False):
+        '''
+        Wait for the job to finish and return the returns of the minions,
+        pass full=True to get the output of the minions as well
+        '''
+        self.finished.wait(timeout)
+        if full:
+            return dict(self.returns)
+        return dict(
+                (id_, data['ret']) for id_, data in self.returns.items())
+
+    def __iter__(self):
+        while True:
+            try:
+                ret = self.queue.get(True, 1)
+            except Queue.Empty:
+                continue
+            if ret is None:
+                break
+            yield ret
+
+
+class AsyncLocalClient(LocalClient):
+    '''
+    Publish many jobs from one process without waiting on their returns. The
+    returns of all of the jobs are read from a single subscription to the
+    master event bus by a background thread and handed to the AsyncJob of
+    each job, the publications share the request channels of the process.
+    '''
+    def __init__(self, c_path='/etc/salt'):
+        LocalClient.__init__(self, c_path)
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.reader = None
+        self.event_wait = 0.1
+
+    def _start_reader(self):
+        '''
+        Start the thread which reads the events of the jobs
+        '''
+        with self.jobs_lock:
+            if self.reader is None:
+                # Subscribe before the first job is published, not once the
+                # thread runs
+                event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
+                event.subscribe()
+                self.reader = threading.Thread(
+                        target=self._read_events,
+                        args=(event,))
+                self.reader.daemon = True
+                self.reader.start()
+
+    def _read_events(self, event):
+        '''
+        Hand the returns on the master event bus to the jobs
+        '''
+        last_expire = 0
+        while True:
+            try:
+                raw = event.get_event(self.event_wait, full=True)
+                if raw is not None:
+                    with self.jobs_lock:
+                        job = self.jobs.get(raw['tag'])
+                    if job is not None:
+                        self._dispatch(job, raw['data'])
+                if time.time() - last_expire >= self.event_wait:
+                    last_expire = time.time()
+                    self._expire()
+            except Exception:
+                log.error('Failed to handle a job event', exc_info=True)
+
+    def _dispatch(self, job, data):
+        '''
+        Hand an event to its job
+        '''
+        if 'syndic' in data:
+            job.minions.update(data['syndic'])
+            return
+        if 'return' not in data or 'id' not in data:
+            return
+        job._add(data['id'], self._format_ret(data))
+        if (job.published
+                and job.minions.issubset(job.returns)
+                and not self.job_cache.has_wtag(job.jid)):
+            self._finish(job)
+
+    def _expire(self):
+        '''
+        Finish the jobs which reached their timeout
+        '''
+        now = time.time()
+        with self.jobs_lock:
+            jobs = self.jobs.values()
+        for job in jobs:
+            if not job.published or now < job.start + job.timeout:
+                continue
+            if (self.job_cache.has_wtag(job.jid)
+                    and now < job.start + job.timeout + 1):
+                # There is still a write tag for the syndic
+                continue
+            # Pick up the returns whose events were not received
+            returns = self.job_cache.get_returns(job.jid, job.returns)
+            for id_, data in returns.items():
+                job._add(id_, data)
+            self._finish(job)
+
+    def _finish(self, job):
+        with self.jobs_lock:
+            self.jobs.pop(job.jid, None)
+        job._finish()
+
+    def submit(
+        self,
+        tgt,
+        fun,
+        arg=(),
+        timeout=None,
+        expr_form='glob',
+        ret='',
+        kwarg=None,
+        **kwargs):
+        '''
+        Publish a job and return its AsyncJob without waiting for the returns,
+        the job is finished once all of the targeted minions returned or the
+        timeout is reached
+        '''
+        arg = condition_kwarg(arg, kwarg)
+        timeout = timeout or self.opts['timeout']
+        self._start_reader()
+        jid = self.job_cache.prep_jid()
+        job = AsyncJob(jid, timeout)
+        # Follow the job before it is published so that no return is missed
+        with self.jobs_lock:
+            self.jobs[jid] = job
+        try:
+            pub_data = self._check_pub_data(
+                self.pub(
+                    tgt,
+                    fun,
+                    arg,
+                    expr_form,
+                    ret,
+                    jid=jid,
+                    timeout=timeout,
+                    **kwargs))
+        except Exception:
+            self._finish(job)
+            raise
+        if not pub_data:
+            self._finish(job)
+            return job
+        job.minions.update(pub_data['minions'])
+        job.start = time.time()
+        job.published = True
+        # Pick up the returns which were saved before the subscription to the
+        # event bus was in place
+        returns = self.job_cache.get_returns(jid, job.returns)
+        for id_, data in returns.items():
+            job._add(id_, data)
+        if (job.minions.issubset(job.returns)
+                and not self.job_cache.has_wtag(jid)):
+            # The minions returned before the publication was acknowledged
+            self._finish(job)
+        return job
+
+
 class FunctionWrapper(dict):
     '''
     Create a function wrapper that looks like the functions dict on the minion
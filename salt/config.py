@@ -202,6 +202,10 @@ def minion_config(path):
             'state_verbose': True,
             'state_output': 'full',
             'acceptance_wait_time': 10,
+            'payload_compress': True,
+            'payload_compress_threshold': 65536,
+            'payload_compress_level': 1,
+            'zmq_filtering': False,
             'dns_check': True,
             'verify_env': True,
             'grains': {},
@@ -254,6 +258,8 @@ def master_config(path):
             'publish_port': '4505',
             'user': 'root',
             'worker_threads': 5,
+            'worker_mode': 'sync',
+            'worker_async_threads': 8,
             'sock_dir': '/var/run/salt',
             'ret_port': '4506',
             'timeout': 5,
@@ -271,6 +277,10 @@ def master_config(path):
                 'base': ['/srv/pillar'],
                 },
             'ext_pillar': [],
+            'ext_pillar_timeout': 0,
+            'ext_pillar_cache_ttl': 0,
+            'pillar_cache_ttl': 0,
+            'pillar_cache_size': 1000,
             'syndic_master': '',
             'runner_dirs': [],
             'client_acl': {},
@@ -281,6 +291,7 @@ def master_config(path):
             'hash_type': 'md5',
             'conf_file': path,
             'pub_refresh': False,
+            'pub_hwm': 1000,
             'open_mode': False,
             'auto_accept': False,
             'renderer': 'yaml_jinja',
@@ -290,6 +301,7 @@ def master_config(path):
             'external_nodes': '',
             'order_masters': False,
             'job_cache': True,
+            'job_cache_backend': 'sqlite',
             'minion_data_cache': True,
             'log_file': '/var/log/salt/master',
             'log_level': None,
@@ -303,6 +315,16 @@ def master_config(path):
             'cluster_mode': 'paranoid',
             'range_server': 'range:80',
             'serial': 'msgpack',
+            'session_ticket_ttl': 86400,
+            'auth_workers': 2,
+            'auth_queue_size': 100,
+            'worker_pools': {},
+            'master_stats_event': False,
+            'master_stats_event_interval': 60,
+            'payload_compress': True,
+            'payload_compress_threshold': 65536,
+            'payload_compress_level': 1,
+            'zmq_filtering': False,
             'state_verbose': True,
             'state_output': 'full',
             'nodegroups': {},
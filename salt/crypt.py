@@ -8,6 +8,9 @@ authenticating peers
 import os
 import sys
 import hmac
+import time
+import random
+import zlib
 import hashlib
 import logging
 import tempfile
@@ -25,6 +28,23 @@ from salt.exceptions import AuthenticationError, SaltClientError, SaltReqTimeout
 log = logging.getLogger(__name__)
 
 
+def _compare_digest(mac_bytes, sig):
+    '''
+    Compare two digests in constant time, used when the hmac module does not
+    provide compare_digest
+    '''
+    if len(mac_bytes) != len(sig):
+        return False
+    result = 0
+    for x, y in zip(mac_bytes, sig):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+# Python 2.7.7 and newer compare digests in C
+compare_digest = getattr(hmac, 'compare_digest', _compare_digest)
+
+
 def clean_old_key(rsa_path):
     '''
     Read in an old m2crypto key and save it back in the clear so
@@ -83,8 +103,12 @@ class MasterKeys(dict):
         self.opts = opts
         self.pub_path = os.path.join(self.opts['pki_dir'], 'master.pub')
         self.rsa_path = os.path.join(self.opts['pki_dir'], 'master.pem')
+        self.ticket_path = os.path.join(
+                self.opts['pki_dir'],
+                'session_ticket.key')
         self.key = self.__get_keys()
         self.token = self.__gen_token()
+        self.ticket_key = self.__get_ticket_key()
 
     def __get_keys(self):
         '''
@@ -106,6 +130,28 @@ class MasterKeys(dict):
             key = RSA.load_key(self.rsa_path)
         return key
 
+    def __get_ticket_key(self):
+        '''
+        Returns the key used to seal minion session tickets, the key is kept
+        on disk so that the tickets stay valid when the master restarts
+        '''
+        if os.path.isfile(self.ticket_path):
+            with open(self.ticket_path, 'r') as fp_:
+                key = fp_.read().strip()
+            if key:
+                return key
+        log.info('Generating session ticket key: {0}'.format(self.ticket_path))
+        key = Crypticle.generate_key_string()
+        cumask = os.umask(191)
+        try:
+            with open(self.ticket_path, 'w+') as fp_:
+                fp_.write(key)
+        finally:
+            os.umask(cumask)
+        # An empty key file left behind can have other permissions
+        os.chmod(self.ticket_path, 384)
+        return key
+
     def __gen_token(self):
         '''
         Generate the authentication token
@@ -127,9 +173,12 @@ class Auth(object):
     The Auth class provides the sequence for setting up communication with
     the master server from a minion.
     '''
-    def __init__(self, opts):
+    def __init__(self, opts, session_tickets=False):
         self.opts = opts
         self.serial = salt.payload.Serial(self.opts)
+        # Only an Auth which signs in again asks for session tickets, the
+        # ticket costs an extra RSA operation on both ends
+        self.session_tickets = session_tickets
         self.pub_path = os.path.join(self.opts['pki_dir'], 'minion.pub')
         self.rsa_path = os.path.join(self.opts['pki_dir'], 'minion.pem')
         if 'syndic_master' in self.opts:
@@ -138,6 +187,11 @@ class Auth(object):
             self.mpub = 'monitor_master.pub'
         else:
             self.mpub = 'minion_master.pub'
+        # The session ticket and secret handed out by the master
+        self.session = None
+        # The number of seconds the master asked us to wait before signing
+        # in again
+        self.try_again = 0
 
     def get_keys(self):
         '''
@@ -177,6 +231,17 @@ class Auth(object):
         payload['load'] = {}
         payload['load']['cmd'] = '_auth'
         payload['load']['id'] = self.opts['id']
+        # Advertise the serializers this minion can decode
+        payload['load']['serials'] = salt.payload.available_serializers(
+                self.opts.get('serial')
+                )
+        if self.session_tickets:
+            # Present the session ticket from the last sign in, an empty
+            # ticket tells the master that this minion supports session
+            # tickets
+            payload['load']['ticket'] = ''
+            if self.session:
+                payload['load']['ticket'] = self.session['ticket']
         with open(tmp_pub, 'r') as fp_:
             payload['load']['pub'] = fp_.read()
         os.remove(tmp_pub)
@@ -229,6 +294,14 @@ class Auth(object):
                   'reason, verify your salt keys')
         return False
 
+    def busy_wait(self):
+        '''
+        Return the number of seconds to wait after the master turned away a
+        sign in, a random jitter spreads out the minions which were turned
+        away at the same time
+        '''
+        return self.try_again + random.uniform(0, self.try_again)
+
     def sign_in(self):
         '''
         Send a sign in request to the master, sets the key information and
@@ -252,7 +325,14 @@ class Auth(object):
             payload = sreq.send_auto(self.minion_sign_in_payload())
         except SaltReqTimeoutError:
             return 'retry'
+        self.try_again = 0
         if 'load' in payload:
+            if 'try_again' in payload['load']:
+                self.try_again = payload['load']['try_again']
+                log.info(
+                    'The Salt Master is busy authenticating other minions'
+                )
+                return 'retry'
             if 'ret' in payload['load']:
                 if not payload['load']['ret']:
                     log.critical(
@@ -295,8 +375,41 @@ class Auth(object):
                         )
                     )
                 sys.exit(42)
-        auth['aes'] = self.decrypt_aes(payload['aes'])
+        if 'serial' in payload:
+            if payload['serial'] in salt.payload.SERIALIZERS:
+                if payload['serial'] != self.opts.get('serial', 'msgpack'):
+                    log.info(
+                        'Switching to the {0} serializer used by the '
+                        'master'.format(payload['serial'])
+                    )
+                    self.opts['serial'] = payload['serial']
+                    self.serial = salt.payload.Serial(self.opts)
+            else:
+                log.error(
+                    'The master uses the {0} serializer which is not '
+                    'available on this minion'.format(payload['serial'])
+                )
+        if 'session_aes' in payload and self.session:
+            # The master accepted the session ticket
+            try:
+                auth['aes'] = Crypticle(
+                        self.opts,
+                        self.session['secret']).loads(payload['session_aes'])
+            except AuthenticationError:
+                log.warning('Failed to resume the session with the master')
+                self.session = None
+                return self.sign_in()
+        else:
+            auth['aes'] = self.decrypt_aes(payload['aes'])
+        if 'ticket' in payload and self.session_tickets:
+            self.session = {'ticket': payload['ticket'],
+                            'secret': self.decrypt_aes(payload['session'])}
         auth['publish_port'] = payload['publish_port']
+        # Masters which understand compressed payloads say so
+        auth['compress'] = payload.get('compress', False)
+        # As do the masters which take the digest of the grains in place of
+        # the grains
+        auth['grains_digest'] = payload.get('grains_digest', False)
         return auth
 
 
@@ -309,13 +422,31 @@ class Crypticle(object):
     '''
 
     PICKLE_PAD = 'pickle::'
+    # Payloads from peers which support compression start with one of these
+    RAW_PAD = 'raw::'
+    ZLIB_PAD = 'zlib::'
     AES_BLOCK_SIZE = 16
     SIG_SIZE = hashlib.sha256().digest_size
+    # Large payloads are encrypted and signed in chunks of this many bytes,
+    # it must be a multiple of AES_BLOCK_SIZE
+    CHUNK_SIZE = 65536
 
-    def __init__(self, opts, key_string, key_size=192):
+    def __init__(self, opts, key_string, key_size=192, peer_compress=False):
         self.keys = self.extract_keys(key_string, key_size)
         self.key_size = key_size
         self.serial = salt.payload.Serial(opts)
+        # Only send the compression aware envelope to a peer which is known
+        # to understand it
+        self.peer_compress = peer_compress
+        self.compress = opts.get('payload_compress', True)
+        self.compress_threshold = opts.get('payload_compress_threshold', 65536)
+        self.compress_level = opts.get('payload_compress_level', 1)
+        self.stats = {'compressed': 0,
+                      'decompressed': 0,
+                      'bytes_in': 0,
+                      'bytes_out': 0,
+                      'compress_time': 0.0,
+                      'decompress_time': 0.0}
 
     @classmethod
     def generate_key_string(cls, key_size=192):
@@ -328,57 +459,157 @@ class Crypticle(object):
         assert len(key) == key_size / 8 + cls.SIG_SIZE, 'invalid key'
         return key[:-cls.SIG_SIZE], key[-cls.SIG_SIZE:]
 
+    def _target_digest(self, tgt, tgt_type, payload):
+        '''
+        Return the HMAC of a clear text target, the trailing signature of
+        the encrypted payload is included so that the target cannot be moved
+        to another publication
+        '''
+        hmac_key = self.keys[1]
+        header = salt.payload.package([tgt, tgt_type])
+        return hmac.new(
+                hmac_key,
+                header + payload[-self.SIG_SIZE:],
+                hashlib.sha256).digest()
+
+    def sign_target(self, tgt, tgt_type, payload):
+        '''
+        Sign the clear text target sent along with an encrypted publication
+        '''
+        return self._target_digest(tgt, tgt_type, payload)
+
+    def verify_target(self, tgt, tgt_type, payload, sig):
+        '''
+        Verify that a clear text target was signed with this key for the
+        given encrypted publication
+        '''
+        return compare_digest(
+                self._target_digest(tgt, tgt_type, payload),
+                sig)
+
     def encrypt(self, data):
         '''
         encrypt data with AES-CBC and sign it with HMAC-SHA256
         '''
+        return self.encrypt_parts([data])
+
+    def encrypt_parts(self, parts):
+        '''
+        encrypt the concatenation of the strings in parts with AES-CBC and
+        sign it with HMAC-SHA256. The parts are never joined, they are
+        encrypted and signed CHUNK_SIZE bytes at a time.
+        '''
         aes_key, hmac_key = self.keys
-        pad = self.AES_BLOCK_SIZE - len(data) % self.AES_BLOCK_SIZE
-        data = data + pad * chr(pad)
-        iv_bytes = os.urandom(self.AES_BLOCK_SIZE)
+        block_size = self.AES_BLOCK_SIZE
+        iv_bytes = os.urandom(block_size)
         cypher = AES.new(aes_key, AES.MODE_CBC, iv_bytes)
-        data = iv_bytes + cypher.encrypt(data)
-        sig = hmac.new(hmac_key, data, hashlib.sha256).digest()
-        return data + sig
+        mac = hmac.new(hmac_key, iv_bytes, hashlib.sha256)
+        ret = [iv_bytes]
+        # The bytes which do not fill a block yet
+        carry = ''
+        for part in parts:
+            start = 0
+            if carry:
+                start = min(block_size - len(carry), len(part))
+                carry += part[:start]
+                if len(carry) < block_size:
+                    continue
+                chunk = cypher.encrypt(carry)
+                mac.update(chunk)
+                ret.append(chunk)
+                carry = ''
+            end = start + (len(part) - start) // block_size * block_size
+            for ind in range(start, end, self.CHUNK_SIZE):
+                chunk = cypher.encrypt(
+                        buffer(part, ind, min(self.CHUNK_SIZE, end - ind)))
+                mac.update(chunk)
+                ret.append(chunk)
+            carry = part[end:]
+        pad = block_size - len(carry)
+        chunk = cypher.encrypt(carry + pad * chr(pad))
+        mac.update(chunk)
+        ret.append(chunk)
+        ret.append(mac.digest())
+        return ''.join(ret)
 
     def decrypt(self, data):
         '''
         verify HMAC-SHA256 signature and decrypt data with AES-CBC
         '''
         aes_key, hmac_key = self.keys
-        sig = data[-self.SIG_SIZE:]
-        data = data[:-self.SIG_SIZE]
-        mac_bytes = hmac.new(hmac_key, data, hashlib.sha256).digest()
-        if len(mac_bytes) != len(sig):
+        block_size = self.AES_BLOCK_SIZE
+        end = len(data) - self.SIG_SIZE
+        mac = hmac.new(hmac_key, digestmod=hashlib.sha256)
+        for ind in range(0, max(end, 0), self.CHUNK_SIZE):
+            mac.update(buffer(data, ind, min(self.CHUNK_SIZE, end - ind)))
+        if end < 2 * block_size \
+                or not compare_digest(mac.digest(), data[end:]):
             log.warning('Failed to authenticate message')
             raise AuthenticationError('message authentication failed')
-        result = 0
-        for x, y in zip(mac_bytes, sig):
-            result |= ord(x) ^ ord(y)
-        if result != 0:
-            log.warning('Failed to authenticate message')
-            raise AuthenticationError('message authentication failed')
-        iv_bytes = data[:self.AES_BLOCK_SIZE]
-        data = data[self.AES_BLOCK_SIZE:]
-        cypher = AES.new(aes_key, AES.MODE_CBC, iv_bytes)
-        data = cypher.decrypt(data)
-        return data[:-ord(data[-1])]
+        cypher = AES.new(aes_key, AES.MODE_CBC, data[:block_size])
+        ret = []
+        for ind in range(block_size, end, self.CHUNK_SIZE):
+            ret.append(cypher.decrypt(
+                    buffer(data, ind, min(self.CHUNK_SIZE, end - ind))))
+        # Strip the padding from the last block
+        ret[-1] = ret[-1][:-ord(ret[-1][-1])]
+        return ''.join(ret)
+
+    def dumps(self, obj, compress=None):
+        '''
+        Serialize and encrypt a python object, large payloads are compressed
+        when the peer supports it. Pass compress to override what is known
+        about the peer.
+        '''
+        if compress is None:
+            compress = self.peer_compress
+        data = self.serial.dumps(obj)
+        if not compress:
+            return self.encrypt_parts([self.PICKLE_PAD, data])
+        if not self.compress or len(data) < self.compress_threshold:
+            return self.encrypt_parts([self.RAW_PAD, data])
+        start = time.clock()
+        zdata = zlib.compress(data, self.compress_level)
+        cpu = time.clock() - start
+        self.stats['compressed'] += 1
+        self.stats['bytes_in'] += len(data)
+        self.stats['bytes_out'] += len(zdata)
+        self.stats['compress_time'] += cpu
+        log.debug(
+            'Compressed payload from {0} to {1} bytes (ratio {2:.2f}) in '
+            '{3:.6f} cpu seconds'.format(
+                len(data),
+                len(zdata),
+                float(len(data)) / max(len(zdata), 1),
+                cpu
+            )
+        )
+        return self.encrypt_parts([self.ZLIB_PAD, zdata])
 
-    def dumps(self, obj):
+    def loads_envelope(self, data):
         '''
-        Serialize and encrypt a python object
+        Decrypt and un-serialize a python object, returns a tuple of the
+        object and whether the sender supports compressed payloads
         '''
-        return self.encrypt(self.PICKLE_PAD + self.serial.dumps(obj))
+        data = self.decrypt(data)
+        # simple integrity check to verify that we got meaningful data
+        if data.startswith(self.PICKLE_PAD):
+            return self.serial.loads(data[len(self.PICKLE_PAD):]), False
+        if data.startswith(self.RAW_PAD):
+            return self.serial.loads(data[len(self.RAW_PAD):]), True
+        if data.startswith(self.ZLIB_PAD):
+            start = time.clock()
+            data = zlib.decompress(data[len(self.ZLIB_PAD):])
+            self.stats['decompressed'] += 1
+            self.stats['decompress_time'] += time.clock() - start
+            return self.serial.loads(data), True
+        return {}, False
 
     def loads(self, data):
         '''
         Decrypt and un-serialize a python object
         '''
-        data = self.decrypt(data)
-        # simple integrity check to verify that we got meaningful data
-        if not data.startswith(self.PICKLE_PAD):
-            return {}
-        return self.serial.loads(data[len(self.PICKLE_PAD):])
+        return self.loads_envelope(data)[0]
 
 
 class SAuth(Auth):
@@ -388,6 +619,7 @@ class SAuth(Auth):
     '''
     def __init__(self, opts):
         super(SAuth, self).__init__(opts)
+        self.grains_digest = False
         self.crypticle = self.__authenticate()
 
     def __authenticate(self):
@@ -398,11 +630,18 @@ class SAuth(Auth):
         revolving master aes key.
         '''
         creds = self.sign_in()
+        while creds == 'retry' and self.try_again:
+            time.sleep(self.busy_wait())
+            creds = self.sign_in()
         if creds == 'retry':
             log.error('Failed to authenticate with the master, verify this'\
                 + ' minion\'s public key has been accepted on the salt master')
             sys.exit(2)
-        return Crypticle(self.opts, creds['aes'])
+        self.grains_digest = creds['grains_digest']
+        return Crypticle(
+                self.opts,
+                creds['aes'],
+                peer_compress=creds['compress'])
 
     def gen_token(self, clear_tok):
         '''
@@ -584,7 +584,8 @@ class RemoteClient(Client):
                             'aes',
                             self.auth.crypticle.dumps(load),
                             3,
-                            60)
+                            60,
+                            cmd=load['cmd'])
                         )
             except SaltReqTimeoutError:
                 return ''
@@ -618,7 +619,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -635,7 +637,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -652,7 +655,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -685,7 +689,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -702,7 +707,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -718,7 +724,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -737,7 +744,8 @@ class RemoteClient(Client):
                         'aes',
                         self.auth.crypticle.dumps(load),
                         3,
-                        60)
+                        60,
+                        cmd=load['cmd'])
                     )
         except SaltReqTimeoutError:
             return ''
@@ -51,10 +51,13 @@ def _create_loader(
             ext_type_types.extend(opts[ext_type_dirs])
 
     module_dirs = ext_type_types + [ext_types, sys_types]
-    _generate_module('{0}.int'.format(loaded_base_name))
-    _generate_module('{0}.int.{1}'.format(loaded_base_name, tag))
-    _generate_module('{0}.ext'.format(loaded_base_name))
-    _generate_module('{0}.ext.{1}'.format(loaded_base_name, tag))
+    # The modules can be loaded under another base name to keep them apart
+    # from the modules of the other loaders of the process
+    base_name = opts.get('loaded_base_name', loaded_base_name)
+    _generate_module('{0}.int'.format(base_name))
+    _generate_module('{0}.int.{1}'.format(base_name, tag))
+    _generate_module('{0}.ext'.format(base_name))
+    _generate_module('{0}.ext.{1}'.format(base_name, tag))
     return Loader(module_dirs, opts, tag)
 
 
@@ -224,6 +227,7 @@ class Loader(object):
         if '_' in tag:
             raise LoaderError('Cannot tag loader with an "_"')
         self.tag = tag
+        self.loaded_base_name = opts.get('loaded_base_name', loaded_base_name)
         if 'grains' in opts:
             self.grains = opts['grains']
         else:
@@ -325,7 +329,7 @@ class Loader(object):
                 fn_, path, desc = imp.find_module(name, self.module_dirs)
                 mod = imp.load_module(
                     '{0}.{1}.{2}.{3}'.format(
-                        loaded_base_name, _mod_type(path), self.tag, name
+                        self.loaded_base_name, _mod_type(path), self.tag, name
                     ), fn_, path, desc
                 )
         except ImportError as exc:
@@ -423,7 +427,7 @@ class Loader(object):
                     # cython_enabled is True. Continue...
                     mod = pyximport.load_module(
                         '{0}.{1}.{2}.{3}'.format(
-                            loaded_base_name,
+                            self.loaded_base_name,
                             _mod_type(names[name]),
                             self.tag,
                             name
@@ -433,7 +437,10 @@ class Loader(object):
                     fn_, path, desc = imp.find_module(name, self.module_dirs)
                     mod = imp.load_module(
                         '{0}.{1}.{2}.{3}'.format(
-                            loaded_base_name, _mod_type(path), self.tag, name
+                            self.loaded_base_name,
+                            _mod_type(path),
+                            self.tag,
+                            name
                         ), fn_, path, desc
                     )
                     # reload all submodules if necessary
@@ -446,7 +453,8 @@ class Loader(object):
                     # removed during sync_modules)
                     for submodule in submodules:
                         try:
-                            smname = '{0}.{1}.{2}'.format(loaded_base_name, self.tag, name)
+                            smname = '{0}.{1}.{2}'.format(
+                                self.loaded_base_name, self.tag, name)
                             smfile = os.path.splitext(submodule.__file__)[0] + ".py"
                             if submodule.__name__.startswith(smname) and os.path.isfile(smfile):
                                 reload(submodule)
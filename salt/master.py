@@ -10,12 +10,12 @@ import time
 import errno
 import fnmatch
 import signal
-import shutil
 import stat
 import logging
 import hashlib
 import tempfile
-import datetime
+import threading
+import Queue
 import pwd
 import getpass
 import resource
@@ -40,10 +40,12 @@ import salt.pillar
 import salt.state
 import salt.runner
 import salt.auth
-import salt.utils.atomicfile
 import salt.utils.event
 import salt.utils.verify
 import salt.utils.minions
+import salt.utils.stats
+import salt.utils.jobcache
+from salt._compat import string_types
 from salt.utils.debug import enable_sigusr1_handler
 
 
@@ -162,24 +164,25 @@ class Master(SMaster):
         '''
         if self.opts['keep_jobs'] == 0:
             return
-        jid_root = os.path.join(self.opts['cachedir'], 'jobs')
+        job_cache = salt.utils.jobcache.get_job_cache(self.opts)
+        stats = salt.utils.stats.Stats(self.opts, 'job_cache')
         while True:
-            cur = "{0:%Y%m%d%H}".format(datetime.datetime.now())
-
-            for top in os.listdir(jid_root):
-                t_path = os.path.join(jid_root, top)
-                for final in os.listdir(t_path):
-                    f_path = os.path.join(t_path, final)
-                    jid_file = os.path.join(f_path, 'jid')
-                    if not os.path.isfile(jid_file):
-                        continue
-                    with open(jid_file, 'r') as fn_:
-                        jid = fn_.read()
-                    if len(jid) < 18:
-                        # Invalid jid, scrub the dir
-                        shutil.rmtree(f_path)
-                    elif int(cur) - int(jid[:10]) > self.opts['keep_jobs']:
-                        shutil.rmtree(f_path)
+            start = time.time()
+            removed = job_cache.clean_old_jobs()
+            duration = time.time() - start
+            stats.inc('removed', removed)
+            stats.timing('clean', duration)
+            stats.flush(True)
+            if removed:
+                log.info(
+                    'Removed {0} old jobs from the job cache in {1:.3f} '
+                    'seconds'.format(removed, duration)
+                )
+            else:
+                log.debug(
+                    'Checked the job cache for old jobs in {0:.3f} '
+                    'seconds'.format(duration)
+                )
             try:
                 time.sleep(60)
             except KeyboardInterrupt:
@@ -278,22 +281,141 @@ class Publisher(multiprocessing.Process):
     def __init__(self, opts):
         super(Publisher, self).__init__()
         self.opts = opts
+        # The topics at least one peer subscribed to, zeromq only forwards
+        # the first subscription and the last unsubscription of a topic
+        self.topics = set()
+        self.xpub = False
+        # Set when the publish socket reports full peers instead of dropping
+        # publications silently
+        self.nodrop = False
+        self.stats = None
+        self.last_drops = 0
+
+    def _pub_socket(self, context):
+        '''
+        Return a new publish socket. An XPUB socket is used when zeromq
+        provides it, so that subscriptions can be tracked and publications
+        which a peer has no room for are reported instead of dropped
+        silently.
+        '''
+        xpub = hasattr(zmq, 'XPUB')
+        self.xpub = xpub
+        pub_sock = context.socket(zmq.XPUB if xpub else zmq.PUB)
+        # if 2.1 >= zmq < 3.0, we only have one HWM setting
+        try:
+            pub_sock.setsockopt(zmq.HWM, self.opts['pub_hwm'])
+        # in zmq >= 3.0, there are separate send and receive HWM settings
+        except AttributeError:
+            pub_sock.setsockopt(zmq.SNDHWM, self.opts['pub_hwm'])
+            pub_sock.setsockopt(zmq.RCVHWM, self.opts['pub_hwm'])
+        self.nodrop = False
+        # zeromq reports every peer as full when the hwm is 1
+        if xpub and hasattr(zmq, 'XPUB_NODROP') and self.opts['pub_hwm'] > 1:
+            try:
+                pub_sock.setsockopt(zmq.XPUB_NODROP, 1)
+                self.nodrop = True
+            except zmq.ZMQError:
+                # The zeromq library is older than the python bindings
+                pass
+        self.topics = set()
+        return pub_sock
+
+    def _subscription(self, msg):
+        '''
+        Track a subscription message received on the XPUB socket
+        '''
+        topic = msg[1:]
+        if msg[:1] == '\x01':
+            self.topics.add(topic)
+        else:
+            self.topics.discard(topic)
+        self.stats.gauge('topics', len(self.topics))
+
+    def _drain_subscriptions(self, pub_sock):
+        '''
+        Track all of the subscription messages waiting on the XPUB socket, so
+        that no publication is held back for a minion whose subscription is
+        still queued
+        '''
+        if not self.xpub:
+            return
+        while True:
+            try:
+                msg = pub_sock.recv(zmq.NOBLOCK)
+            except zmq.ZMQError as exc:
+                if exc.errno == errno.EAGAIN:
+                    return
+                raise exc
+            self._subscription(msg)
+
+    def _publish(self, pub_sock, frames, topic=None):
+        '''
+        Send a publication. A topic is passed when the publication is only
+        for the minion subscribed to it, when no peer has subscribed to the
+        topic the minion is not connected.
+        '''
+        if topic is not None \
+                and topic != salt.payload.BROADCAST_TOPIC \
+                and self.nodrop \
+                and topic not in self.topics:
+            self.stats.inc('unsubscribed')
+            self.stats.inc('unsubscribed:{0}'.format(topic))
+            return
+        if not self.nodrop:
+            pub_sock.send_multipart(frames)
+            self.stats.inc('sent')
+            return
+        try:
+            pub_sock.send_multipart(frames, zmq.NOBLOCK)
+            self.stats.inc('sent')
+            return
+        except zmq.ZMQError as exc:
+            if exc.errno != errno.EAGAIN:
+                raise exc
+        # A peer which should receive the publication has reached pub_hwm
+        if topic is None:
+            topic = salt.payload.BROADCAST_TOPIC
+        self.stats.inc('dropped')
+        self.stats.inc('dropped:{0}'.format(topic))
+        if topic == salt.payload.BROADCAST_TOPIC:
+            # Deliver to the peers which are not backed up
+            pub_sock.setsockopt(zmq.XPUB_NODROP, 0)
+            try:
+                pub_sock.send_multipart(frames, zmq.NOBLOCK)
+            finally:
+                pub_sock.setsockopt(zmq.XPUB_NODROP, 1)
+
+    def _flush_stats(self):
+        '''
+        Write the publisher stats and fire an event when publications have
+        been dropped since the last event, no more than one event is fired
+        per stats interval
+        '''
+        if not self.stats.flush():
+            return
+        drops = self.stats.counters.get('dropped', 0)
+        if drops > self.last_drops:
+            log.warning(
+                '{0} publications were dropped, the peers reached the '
+                'pub_hwm of {1}'.format(
+                    drops - self.last_drops, self.opts['pub_hwm']))
+            event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
+            event.fire_event(
+                {'dropped': drops - self.last_drops,
+                 'counters': self.stats.counters},
+                'publisher_drop')
+            self.last_drops = drops
 
     def run(self):
         '''
         Bind to the interface specified in the configuration file
         '''
+        serial = salt.payload.Serial(self.opts)
+        self.stats = salt.utils.stats.Stats(self.opts, 'publisher')
         # Set up the context
         context = zmq.Context(1)
         # Prepare minion publish socket
-        pub_sock = context.socket(zmq.PUB)
-        # if 2.1 >= zmq < 3.0, we only have one HWM setting
-        try:
-            pub_sock.setsockopt(zmq.HWM, 1)
-        # in zmq >= 3.0, there are separate send and receive HWM settings
-        except AttributeError:
-            pub_sock.setsockopt(zmq.SNDHWM, 1)
-            pub_sock.setsockopt(zmq.RCVHWM, 1)
+        pub_sock = self._pub_socket(context)
         pub_uri = 'tcp://{interface}:{publish_port}'.format(**self.opts)
         # Prepare minion pull socket
         pull_sock = context.socket(zmq.PULL)
@@ -310,27 +432,43 @@ class Publisher(multiprocessing.Process):
                     'publish_pull.ipc'),
                 448
                 )
+        poller = zmq.Poller()
+        poller.register(pull_sock, zmq.POLLIN)
+        poller.register(pub_sock, zmq.POLLIN)
 
         try:
             while True:
                 # Catch and handle EINTR from when this process is sent
                 # SIGUSR1 gracefully so we don't choke and die horribly
                 try:
+                    socks = dict(poller.poll(1000))
+                    if socks.get(pull_sock) != zmq.POLLIN:
+                        self._drain_subscriptions(pub_sock)
+                        self._flush_stats()
+                        continue
                     package = pull_sock.recv()
-                    pub_sock.send(package)
+                    self._drain_subscriptions(pub_sock)
+                    if self.opts['zmq_filtering']:
+                        # Send the publication once on each topic, zeromq
+                        # only delivers it to the minions subscribed to them
+                        unpacked = serial.loads(package)
+                        for topic in unpacked['topic_lst']:
+                            self._publish(
+                                    pub_sock,
+                                    [topic, unpacked['payload']],
+                                    topic)
+                    else:
+                        self._publish(pub_sock, [package])
+                    self._flush_stats()
                 except zmq.ZMQError as exc:
                     if exc.errno == errno.EINTR:
                         continue
                     raise exc
                 if self.opts['pub_refresh']:
+                    poller.unregister(pub_sock)
                     pub_sock.close()
                     #time.sleep(0.5)
-                    pub_sock = context.socket(zmq.PUB)
-                    try:
-                        pub_sock.setsockopt(zmq.HWM, 1)
-                    except AttributeError:
-                        pub_sock.setsockopt(zmq.SNDHWM, 1)
-                        pub_sock.setsockopt(zmq.RCVHWM, 1)
+                    pub_sock = self._pub_socket(context)
                     con = False
                     while not con:
                         time.sleep(0.1)
@@ -339,20 +477,158 @@ class Publisher(multiprocessing.Process):
                             con = True
                         except zmq.ZMQError:
                             pass
+                    poller.register(pub_sock, zmq.POLLIN)
 
         except KeyboardInterrupt:
             pub_sock.close()
             pull_sock.close()
 
 
+class PubChannel(object):
+    '''
+    A long lived connection from a master worker to the Publisher pull
+    socket. The connection is made lazily and is rebuilt if a publication
+    cannot be handed to the Publisher.
+    '''
+    # Seconds to wait for the Publisher to accept a publication
+    send_timeout = 5
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.serial = salt.payload.Serial(opts)
+        self.uri = 'ipc://{0}'.format(
+            os.path.join(self.opts['sock_dir'], 'publish_pull.ipc')
+            )
+        self.pid = None
+        self.context = None
+        self.socket = None
+        self.stats = {'count': 0,
+                      'failed': 0,
+                      'reconnects': 0,
+                      'latency_total': 0.0,
+                      'latency_max': 0.0}
+
+    def connect(self):
+        '''
+        Connect the push socket to the Publisher
+        '''
+        if self.pid != os.getpid():
+            # Never reuse a context inherited from the parent process
+            self.pid = os.getpid()
+            self.context = zmq.Context(1)
+            self.socket = None
+        if self.socket is None:
+            self.socket = self.context.socket(zmq.PUSH)
+            self.socket.linger = 0
+            self.socket.connect(self.uri)
+        return self.socket
+
+    def close(self):
+        '''
+        Drop the current connection, the next publication will reconnect
+        '''
+        if self.socket is not None and self.pid == os.getpid():
+            self.socket.close()
+        self.socket = None
+
+    def topics(self, tgt, tgt_type):
+        '''
+        Return the publisher topics which reach the minions named by the
+        target, None is returned when the target can only be evaluated by
+        the minions
+        '''
+        if not self.opts['zmq_filtering'] or self.opts['order_masters']:
+            # A syndic needs to see every publication
+            return None
+        if tgt_type == 'list':
+            if isinstance(tgt, string_types):
+                tgt = tgt.split(',')
+            ids = tgt
+        elif tgt_type == 'glob' and isinstance(tgt, string_types) \
+                and not set('*?[') & set(tgt):
+            # A glob without wildcards names a single minion
+            ids = [tgt]
+        else:
+            return None
+        return [salt.payload.minion_topic(id_) for id_ in ids]
+
+    def send(self, payload, topic_lst=None):
+        '''
+        Serialize the payload and hand it to the Publisher, returns True if
+        the Publisher accepted the publication. When zmq_filtering is enabled
+        the publication is only sent on the topics in topic_lst, or to every
+        minion if topic_lst is None.
+        '''
+        start = time.time()
+        package = self.serial.dumps(payload)
+        if self.opts['zmq_filtering']:
+            if topic_lst is None:
+                topic_lst = [salt.payload.BROADCAST_TOPIC]
+            package = self.serial.dumps({'payload': package,
+                                         'topic_lst': topic_lst})
+        sent = False
+        for attempt in range(2):
+            socket = self.connect()
+            poller = zmq.Poller()
+            poller.register(socket, zmq.POLLOUT)
+            try:
+                if poller.poll(self.send_timeout * 1000):
+                    socket.send(package, zmq.NOBLOCK)
+                    sent = True
+            except zmq.ZMQError as exc:
+                log.warning(
+                    'Failed to send publication to the Publisher: {0}'.format(
+                        exc
+                    )
+                )
+            poller.unregister(socket)
+            if sent:
+                break
+            # The Publisher did not take the publication, start over on a
+            # fresh connection
+            self.close()
+            self.stats['reconnects'] += 1
+        latency = time.time() - start
+        if not sent:
+            self.stats['failed'] += 1
+            log.error(
+                'The Publisher did not accept the publication within {0} '
+                'seconds, is the salt-master Publisher running?'.format(
+                    self.send_timeout * 2
+                )
+            )
+            return False
+        self.stats['count'] += 1
+        self.stats['latency_total'] += latency
+        if latency > self.stats['latency_max']:
+            self.stats['latency_max'] = latency
+        log.debug(
+            'Publication enqueued in {0:.6f} seconds, average {1:.6f} seconds '
+            'over {2} publications'.format(
+                latency,
+                self.stats['latency_total'] / self.stats['count'],
+                self.stats['count']
+            )
+        )
+        return True
+
+
 class ReqServer(object):
     '''
     Starts up the master request server, minions send results to this
     interface.
     '''
+    # The bounds of the retry time given to minions which are turned away
+    # while the authentication queue is full
+    try_again_min = 1
+    try_again_max = 60
+    # Requests without a reply after this many seconds are considered lost
+    pending_timeout = 120
+
     def __init__(self, opts, crypticle, key, mkey):
         self.opts = opts
         self.master_key = mkey
+        self.serial = salt.payload.Serial(opts)
         self.context = zmq.Context(self.opts['worker_threads'])
         # Prepare the zeromq sockets
         self.uri = 'tcp://{interface}:{ret_port}'.format(**self.opts)
@@ -361,6 +637,24 @@ class ReqServer(object):
         self.w_uri = 'ipc://{0}'.format(
             os.path.join(self.opts['sock_dir'], 'workers.ipc')
             )
+        self.auth_workers = self.context.socket(zmq.DEALER)
+        self.a_uri = 'ipc://{0}'.format(
+            os.path.join(self.opts['sock_dir'], 'auth_workers.ipc')
+            )
+        # The named worker pools and the commands routed to each of them, the
+        # other commands go to the workers
+        self.pools = {}
+        self.routes = {}
+        for name, pool in (self.opts.get('worker_pools') or {}).items():
+            if name in ('workers', 'auth_workers'):
+                log.error(
+                    'The worker pool name {0} is reserved, the pool is '
+                    'ignored'.format(name)
+                )
+                continue
+            self.pools[name] = self.context.socket(zmq.DEALER)
+            for cmd in pool.get('commands', []):
+                self.routes[cmd] = name
         # Prepare the AES key
         self.key = key
         self.crypticle = crypticle
@@ -377,7 +671,28 @@ class ReqServer(object):
             self.work_procs.append(MWorker(self.opts,
                     self.master_key,
                     self.key,
-                    self.crypticle))
+                    self.crypticle,
+                    ind=ind))
+
+        # Authentication is handled by its own workers so that an
+        # authentication storm does not hold up the returns
+        for ind in range(int(self.opts['auth_workers'])):
+            self.work_procs.append(MWorker(self.opts,
+                    self.master_key,
+                    self.key,
+                    self.crypticle,
+                    'auth_workers',
+                    ind))
+
+        for name in self.pools:
+            workers = self.opts['worker_pools'][name].get('workers', 1)
+            for ind in range(int(workers)):
+                self.work_procs.append(MWorker(self.opts,
+                        self.master_key,
+                        self.key,
+                        self.crypticle,
+                        name,
+                        ind))
 
         for ind, proc in enumerate(self.work_procs):
             log.info('Starting Salt worker process {0}'.format(ind))
@@ -385,13 +700,158 @@ class ReqServer(object):
 
         self.workers.bind(self.w_uri)
 
+        if not self.opts['auth_workers'] and not self.pools:
+            while True:
+                try:
+                    zmq.device(zmq.QUEUE, self.clients, self.workers)
+                except zmq.ZMQError as exc:
+                    if exc.errno == errno.EINTR:
+                        continue
+                    raise exc
+
+        self.auth_workers.bind(self.a_uri)
+        for name, socket in self.pools.items():
+            socket.bind(self._pool_uri(name))
+        self.__route()
+
+    def _pool_uri(self, name):
+        '''
+        Return the uri the workers of the named pool connect to
+        '''
+        return 'ipc://{0}'.format(
+            os.path.join(self.opts['sock_dir'], '{0}.ipc'.format(name))
+            )
+
+    def _command(self, package):
+        '''
+        Return the name of the command in the serialized request. Unless
+        worker pools are configured only the small requests which can be
+        authentication requests are deserialized.
+        '''
+        if not self.routes and (len(package) > 8192 or '_auth' not in package):
+            return None
+        try:
+            payload = self.serial.loads(package)
+        except Exception:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        if payload.get('enc') != 'clear':
+            # Minions name the command of an encrypted load in the clear
+            return payload.get('cmd')
+        load = payload.get('load')
+        if not isinstance(load, dict):
+            return None
+        return load.get('cmd')
+
+    @staticmethod
+    def _expire(pending, stats, key, timeout):
+        '''
+        Forget the requests which will never be answered
+        '''
+        cutoff = time.time() - timeout
+        for envelope, start in list(pending.items()):
+            if start < cutoff:
+                stats.inc(key)
+                del pending[envelope]
+
+    def _try_again(self, stats, depth):
+        '''
+        Return the number of seconds a minion should wait before it tries to
+        authenticate again, based on the time it will take to drain the
+        authentication queue
+        '''
+        drain = depth * stats.average('latency') / max(
+                int(self.opts['auth_workers']), 1)
+        return int(min(max(drain, self.try_again_min), self.try_again_max))
+
+    def __route(self):
+        '''
+        Pass requests from the minions to the workers. Authentication requests
+        go to the authentication workers, when too many of them are waiting
+        the minion is told to try again later. The commands of the worker
+        pools go to the workers of the pool.
+        '''
+        stats = salt.utils.stats.Stats(self.opts, 'auth')
+        pool_stats = salt.utils.stats.Stats(self.opts, 'pools')
+        # The time each forwarded authentication request was received, keyed
+        # by the routing envelope of the request
+        pending = {}
+        pools = [('workers', self.workers)] + sorted(self.pools.items())
+        pool_pending = dict((name, {}) for name, socket in pools)
+        poller = zmq.Poller()
+        poller.register(self.clients, zmq.POLLIN)
+        poller.register(self.auth_workers, zmq.POLLIN)
+        for name, socket in pools:
+            poller.register(socket, zmq.POLLIN)
         while True:
             try:
-                zmq.device(zmq.QUEUE, self.clients, self.workers)
+                socks = dict(poller.poll(1000))
             except zmq.ZMQError as exc:
                 if exc.errno == errno.EINTR:
                     continue
                 raise exc
+            if socks.get(self.clients) == zmq.POLLIN:
+                frames = self.clients.recv_multipart()
+                cmd = self._command(frames[-1])
+                if cmd != '_auth' or not self.opts['auth_workers']:
+                    name = self.routes.get(cmd, 'workers')
+                    pool_stats.inc('{0}:requests'.format(name))
+                    pool_pending[name][tuple(frames[:-1])] = time.time()
+                    self.pools.get(name, self.workers).send_multipart(frames)
+                elif len(pending) >= self.opts['auth_queue_size']:
+                    # Old minions treat this as a key waiting for acceptance
+                    # and retry after their acceptance_wait_time
+                    stats.inc('refused')
+                    frames[-1] = self.serial.dumps(
+                            {'enc': 'clear',
+                             'load': {'ret': True,
+                                      'try_again': self._try_again(
+                                          stats,
+                                          len(pending))}})
+                    self.clients.send_multipart(frames)
+                else:
+                    stats.inc('admitted')
+                    pending[tuple(frames[:-1])] = time.time()
+                    self.auth_workers.send_multipart(frames)
+            for name, socket in pools:
+                if socks.get(socket) == zmq.POLLIN:
+                    frames = socket.recv_multipart()
+                    start = pool_pending[name].pop(tuple(frames[:-1]), None)
+                    if start is not None:
+                        pool_stats.timing(
+                                '{0}:latency'.format(name),
+                                time.time() - start)
+                    self.clients.send_multipart(frames)
+            if socks.get(self.auth_workers) == zmq.POLLIN:
+                frames = self.auth_workers.recv_multipart()
+                start = pending.pop(tuple(frames[:-1]), None)
+                if start is not None:
+                    stats.timing('latency', time.time() - start)
+                self.clients.send_multipart(frames)
+            stats.gauge('queue_depth', len(pending))
+            for name, socket in pools:
+                pool_stats.gauge(
+                        '{0}:queue_depth'.format(name),
+                        len(pool_pending[name]))
+            if pool_stats.flush():
+                for name, socket in pools:
+                    self._expire(
+                            pool_pending[name],
+                            pool_stats,
+                            '{0}:lost'.format(name),
+                            self.pending_timeout)
+            if stats.flush():
+                # Forget requests which will never be answered so that they
+                # do not hold places in the queue
+                self._expire(pending, stats, 'lost', self.pending_timeout)
+                log.debug(
+                    'Authentication queue depth {0}, average latency '
+                    '{1:.3f} seconds'.format(
+                        len(pending),
+                        stats.average('latency')
+                    )
+                )
 
     def start_publisher(self):
         '''
@@ -421,17 +881,48 @@ class MWorker(multiprocessing.Process):
     The worker multiprocess instance to manage the backend operations for the
     salt master.
     '''
+    # The aes commands which can take a long time, in the async worker_mode
+    # they are run in the worker thread pool while the other commands are
+    # answered as soon as they are received
+    blocking_cmds = set([
+        '_ext_nodes',
+        '_file_hash',
+        '_file_list',
+        '_file_list_emptydirs',
+        '_serve_file',
+        '_pillar',
+        '_master_state',
+        'minion_runner',
+        'minion_publish',
+        ])
+
     def __init__(self,
             opts,
             mkey,
             key,
-            crypticle):
+            crypticle,
+            pool='workers',
+            ind=0):
         multiprocessing.Process.__init__(self)
         self.opts = opts
         self.serial = salt.payload.Serial(opts)
         self.crypticle = crypticle
         self.mkey = mkey
         self.key = key
+        # The name of the worker pool, the worker connects to the socket of
+        # the same name
+        self.pool = pool
+        self.w_uri = 'ipc://{0}'.format(
+            os.path.join(self.opts['sock_dir'], '{0}.ipc'.format(self.pool))
+            )
+        # The socket the worker threads hand their replies back on
+        self.done_uri = 'inproc://mworker_done'
+        self.stats = salt.utils.stats.Stats(
+                self.opts,
+                'mworker_{0}_{1}'.format(self.pool, ind))
+        # The compiled pillar is shared by the threads of the worker
+        self.pillar_cache = salt.pillar.PillarCache(self.opts, self.stats)
+        self.last_event = 0
 
     def __bind(self):
         '''
@@ -439,19 +930,62 @@ class MWorker(multiprocessing.Process):
         '''
         context = zmq.Context(1)
         socket = context.socket(zmq.REP)
-        w_uri = 'ipc://{0}'.format(
-            os.path.join(self.opts['sock_dir'], 'workers.ipc')
-            )
-        log.info('Worker binding to socket {0}'.format(w_uri))
+        log.info('Worker binding to socket {0}'.format(self.w_uri))
         try:
-            socket.connect(w_uri)
+            socket.connect(self.w_uri)
 
             while True:
                 try:
                     package = socket.recv()
                     payload = self.serial.loads(package)
-                    ret = self.serial.dumps(self._handle_payload(payload))
+                    ret = self.serial.dumps(
+                            self._handle_payload(payload, len(package)))
                     socket.send(ret)
+                    self._flush_stats()
+                # Properly handle EINTR from SIGUSR1
+                except zmq.ZMQError as exc:
+                    if exc.errno == errno.EINTR:
+                        continue
+                    raise exc
+        except KeyboardInterrupt:
+            socket.close()
+
+    def __bind_async(self):
+        '''
+        Connect to the local port with a DEALER socket so that many requests
+        can be in flight at once. Requests which can block are run in the
+        worker thread pool, the replies are sent as they become ready.
+        '''
+        context = zmq.Context(1)
+        socket = context.socket(zmq.DEALER)
+        done = context.socket(zmq.PULL)
+        done.bind(self.done_uri)
+        jobs = Queue.Queue()
+        for ind in range(int(self.opts['worker_async_threads'])):
+            thread = threading.Thread(
+                    target=self._pool_thread,
+                    args=(context, jobs))
+            thread.daemon = True
+            thread.start()
+        log.info('Worker binding to socket {0}'.format(self.w_uri))
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        poller.register(done, zmq.POLLIN)
+        try:
+            socket.connect(self.w_uri)
+
+            while True:
+                try:
+                    socks = dict(poller.poll())
+                    if socks.get(done) == zmq.POLLIN:
+                        socket.send_multipart(done.recv_multipart())
+                    if socks.get(socket) == zmq.POLLIN:
+                        frames = socket.recv_multipart()
+                        ret = self._dispatch(frames[:-1], frames[-1], jobs)
+                        if ret is not None:
+                            socket.send_multipart(
+                                    frames[:-1] + [self.serial.dumps(ret)])
+                    self._flush_stats()
                 # Properly handle EINTR from SIGUSR1
                 except zmq.ZMQError as exc:
                     if exc.errno == errno.EINTR:
@@ -459,8 +993,67 @@ class MWorker(multiprocessing.Process):
                     raise exc
         except KeyboardInterrupt:
             socket.close()
+            done.close()
 
-    def _handle_payload(self, payload):
+    def _dispatch(self, envelope, package, jobs):
+        '''
+        Handle a request in the async worker_mode, returns the reply or None
+        when the request has been passed to the worker thread pool
+        '''
+        payload = self.serial.loads(package)
+        try:
+            key = payload['enc']
+            load = payload['load']
+        except KeyError:
+            return ''
+        if key == 'clear':
+            log.info(
+                'Clear payload received with command {cmd}'.format(**load)
+            )
+            jobs.put((envelope, key, load, False, len(package)))
+            return None
+        if key != 'aes':
+            return self._handle_payload(payload)
+        data, compress = self._decode_aes(load)
+        if data is None:
+            return compress
+        if data['cmd'] in self.blocking_cmds:
+            jobs.put((envelope, key, data, compress, len(load)))
+            return None
+        return self.aes_funcs.run_func(
+                data['cmd'],
+                data,
+                compress,
+                len(load))
+
+    def _pool_thread(self, context, jobs):
+        '''
+        Run the requests passed to the worker thread pool, every thread has
+        its own ClearFuncs and AESFuncs
+        '''
+        clear_funcs, aes_funcs = self._make_funcs()
+        done = context.socket(zmq.PUSH)
+        done.connect(self.done_uri)
+        while True:
+            envelope, key, load, compress, size = jobs.get()
+            try:
+                if key == 'aes':
+                    ret = aes_funcs.run_func(
+                            load['cmd'],
+                            load,
+                            compress,
+                            size)
+                else:
+                    ret = self._run_clear(clear_funcs, load, size)
+            except Exception as exc:
+                log.error(
+                    'Failed to run command {0}: {1}'.format(load['cmd'], exc),
+                    exc_info=True
+                )
+                ret = ''
+            done.send_multipart(envelope + [self.serial.dumps(ret)])
+
+    def _handle_payload(self, payload, size=0):
         '''
         The _handle_payload method is the key method used to figure out what
         needs to be done with communication to the server
@@ -471,16 +1064,54 @@ class MWorker(multiprocessing.Process):
             load = payload['load']
         except KeyError:
             return ''
+        if key == 'clear':
+            return self._handle_clear(load, size)
         return {'aes': self._handle_aes,
-                'pub': self._handle_pub,
-                'clear': self._handle_clear}[key](load)
+                'pub': self._handle_pub}[key](load)
 
-    def _handle_clear(self, load):
+    def _handle_clear(self, load, size=0):
         '''
         Take care of a cleartext command
         '''
         log.info('Clear payload received with command {cmd}'.format(**load))
-        return getattr(self.clear_funcs, load['cmd'])(load)
+        return self._run_clear(self.clear_funcs, load, size)
+
+    def _run_clear(self, clear_funcs, load, size=0):
+        '''
+        Run a cleartext command and record it in the worker stats
+        '''
+        cmd = load['cmd']
+        if not hasattr(clear_funcs, cmd):
+            cmd = 'unavailable'
+        start = time.time()
+        try:
+            ret = getattr(clear_funcs, load['cmd'])(load)
+        except Exception:
+            self.stats.request(
+                    'clear:{0}'.format(cmd),
+                    time.time() - start,
+                    size,
+                    error=True)
+            raise
+        self.stats.request('clear:{0}'.format(cmd), time.time() - start, size)
+        return ret
+
+    def _flush_stats(self):
+        '''
+        Write the worker stats, the figures are also fired on the master
+        event bus every master_stats_event_interval seconds when
+        master_stats_event is set
+        '''
+        if not self.stats.flush():
+            return
+        if not self.opts.get('master_stats_event'):
+            return
+        now = time.time()
+        if now - self.last_event < self.opts['master_stats_event_interval']:
+            return
+        self.last_event = now
+        event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
+        event.fire_event(self.stats.snapshot(), 'master_stats')
 
     def _handle_pub(self, load):
         '''
@@ -488,31 +1119,64 @@ class MWorker(multiprocessing.Process):
         '''
         log.info('Pubkey payload received with command {cmd}'.format(**load))
 
-    def _handle_aes(self, load):
+    def _decode_aes(self, load):
         '''
-        Handle a command sent via an aes key
+        Decrypt an aes load, returns the command data and whether the minion
+        supports compressed payloads. If the load cannot be used the data is
+        None and the reply for the minion is returned in the second place.
         '''
         try:
-            data = self.crypticle.loads(load)
+            data, compress = self.crypticle.loads_envelope(load)
         except Exception:
-            return ''
+            return None, ''
         if 'cmd' not in data:
             log.error('Received malformed command {0}'.format(data))
-            return {}
+            return None, {}
         log.info('AES payload received with command {0}'.format(data['cmd']))
-        return self.aes_funcs.run_func(data['cmd'], data)
+        return data, compress
 
-    def run(self):
+    def _handle_aes(self, load):
         '''
-        Start a Master Worker
+        Handle a command sent via an aes key
         '''
-        self.clear_funcs = ClearFuncs(
+        data, compress = self._decode_aes(load)
+        if data is None:
+            return compress
+        return self.aes_funcs.run_func(
+                data['cmd'],
+                data,
+                compress,
+                len(load))
+
+    def _make_funcs(self):
+        '''
+        Return a ClearFuncs and an AESFuncs object which share a connection
+        to the Publisher
+        '''
+        pub_channel = PubChannel(self.opts)
+        clear_funcs = ClearFuncs(
                 self.opts,
                 self.key,
                 self.mkey,
-                self.crypticle)
-        self.aes_funcs = AESFuncs(self.opts, self.crypticle)
-        self.__bind()
+                self.crypticle,
+                pub_channel)
+        aes_funcs = AESFuncs(
+                self.opts,
+                self.crypticle,
+                pub_channel,
+                self.stats,
+                self.pillar_cache)
+        return clear_funcs, aes_funcs
+
+    def run(self):
+        '''
+        Start a Master Worker
+        '''
+        self.clear_funcs, self.aes_funcs = self._make_funcs()
+        if self.opts['worker_mode'] == 'async':
+            self.__bind_async()
+        else:
+            self.__bind()
 
 
 class AESFuncs(object):
@@ -521,11 +1185,26 @@ class AESFuncs(object):
     '''
     # The AES Functions:
     #
-    def __init__(self, opts, crypticle):
+    def __init__(
+            self,
+            opts,
+            crypticle,
+            pub_channel=None,
+            stats=None,
+            pillar_cache=None):
         self.opts = opts
         self.event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
         self.serial = salt.payload.Serial(opts)
         self.crypticle = crypticle
+        if pub_channel is None:
+            pub_channel = PubChannel(opts)
+        self.pub_channel = pub_channel
+        # The per command figures of the worker
+        self.stats = stats
+        if pillar_cache is None:
+            pillar_cache = salt.pillar.PillarCache(opts, stats)
+        self.pillar_cache = pillar_cache
+        self.job_cache = salt.utils.jobcache.get_job_cache(opts)
         self.ckminions = salt.utils.minions.CkMinions(opts)
         # Create the tops dict for loading external top data
         self.tops = salt.loader.tops(self.opts)
@@ -729,25 +1408,28 @@ class AESFuncs(object):
         '''
         Return the pillar data for the minion
         '''
-        if 'id' not in load or 'grains' not in load or 'env' not in load:
+        if 'id' not in load or 'env' not in load:
             return False
-        pillar = salt.pillar.Pillar(
-                self.opts,
+        digest = None
+        if 'grains' not in load:
+            if 'grains_digest' not in load:
+                return False
+            digest = load['grains_digest']
+            load['grains'] = self.pillar_cache.get_grains(load['id'], digest)
+            if load['grains'] is None:
+                # The grains are unknown, the minion sends them in full
+                return False
+        data = self.pillar_cache.compile_pillar(
                 load['grains'],
                 load['id'],
-                load['env'])
-        data = pillar.compile_pillar()
+                load['env'],
+                digest)
         if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions', load['id'])
-            if not os.path.isdir(cdir):
-                os.makedirs(cdir)
-            datap = os.path.join(cdir, 'data.p')
-            with open(datap, 'w+') as fp_:
-                fp_.write(
-                        self.serial.dumps(
-                            {'grains': load['grains'],
-                             'pillar': data})
-                            )
+            salt.utils.minions.save_data(
+                    self.opts,
+                    load['id'],
+                    load['grains'],
+                    data)
         return data
 
     def _master_state(self, load):
@@ -782,54 +1464,43 @@ class AESFuncs(object):
             return False
         if load['jid'] == 'req':
         # The minion is returning a standalone job, request a jobid
-            load['jid'] = salt.utils.prep_jid(
-                    self.opts['cachedir'],
-                    self.opts['hash_type'])
+            load['jid'] = self.job_cache.prep_jid()
         log.info('Got return from {id} for job {jid}'.format(**load))
+        saved = True
+        if self.opts['job_cache']:
+            saved = self.__save_return(load)
+        # The return is fired once it is saved, clients which catch up from
+        # the job cache after subscribing can then not miss it. Returns which
+        # are not saved still reach the event bus.
         self.event.fire_event(load, load['jid'])
-        if not self.opts['job_cache']:
-            return
-        jid_dir = salt.utils.jid_dir(
-                load['jid'],
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        if not os.path.isdir(jid_dir):
+        if not saved:
+            return False
+
+    def __save_return(self, load):
+        '''
+        Store the return data in the job cache, return False if the return
+        was not saved
+        '''
+        if not self.job_cache.jid_exists(load['jid']):
             log.error(
                 'An inconsistency occurred, a job was received with a job id '
                 'that is not present on the master: {jid}'.format(**load)
             )
             return False
-        hn_dir = os.path.join(jid_dir, load['id'])
-        if not os.path.isdir(hn_dir):
-            os.makedirs(hn_dir)
-        # Otherwise the minion has already returned this jid and it should
-        # be dropped
-        else:
+        if not self.job_cache.save_return(
+                load['jid'],
+                load['id'],
+                load['return'],
+                load.get('out')):
+            # The minion has already returned this jid and it should be
+            # dropped
             log.error(
                     ('An extra return was detected from minion {0}, please'
                     ' verify the minion, this could be a replay'
                     ' attack').format(load['id'])
                     )
             return False
-
-        self.serial.dump(
-            load['return'],
-            # Use atomic open here to avoid the file being read before it's
-            # completely written to. Refs #1935
-            salt.utils.atomicfile.atomic_open(
-                os.path.join(hn_dir, 'return.p'), 'w+'
-            )
-        )
-        if 'out' in load:
-            self.serial.dump(
-                load['out'],
-                # Use atomic open here to avoid the file being read before
-                # it's completely written to. Refs #1935
-                salt.utils.atomicfile.atomic_open(
-                    os.path.join(hn_dir, 'out.p'), 'w+'
-                )
-            )
+        return True
 
     def _syndic_return(self, load):
         '''
@@ -840,21 +1511,14 @@ class AESFuncs(object):
         if 'return' not in load or 'jid' not in load or 'id' not in load:
             return None
         # set the write flag
-        jid_dir = salt.utils.jid_dir(
-                load['jid'],
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        if not os.path.isdir(jid_dir):
+        if not self.job_cache.jid_exists(load['jid']):
             log.error(
                 'An inconsistency occurred, a job was received with a job id '
                 'that is not present on the master: {jid}'.format(**load)
             )
             return False
-        wtag = os.path.join(jid_dir, 'wtag_{0}'.format(load['id']))
         try:
-            with open(wtag, 'w+') as fp_:
-                fp_.write('')
+            self.job_cache.add_wtag(load['jid'], load['id'])
         except (IOError, OSError):
             log.error(
                     ('Failed to commit the write tag for the syndic return,'
@@ -870,8 +1534,7 @@ class AESFuncs(object):
                    'id': key,
                    'return': item}
             self._return(ret)
-        if os.path.isfile(wtag):
-            os.remove(wtag)
+        self.job_cache.rm_wtag(load['jid'], load['id'])
 
     def minion_runner(self, clear_load):
         '''
@@ -976,10 +1639,7 @@ class AESFuncs(object):
         if not good:
             return {}
         # Set up the publication payload
-        jid = salt.utils.prep_jid(
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
+        jid = self.job_cache.prep_jid()
         load = {
                 'fun': clear_load['fun'],
                 'arg': clear_load['arg'],
@@ -989,18 +1649,7 @@ class AESFuncs(object):
                 'ret': clear_load['ret'],
                 'id': clear_load['id'],
                }
-        self.serial.dump(
-                load, open(
-                    os.path.join(
-                        salt.utils.jid_dir(
-                            jid,
-                            self.opts['cachedir'],
-                            self.opts['hash_type']
-                            ),
-                        '.load.p'
-                        ),
-                    'w+')
-                )
+        self.job_cache.save_load(jid, load)
         payload = {'enc': 'aes'}
         expr_form = 'glob'
         timeout = 5
@@ -1017,17 +1666,26 @@ class AESFuncs(object):
         if 'timeout' in clear_load:
             timeout = clear_load['timeout']
         # Encrypt!
-        payload['load'] = self.crypticle.dumps(load)
-        # Connect to the publisher
-        context = zmq.Context(1)
-        pub_sock = context.socket(zmq.PUSH)
-        pull_uri = 'ipc://{0}'.format(
-            os.path.join(self.opts['sock_dir'], 'publish_pull.ipc')
-            )
-        pub_sock.connect(pull_uri)
+        # Publications reach every minion, keep them in the envelope which
+        # old minions understand
+        payload['load'] = self.crypticle.dumps(load, False)
+        # Send the target in the clear so minions can skip the decryption
+        # of publications which are not for them
+        payload['tgt'] = load['tgt']
+        payload['tgt_type'] = load['tgt_type']
+        payload['sig'] = self.crypticle.sign_target(
+                payload['tgt'],
+                payload['tgt_type'],
+                payload['load'])
         log.info(('Publishing minion job: #{jid}, func: "{fun}", args:'
                   ' "{arg}", target: "{tgt}"').format(**load))
-        pub_sock.send(self.serial.dumps(payload))
+        if not self.pub_channel.send(
+                payload,
+                self.pub_channel.topics(load['tgt'], load['tgt_type'])):
+            log.error(
+                'The publication of minion job {0} was dropped'.format(
+                    load['jid']))
+            return {}
         # Run the client get_returns method based on the form data sent
         if 'form' in clear_load:
             ret_form = clear_load['form']
@@ -1054,26 +1712,49 @@ class AESFuncs(object):
             ret['__jid__'] = jid
             return ret
 
-    def run_func(self, func, load):
+    def run_func(self, func, load, compress=False, size=0):
         '''
-        Wrapper for running functions executed with AES encryption
+        Wrapper for running functions executed with AES encryption, the
+        return is compressed if the minion supports compressed payloads. The
+        size of the encrypted request is recorded in the stats.
         '''
         # Don't honor private functions
         if func.startswith('__'):
             return self.crypticle.dumps({})
+        start = time.time()
         # Run the func
         try:
             ret = getattr(self, func)(load)
         except AttributeError as exc:
             log.error(('Received function {0} which in unavailable on the '
                        'master, returning False').format(exc))
+            self._record('unavailable', start, size, error=True)
             return self.crypticle.dumps(False)
+        except Exception:
+            self._record(func, start, size, error=True)
+            raise
         # Don't encrypt the return value for the _return func
         # (we don't care about the return value, so why encrypt it?)
         if func == '_return':
+            self._record(func, start, size)
             return ret
         # AES Encrypt the return
-        return self.crypticle.dumps(ret)
+        ret = self.crypticle.dumps(ret, compress)
+        self._record(func, start, size, len(ret))
+        return ret
+
+    def _record(self, func, start, size_in, size_out=0, error=False):
+        '''
+        Record the handled request in the worker stats
+        '''
+        if self.stats is None:
+            return
+        self.stats.request(
+                'aes:{0}'.format(func),
+                time.time() - start,
+                size_in,
+                size_out,
+                error)
 
 
 class ClearFuncs(object):
@@ -1085,12 +1766,26 @@ class ClearFuncs(object):
     # the clear:
     # publish (The publish from the LocalClient)
     # _auth
-    def __init__(self, opts, key, master_key, crypticle):
+    #
+    # Seconds between the checks of the max open files in _auth
+    mof_check_interval = 60
+
+    def __init__(self, opts, key, master_key, crypticle, pub_channel=None):
         self.opts = opts
         self.serial = salt.payload.Serial(opts)
         self.key = key
         self.master_key = master_key
         self.crypticle = crypticle
+        self._mof_check = 0
+        # Session tickets are sealed with a key only the master knows
+        self.ticket_crypticle = salt.crypt.Crypticle(
+                self.opts,
+                self.master_key.ticket_key)
+        # The persistent connection to the Publisher
+        if pub_channel is None:
+            pub_channel = PubChannel(opts)
+        self.pub_channel = pub_channel
+        self.job_cache = salt.utils.jobcache.get_job_cache(opts)
         # Create the event manager
         self.event = salt.utils.event.MasterEvent(self.opts['sock_dir'])
         # Make a client
@@ -1221,6 +1916,80 @@ class ClearFuncs(object):
 
         return False
 
+    def _auth_ret(self, load):
+        '''
+        Return the parts of a successful authentication reply which do not
+        depend on how the minion was authenticated
+        '''
+        ret = {'enc': 'pub',
+               'pub_key': self.master_key.get_pub_str(),
+               'token': self.master_key.token,
+               'publish_port': self.opts['publish_port'],
+               'compress': True,
+               # Pillar requests can carry the digest of the grains
+               'grains_digest': True,
+              }
+        if 'serials' in load:
+            # The minion told us which serializers it has, tell it which one
+            # the encrypted payloads from this master use
+            if self.serial.serial not in load['serials']:
+                log.warning(
+                    'Minion {0} does not support the {1} serializer used by '
+                    'this master'.format(load['id'], self.serial.serial)
+                )
+            ret['serial'] = self.serial.serial
+        return ret
+
+    def _gen_ticket(self, id_, secret, pubfn):
+        '''
+        Return a session ticket sealed with the master ticket key, the ticket
+        is bound to the accepted public key file of the minion
+        '''
+        pub_stat = os.stat(pubfn)
+        ticket = {'id': id_,
+                  'secret': secret,
+                  'expire': time.time() + self.opts['session_ticket_ttl'],
+                  'pub_stat': [pub_stat.st_ino,
+                               pub_stat.st_size,
+                               pub_stat.st_mtime]}
+        return self.ticket_crypticle.dumps(ticket, False)
+
+    def _resume_session(self, load):
+        '''
+        Return the authentication reply for a minion which presented a valid
+        session ticket, the current aes key is encrypted with the session
+        secret instead of the minion public key. None is returned if the
+        minion needs to go through the full authentication.
+        '''
+        try:
+            ticket = self.ticket_crypticle.loads(load['ticket'])
+        except Exception:
+            log.debug(
+                'Session ticket from {0} is not valid'.format(load['id'])
+            )
+            return None
+        if not isinstance(ticket, dict) or ticket.get('id') != load['id']:
+            return None
+        if ticket['expire'] < time.time():
+            log.debug('Session ticket from {0} has expired'.format(load['id']))
+            return None
+        pubfn = os.path.join(self.opts['pki_dir'], 'minions', load['id'])
+        try:
+            pub_stat = os.stat(pubfn)
+        except OSError:
+            # The key is no longer accepted
+            return None
+        if [pub_stat.st_ino, pub_stat.st_size, pub_stat.st_mtime] \
+                != ticket['pub_stat']:
+            # The accepted key has been changed since the ticket was issued
+            return None
+        log.info('Session resumed for {id}'.format(**load))
+        ret = self._auth_ret(load)
+        ret['session_aes'] = salt.crypt.Crypticle(
+                self.opts,
+                ticket['secret']).dumps(self.opts['aes'], False)
+        return ret
+
     def _auth(self, load):
         '''
         Authenticate the client, use the sent public key to encrypt the aes key
@@ -1237,7 +2006,16 @@ class ClearFuncs(object):
         # 4. encrypt the aes key as an encrypted salt.payload
         # 5. package the return and return it
 
-        salt.utils.verify.check_max_open_files(self.opts)
+        if time.time() - self._mof_check > self.mof_check_interval:
+            # Counting the accepted keys lists the whole minions directory,
+            # do not do it for every minion in an authentication storm
+            salt.utils.verify.check_max_open_files(self.opts)
+            self._mof_check = time.time()
+
+        if load.get('ticket') and self.opts['session_ticket_ttl']:
+            ret = self._resume_session(load)
+            if ret:
+                return ret
 
         log.info('Authentication request from {id}'.format(**load))
         pubfn = os.path.join(self.opts['pki_dir'],
@@ -1365,12 +2143,14 @@ class ClearFuncs(object):
             return {'enc': 'clear',
                     'load': {'ret': False}}
 
-        ret = {'enc': 'pub',
-               'pub_key': self.master_key.get_pub_str(),
-               'token': self.master_key.token,
-               'publish_port': self.opts['publish_port'],
-              }
+        ret = self._auth_ret(load)
         ret['aes'] = pub.public_encrypt(self.opts['aes'], 4)
+        if 'ticket' in load and self.opts['session_ticket_ttl']:
+            # The minion supports session tickets, give it a session secret
+            # so that it can skip the RSA exchange when it signs in again
+            secret = salt.crypt.Crypticle.generate_key_string()
+            ret['session'] = pub.public_encrypt(secret, 4)
+            ret['ticket'] = self._gen_ticket(load['id'], secret, pubfn)
         eload = {'result': True,
                  'act': 'accept',
                  'id': load['id'],
@@ -1453,23 +2233,9 @@ class ClearFuncs(object):
             if not clear_load.pop('key') == self.key[getpass.getuser()]:
                 return ''
         if not clear_load['jid']:
-            clear_load['jid'] = salt.utils.prep_jid(
-                    self.opts['cachedir'],
-                    self.opts['hash_type']
-                    )
-        jid_dir = salt.utils.jid_dir(
-                clear_load['jid'],
-                self.opts['cachedir'],
-                self.opts['hash_type']
-                )
-        # Verify the jid dir
-        if not os.path.isdir(jid_dir):
-            os.makedirs(jid_dir)
+            clear_load['jid'] = self.job_cache.prep_jid()
         # Save the invocation information
-        self.serial.dump(
-                clear_load,
-                open(os.path.join(jid_dir, '.load.p'), 'w+')
-                )
+        self.job_cache.save_load(clear_load['jid'], clear_load)
         # Set up the payload
         payload = {'enc': 'aes'}
         # Altering the contents of the publish load is serious!! Changes here
@@ -1502,15 +2268,28 @@ class ClearFuncs(object):
                       ' {jid}').format(**clear_load))
         log.debug('Published command details {0}'.format(load))
 
-        payload['load'] = self.crypticle.dumps(load)
+        # Publications reach every minion, keep them in the envelope which
+        # old minions understand
+        payload['load'] = self.crypticle.dumps(load, False)
+        # Send the target in the clear so minions can skip the decryption
+        # of publications which are not for them
+        payload['tgt'] = load['tgt']
+        payload['tgt_type'] = load.get('tgt_type', 'glob')
+        payload['sig'] = self.crypticle.sign_target(
+                payload['tgt'],
+                payload['tgt_type'],
+                payload['load'])
         # Send 0MQ to the publisher
-        context = zmq.Context(1)
-        pub_sock = context.socket(zmq.PUSH)
-        pull_uri = 'ipc://{0}'.format(
-            os.path.join(self.opts['sock_dir'], 'publish_pull.ipc')
-            )
-        pub_sock.connect(pull_uri)
-        pub_sock.send(self.serial.dumps(payload))
+        if not self.pub_channel.send(
+                payload,
+                self.pub_channel.topics(payload['tgt'], payload['tgt_type'])):
+            log.error(
+                'The publication of job {0} was dropped'.format(
+                    clear_load['jid']))
+            # The LocalClient reports a jid of 0 as a failed publication
+            return {'enc': 'clear',
+                    'load': {'jid': '0',
+                             'minions': []}}
         minions = self.ckminions.check_minions(load['tgt'], load.get('tgt_type', 'glob'))
         return {'enc': 'clear',
                 'load': {'jid': clear_load['jid'],
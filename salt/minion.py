@@ -141,6 +141,9 @@ class Minion(object):
         self.functions, self.returners = self.__load_modules()
         self.matcher = Matcher(self.opts, self.functions)
         self.proc_dir = get_proc_dir(opts['cachedir'])
+        # Keep the same auth object so that the session ticket from the last
+        # sign in can be used to authenticate again
+        self.auth = salt.crypt.Auth(self.opts, session_tickets=True)
         self.authenticate()
         opts['pillar'] = salt.pillar.get_pillar(
             opts,
@@ -175,10 +178,39 @@ class Minion(object):
         Takes a payload from the master publisher and does whatever the
         master wants done.
         '''
+        if payload['enc'] == 'aes' and not self._check_target(payload):
+            return
         {'aes': self._handle_aes,
          'pub': self._handle_pub,
          'clear': self._handle_clear}[payload['enc']](payload['load'])
 
+    def _check_target(self, payload):
+        '''
+        Use the signed clear text target sent with a publication to decide if
+        the publication needs to be decrypted. Returns False only when the
+        target is authentic and does not match this minion.
+        '''
+        if getattr(self, '_syndic', False):
+            # The syndic passes every publication on to its own minions
+            return True
+        if 'sig' not in payload or 'tgt' not in payload:
+            # Older masters do not send the target in the clear
+            return True
+        tgt_type = payload.get('tgt_type', 'glob')
+        if tgt_type not in ('glob', 'pcre', 'list'):
+            # The other matchers need more than the minion id, leave them
+            # to _handle_aes
+            return True
+        if not self.crypticle.verify_target(
+                payload['tgt'],
+                tgt_type,
+                payload['load'],
+                payload['sig']):
+            # This may be a new key, let _handle_aes re-authenticate
+            return True
+        return getattr(self.matcher, '{0}_match'.format(tgt_type))(
+                payload['tgt'])
+
     def _handle_aes(self, load):
         '''
         Takes the aes encrypted load, decrypts is and runs the encapsulated
@@ -418,13 +450,24 @@ class Minion(object):
         except KeyError:
             pass
         try:
-            ret_val = sreq.send('aes', self.crypticle.dumps(load))
+            ret_val = sreq.send(
+                'aes',
+                self.crypticle.dumps(load),
+                cmd=load['cmd'])
         except SaltReqTimeoutError:
             ret_val = ''
         if isinstance(ret_val, string_types) and not ret_val:
             # The master AES key has changed, reauth
             self.authenticate()
-            ret_val = sreq.send('aes', self.crypticle.dumps(load))
+            try:
+                ret_val = sreq.send(
+                    'aes',
+                    self.crypticle.dumps(load),
+                    cmd=load['cmd'])
+            except SaltReqTimeoutError:
+                log.error(
+                    'The master did not acknowledge the return of job '
+                    '{0}'.format(load['jid']))
         if self.opts['cache_jobs']:
             # Local job cache has been enabled
             fn_ = os.path.join(
@@ -470,17 +513,27 @@ class Minion(object):
         log.debug('Attempting to authenticate with the Salt Master at {0}'.format(
             self.opts['master_ip']
         ))
-        auth = salt.crypt.Auth(self.opts)
         while True:
-            creds = auth.sign_in()
+            creds = self.auth.sign_in()
             if creds != 'retry':
                 log.info('Authentication with master successful!')
                 break
+            if self.auth.try_again:
+                wait = self.auth.busy_wait()
+                log.info(
+                    'The master is busy, trying to authenticate again in '
+                    '{0:.1f} seconds'.format(wait)
+                )
+                time.sleep(wait)
+                continue
             log.info('Waiting for minion key to be accepted by the master.')
             time.sleep(self.opts['acceptance_wait_time'])
         self.aes = creds['aes']
         self.publish_port = creds['publish_port']
-        self.crypticle = salt.crypt.Crypticle(self.opts, self.aes)
+        self.crypticle = salt.crypt.Crypticle(
+                self.opts,
+                self.aes,
+                peer_compress=creds['compress'])
 
     def passive_refresh(self):
         '''
@@ -504,6 +557,25 @@ class Minion(object):
                 pass
             self.functions, self.returners = self.__load_modules()
 
+    def _pub_socket(self, context):
+        '''
+        Return a SUB socket connected to the master publisher
+        '''
+        socket = context.socket(zmq.SUB)
+        if self.opts['zmq_filtering'] and not getattr(self, '_syndic', False):
+            # Only receive the publications for this minion, the payload is
+            # the last frame of each message
+            socket.setsockopt(zmq.SUBSCRIBE, salt.payload.BROADCAST_TOPIC)
+            socket.setsockopt(
+                    zmq.SUBSCRIBE,
+                    salt.payload.minion_topic(self.opts['id']))
+        else:
+            socket.setsockopt(zmq.SUBSCRIBE, '')
+        if self.opts['sub_timeout']:
+            socket.setsockopt(zmq.IDENTITY, self.opts['id'])
+        socket.connect(self.master_pub)
+        return socket
+
     def tune_in(self):
         '''
         Lock onto the publisher. This is the main event loop for the minion
@@ -570,11 +642,7 @@ class Minion(object):
 
         poller = zmq.Poller()
         epoller = zmq.Poller()
-        socket = context.socket(zmq.SUB)
-        socket.setsockopt(zmq.SUBSCRIBE, '')
-        if self.opts['sub_timeout']:
-            socket.setsockopt(zmq.IDENTITY, self.opts['id'])
-        socket.connect(self.master_pub)
+        socket = self._pub_socket(context)
         poller.register(socket, zmq.POLLIN)
         epoller.register(epull_sock, zmq.POLLIN)
 
@@ -591,7 +659,7 @@ class Minion(object):
                     socks = dict(poller.poll(self.opts['sub_timeout'] * 1000))
                     if socket in socks and socks[socket] == zmq.POLLIN:
                         self.passive_refresh()
-                        payload = self.serial.loads(socket.recv())
+                        payload = self.serial.loads(socket.recv_multipart()[-1])
                         self._handle_payload(payload)
                         last = time.time()
                     if time.time() - last > self.opts['sub_timeout']:
@@ -607,10 +675,7 @@ class Minion(object):
                                 pass
                         poller.unregister(socket)
                         socket.close()
-                        socket = context.socket(zmq.SUB)
-                        socket.setsockopt(zmq.SUBSCRIBE, '')
-                        socket.setsockopt(zmq.IDENTITY, self.opts['id'])
-                        socket.connect(self.master_pub)
+                        socket = self._pub_socket(context)
                         poller.register(socket, zmq.POLLIN)
                         last = time.time()
                     time.sleep(0.05)
@@ -629,7 +694,7 @@ class Minion(object):
                 try:
                     socks = dict(poller.poll(60000))
                     if socket in socks and socks[socket] == zmq.POLLIN:
-                        payload = self.serial.loads(socket.recv())
+                        payload = self.serial.loads(socket.recv_multipart()[-1])
                         self._handle_payload(payload)
                         last = time.time()
                     time.sleep(0.05)
@@ -23,6 +23,8 @@ def fire_master(data, tag):
     try:
         sreq.send('aes', auth.crypticle.dumps(load))
     except:
+        # A SaltReqTimeoutError from a master which does not answer is
+        # swallowed as well, the event is not sent again
         pass
     return True
 
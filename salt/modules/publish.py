@@ -8,6 +8,7 @@ import ast
 # Import salt libs
 import salt.crypt
 import salt.payload
+from salt.exceptions import SaltReqTimeoutError
 from salt._compat import string_types, integer_types
 
 def _publish(
@@ -54,8 +55,11 @@ def _publish(
             'tmo': timeout,
             'form': form,
             'id': __opts__['id']}
-    return auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 1))
+    try:
+        return auth.crypticle.loads(
+                sreq.send('aes', auth.crypticle.dumps(load), 1))
+    except SaltReqTimeoutError:
+        return {}
 
 def normalize_arg(arg):
     if not arg:
@@ -124,5 +128,8 @@ def runner(fun, arg=None):
             'arg': arg,
             'tok': tok,
             'id': __opts__['id']}
-    return auth.crypticle.loads(
-            sreq.send('aes', auth.crypticle.dumps(load), 1))
+    try:
+        return auth.crypticle.loads(
+                sreq.send('aes', auth.crypticle.dumps(load), 1))
+    except SaltReqTimeoutError:
+        return {}
@@ -5,7 +5,10 @@ in here
 '''
 
 # Import python libs
+import os
 import sys
+import hashlib
+import threading
 
 # Import salt libs
 import salt.log
@@ -53,6 +56,18 @@ def unpackage(package_):
     return msgpack.loads(package_, use_list=True)
 
 
+# The publisher topic which every minion subscribes to
+BROADCAST_TOPIC = 'broadcast'
+
+
+def minion_topic(id_):
+    '''
+    Return the publisher topic used to address a single minion, the id is
+    hashed so that no minion topic is a prefix of another
+    '''
+    return hashlib.sha1(id_).hexdigest()
+
+
 def format_payload(enc, **kwargs):
     '''
     Pass in the required arguments for a payload, the enc type and the cmd,
@@ -66,6 +81,95 @@ def format_payload(enc, **kwargs):
     return package(payload)
 
 
+class MsgpackSerializer(object):
+    '''
+    Serialize with msgpack, files are decoded incrementally when the msgpack
+    bindings provide an Unpacker
+    '''
+    # The number of bytes read from a file per step of a streaming decode
+    read_size = 1024 * 1024
+
+    def loads(self, msg):
+        return msgpack.loads(msg, use_list=True)
+
+    def dumps(self, msg):
+        return msgpack.dumps(msg)
+
+    def iter_load(self, fn_):
+        '''
+        Yield each object serialized in the file without reading the whole
+        file into memory
+        '''
+        if not hasattr(msgpack, 'Unpacker'):
+            # msgpack_pure does not have a streaming unpacker
+            yield self.loads(fn_.read())
+            return
+        unpacker = msgpack.Unpacker(
+                fn_,
+                read_size=self.read_size,
+                use_list=True)
+        for obj in unpacker:
+            yield obj
+
+    def load(self, fn_):
+        for obj in self.iter_load(fn_):
+            return obj
+        raise ValueError('No msgpack data found in {0}'.format(
+            getattr(fn_, 'name', fn_)))
+
+
+class PickleSerializer(object):
+    '''
+    Serialize with pickle, data which cannot be unpickled is tried as
+    msgpack so that minions and masters using different formats still
+    understand each other
+    '''
+    def loads(self, msg):
+        try:
+            return pickle.loads(msg)
+        except Exception:
+            return msgpack.loads(msg, use_list=True)
+
+    def dumps(self, msg):
+        return pickle.dumps(msg)
+
+    def iter_load(self, fn_):
+        yield self.load(fn_)
+
+    def load(self, fn_):
+        try:
+            return pickle.load(fn_)
+        except Exception:
+            fn_.seek(0)
+            return SERIALIZERS['msgpack'].load(fn_)
+
+
+# The serializers available in this process, keyed by the name used for the
+# serial option
+SERIALIZERS = {'msgpack': MsgpackSerializer(),
+               'pickle': PickleSerializer()}
+
+
+def register_serializer(name, serializer):
+    '''
+    Make a serializer available to Serial under the given name, the
+    serializer needs loads, dumps, load and iter_load methods
+    '''
+    SERIALIZERS[name] = serializer
+
+
+def available_serializers(preferred=None):
+    '''
+    Return the names of the registered serializers, the preferred serializer
+    is listed first
+    '''
+    names = sorted(SERIALIZERS)
+    if preferred in SERIALIZERS:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    return names
+
+
 class Serial(object):
     '''
     Create a serialization object, this object manages all message
@@ -78,35 +182,45 @@ class Serial(object):
             self.serial = opts
         else:
             self.serial = 'msgpack'
+        if self.serial not in SERIALIZERS:
+            log.warning(
+                'The serializer {0} is not available, falling back to '
+                'msgpack'.format(self.serial)
+            )
+            self.serial = 'msgpack'
+        self.serializer = SERIALIZERS[self.serial]
 
     def loads(self, msg):
         '''
         Run the correct loads serialization format
         '''
-        if self.serial == 'msgpack':
-            return msgpack.loads(msg, use_list=True)
-        elif self.serial == 'pickle':
-            try:
-                return pickle.loads(msg)
-            except Exception:
-                return msgpack.loads(msg, use_list=True)
+        return self.serializer.loads(msg)
 
     def load(self, fn_):
         '''
-        Run the correct serialization to load a file
+        Run the correct serialization to load a file, the file is decoded as
+        it is read when the serializer supports it
         '''
-        data = fn_.read()
-        fn_.close()
-        return self.loads(data)
+        try:
+            return self.serializer.load(fn_)
+        finally:
+            fn_.close()
+
+    def iter_load(self, fn_):
+        '''
+        Yield each object serialized into a file in turn
+        '''
+        try:
+            for obj in self.serializer.iter_load(fn_):
+                yield obj
+        finally:
+            fn_.close()
 
     def dumps(self, msg):
         '''
         Run the correct dumps serialization format
         '''
-        if self.serial == 'pickle':
-            return pickle.dumps(msg)
-        else:
-            return msgpack.dumps(msg)
+        return self.serializer.dumps(msg)
 
     def dump(self, msg, fn_):
         '''
@@ -116,40 +230,165 @@ class Serial(object):
         fn_.close()
 
 
+class ChannelManager(object):
+    '''
+    Manage the zeromq context and the pools of connected REQ sockets used by
+    every SREQ in the running process. Sockets are handed out one request at
+    a time and returned to the pool for the master URI they are connected to,
+    so repeated requests to the same master do not pay the connect cost again.
+    '''
+    # The number of idle sockets to keep connected for a single master URI
+    max_idle = 8
+
+    def __init__(self):
+        self.pid = None
+        self.lock = None
+        self.context = None
+        self.pools = {}
+        # References to the context and sockets inherited from a parent
+        # process, these must never be used or closed after a fork
+        self._inherited = []
+
+    def _check_pid(self):
+        '''
+        zeromq contexts and sockets cannot be used across a fork, make sure
+        that the running process has its own context and socket pools
+        '''
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        if self.context is not None:
+            self._inherited.append((self.context, self.pools))
+        self.pid = pid
+        self.lock = threading.Lock()
+        self.context = zmq.Context()
+        self.pools = {}
+
+    def checkout(self, uri, id_='', linger=0):
+        '''
+        Return a connected REQ socket for the given uri, reusing an idle
+        socket from the pool when one is available
+        '''
+        self._check_pid()
+        with self.lock:
+            pool = self.pools.setdefault((uri, id_), [])
+            if pool:
+                return pool.pop()
+            socket = self.context.socket(zmq.REQ)
+        socket.linger = linger
+        if id_:
+            socket.setsockopt(zmq.IDENTITY, id_)
+        socket.connect(uri)
+        return socket
+
+    def checkin(self, uri, socket, id_=''):
+        '''
+        Return a socket which has completed its request/reply cycle to the
+        pool
+        '''
+        self._check_pid()
+        with self.lock:
+            pool = self.pools.setdefault((uri, id_), [])
+            if len(pool) < self.max_idle:
+                pool.append(socket)
+                return
+        socket.close()
+
+    def discard(self, socket):
+        '''
+        Close a socket that cannot be reused, a REQ socket which is still
+        waiting on a reply will refuse to send another request
+        '''
+        socket.close()
+
+    def destroy(self):
+        '''
+        Close all of the pooled sockets and terminate the context
+        '''
+        self._check_pid()
+        with self.lock:
+            for pool in self.pools.values():
+                for socket in pool:
+                    socket.close()
+            self.pools = {}
+            self.context.term()
+            self.context = None
+            self.pid = None
+
+
+# The channel manager shared by every SREQ in this process
+CHANNELS = ChannelManager()
+
+
+# The commands which only read from the master, a request for them which got
+# no reply is sent again. The other commands, such as publications and job
+# returns, are never sent twice.
+IDEMPOTENT_CMDS = set([
+    '_dir_list',
+    '_ext_nodes',
+    '_file_hash',
+    '_file_list',
+    '_file_list_emptydirs',
+    '_master_opts',
+    '_master_state',
+    '_pillar',
+    '_serve_file',
+    ])
+
+
 class SREQ(object):
     '''
-    Create a generic interface to wrap salt zeromq req calls. 
+    Create a generic interface to wrap salt zeromq req calls. The sockets are
+    borrowed from the process wide channel manager for each request.
     '''
     def __init__(self, master, id_='', serial='msgpack', linger=0):
         self.master = master
+        self.id_ = id_
+        self.linger = linger
         self.serial = Serial(serial)
-        context = zmq.Context()
-        self.socket = context.socket(zmq.REQ)
-        self.socket.linger = linger
-        if id_:
-            self.socket.setsockopt(zmq.IDENTITY, id_)
-        self.socket.connect(master)
 
-    def send(self, enc, load, tries=1, timeout=60):
+    def send(self, enc, load, tries=1, timeout=60, cmd=None):
         '''
-        Takes two arguments, the encryption type and the base payload
+        Takes two arguments, the encryption type and the base payload. Each
+        attempt waits ``timeout`` seconds for the reply, a request for one of
+        the IDEMPOTENT_CMDS is sent up to ``tries`` times. The name of the
+        command in an encrypted load can be passed as ``cmd``, it is sent in
+        the clear so that the master can route the request without
+        decrypting it.
         '''
         payload = {'enc': enc}
         payload['load'] = load
+        if cmd:
+            payload['cmd'] = cmd
         package = self.serial.dumps(payload)
-        self.socket.send(package)
-        poller = zmq.Poller()
-        poller.register(self.socket, zmq.POLLIN)
         tried = 0
         while True:
-            if not poller.poll(timeout*1000) and tried >= tries:
-                raise SaltReqTimeoutError('Waited {0} seconds'.format(timeout))
-            else:
-                break
+            socket = CHANNELS.checkout(self.master, self.id_, self.linger)
+            poller = zmq.Poller()
+            poller.register(socket, zmq.POLLIN)
+            try:
+                socket.send(package)
+                if poller.poll(timeout * 1000):
+                    ret = self.serial.loads(socket.recv())
+                    poller.unregister(socket)
+                    CHANNELS.checkin(self.master, socket, self.id_)
+                    return ret
+            except Exception:
+                poller.unregister(socket)
+                CHANNELS.discard(socket)
+                raise
+            # The socket is stuck waiting on a reply which may never come,
+            # drop it and retry on a fresh connection
+            poller.unregister(socket)
+            CHANNELS.discard(socket)
             tried += 1
-        ret = self.serial.loads(self.socket.recv())
-        poller.unregister(self.socket)
-        return ret
+            if tried >= tries or cmd not in IDEMPOTENT_CMDS:
+                raise SaltReqTimeoutError('Waited {0} seconds'.format(timeout))
+            log.debug(
+                'Request to {0} timed out, retrying ({1}/{2})'.format(
+                    self.master, tried, tries
+                )
+            )
 
     def send_auto(self, payload):
         '''
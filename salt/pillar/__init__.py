@@ -5,19 +5,28 @@ Render the pillar data
 # Import python libs
 import os
 import copy
+import time
 import collections
 import logging
+import threading
 
 # Import Salt libs
+import salt.utils
+import salt.utils.minions
 import salt.loader
 import salt.fileclient
 import salt.minion
 import salt.crypt
-from salt._compat import string_types
+from salt._compat import string_types, OrderedDict
 from salt.template import compile_template
 
 log = logging.getLogger(__name__)
 
+# The ext_pillar sources still running in the process by source and minion,
+# a compilation waits on the running source instead of starting it again
+EXT_RUNNING = {}
+EXT_RUNNING_LOCK = threading.Lock()
+
 
 def get_pillar(opts, grains, id_, env=None):
     '''
@@ -45,17 +54,32 @@ class RemotePillar(object):
         self.sreq = salt.payload.SREQ(self.opts['master_uri'])
         self.auth = salt.crypt.SAuth(opts)
 
+    def _send(self, load):
+        return self.auth.crypticle.loads(
+                self.sreq.send(
+                    'aes',
+                    self.auth.crypticle.dumps(load),
+                    3,
+                    7200,
+                    cmd=load['cmd'])
+                )
+
     def compile_pillar(self):
         '''
         Return the pillar data from the master
         '''
         load = {'id': self.id_,
-                'grains': self.grains,
                 'env': self.opts['environment'],
                 'cmd': '_pillar'}
-        return self.auth.crypticle.loads(
-                self.sreq.send('aes', self.auth.crypticle.dumps(load), 3, 7200)
-                )
+        if self.auth.grains_digest:
+            # Only send the grains if the master does not know them
+            load['grains_digest'] = salt.utils.digest_data(self.grains)
+            ret = self._send(load)
+            if ret is not False:
+                return ret
+            del load['grains_digest']
+        load['grains'] = self.grains
+        return self._send(load)
 
 
 
@@ -64,6 +88,9 @@ class Pillar(object):
     Read over the pillar top files and render the pillar data
     '''
     def __init__(self, opts, grains, id_, env):
+        # The environment of the minion is only used if it is not set in the
+        # options
+        self.load_env = 'environment' not in opts
         # use the local file client
         self.opts = self.__gen_opts(opts, grains, id_, env)
         self.client = salt.fileclient.get_file_client(self.opts)
@@ -71,6 +98,25 @@ class Pillar(object):
         self.functions = salt.loader.minion_mods(self.opts)
         self.rend = salt.loader.render(self.opts, self.functions)
         self.ext_pillars = salt.loader.pillars(self.opts, self.functions)
+        # The ext_pillar data kept by source and minion and the stats the
+        # ext_pillar timings are recorded in
+        self.ext_cache = OrderedDict()
+        self.stats = None
+        # Set when an ext_pillar source of the last compilation timed out or
+        # failed
+        self.ext_incomplete = False
+        # Set when a source started by this pillar is left running, the
+        # pillar must then not be pointed at another minion
+        self.ext_detached = False
+        # Counts the minions the pillar was pointed at
+        self.generation = 0
+        # The globals of the loaded modules, to point them at another minion
+        self.mod_globals = {}
+        for funcs in (self.functions, self.rend, self.ext_pillars):
+            for func in funcs.values():
+                mod_globals = getattr(func, '__globals__', None)
+                if mod_globals is not None:
+                    self.mod_globals[id(mod_globals)] = mod_globals
 
     def __gen_opts(self, opts, grains, id_, env=None):
         '''
@@ -79,7 +125,7 @@ class Pillar(object):
         opts = copy.deepcopy(opts)
         opts['file_roots'] = opts['pillar_roots']
         opts['file_client'] = 'local'
-        opts['grains'] = grains
+        opts['grains'] = dict(grains)
         opts['id'] = id_
         if 'environment' not in opts:
             opts['environment'] = env
@@ -91,6 +137,25 @@ class Pillar(object):
             opts['state_top'] = os.path.join('salt://', opts['state_top'])
         return opts
 
+    def retarget(self, grains, id_, env):
+        '''
+        Point the pillar at another minion without loading the modules again,
+        the options and grains the modules were handed are updated in place
+        '''
+        self.generation += 1
+        update = {'id': id_}
+        if self.load_env:
+            update['environment'] = env
+        self.opts.update(update)
+        self.opts['grains'].clear()
+        self.opts['grains'].update(grains)
+        for mod_globals in self.mod_globals.values():
+            # Another loader of the process can have handed the modules
+            # other grains
+            mod_globals['__grains__'] = self.opts['grains']
+            if isinstance(mod_globals.get('__opts__'), dict):
+                mod_globals['__opts__'].update(update)
+
     def _get_envs(self):
         '''
         Pull the file server environments out of the master options
@@ -299,16 +364,86 @@ class Pillar(object):
                     errors += err
         return pillar, errors
 
+    def _ext_opt(self, opt, key, default):
+        '''
+        Return the value of an ext_pillar option for the source, the option
+        holds either the value of all of the sources or a dict of the values
+        by source with the value of the other sources under default
+        '''
+        val = self.opts.get(opt, default)
+        if isinstance(val, dict):
+            return val.get(key, val.get('default', default))
+        return val
+
+    def _start_ext(self, run_key, key, val):
+        '''
+        Return the run of an ext_pillar source for the minion, the source is
+        only started if it is not running yet. A run is only joined while the
+        pillar which started it still points at the minion.
+        '''
+        with EXT_RUNNING_LOCK:
+            run = EXT_RUNNING.get(run_key)
+            if (run is not None
+                    and run['pillar'].generation == run['generation']):
+                self._inc('ext_pillar:{0}:joined'.format(key))
+                return run
+            run = {'data': None,
+                   'failed': False,
+                   'pillar': self,
+                   'generation': self.generation}
+            run['thread'] = threading.Thread(
+                    target=self._run_ext,
+                    args=(run_key, key, val, run))
+            run['thread'].daemon = True
+            EXT_RUNNING[run_key] = run
+        run['thread'].start()
+        return run
+
+    def _run_ext(self, run_key, key, val, run):
+        '''
+        Run a single ext_pillar source and store its data in the run
+        '''
+        start = time.time()
+        try:
+            if isinstance(val, dict):
+                run['data'] = self.ext_pillars[key](**val)
+            elif isinstance(val, list):
+                run['data'] = self.ext_pillars[key](*val)
+            else:
+                run['data'] = self.ext_pillars[key](val)
+        except Exception:
+            log.exception('Failed to load ext_pillar {0}'.format(key))
+            self._inc('ext_pillar:{0}:errors'.format(key))
+            run['failed'] = True
+        finally:
+            with EXT_RUNNING_LOCK:
+                if EXT_RUNNING.get(run_key) is run:
+                    EXT_RUNNING.pop(run_key)
+        if self.stats is not None:
+            self.stats.timing(
+                    'ext_pillar:{0}'.format(key), time.time() - start)
+        log.debug('ext_pillar {0} ran in {1:.3f} seconds'.format(
+            key, time.time() - start))
+
+    def _inc(self, key):
+        if self.stats is not None:
+            self.stats.inc(key)
+
     def ext_pillar(self):
         '''
-        Render the external pillar data
+        Render the external pillar data, the sources run concurrently and the
+        data of a source which did not return within its ext_pillar_timeout
+        is left out. The data of a source is reused for the same minion for
+        ext_pillar_cache_ttl seconds, it is only kept from the compilations
+        in which every source returned.
         '''
+        self.ext_incomplete = False
         if not 'ext_pillar' in self.opts:
             return  {}
         if not isinstance(self.opts['ext_pillar'], list):
             log.critical('The "ext_pillar" option is malformed')
             return {}
-        ext = {}
+        sources = []
         for run in self.opts['ext_pillar']:
             if not isinstance(run, dict):
                 log.critical('The "ext_pillar" option is malformed')
@@ -319,17 +454,69 @@ class Pillar(object):
                            'unavailable').format(key)
                     log.critical(err)
                     continue
-                try:
-                    if isinstance(val, dict):
-                        ext.update(self.ext_pillars[key](**val))
-                    elif isinstance(val, list):
-                        ext.update(self.ext_pillars[key](*val))
-                    else:
-                        ext.update(self.ext_pillars[key](val))
-                except Exception:
-                    log.exception('Failed to load ext_pillar {0}'.format(key))
+                sources.append((key, val))
+        start = time.time()
+        results = [None] * len(sources)
+        runs = []
+        for ind, (key, val) in enumerate(sources):
+            cached = self.ext_cache.get((ind, key, self.opts['id']))
+            ttl = self._ext_opt('ext_pillar_cache_ttl', key, 0)
+            if cached is not None and start - cached[0] < ttl:
+                self._inc('ext_pillar:{0}:cache_hits'.format(key))
+                results[ind] = cached[1]
+                runs.append(None)
+                continue
+            runs.append(
+                self._start_ext((ind, key, self.opts['id']), key, val))
+        fresh = []
+        ext = {}
+        for ind, (key, val) in enumerate(sources):
+            run = runs[ind]
+            if run is not None:
+                timeout = self._ext_opt('ext_pillar_timeout', key, 0)
+                if timeout:
+                    run['thread'].join(max(0, start + timeout - time.time()))
+                else:
+                    run['thread'].join()
+                if run['thread'].is_alive():
+                    # The source is left running, its data is dropped
+                    if run['pillar'] is self:
+                        self.ext_detached = True
+                    log.error(
+                        'The ext_pillar {0} did not return within {1} '
+                        'seconds'.format(key, timeout))
+                    self._inc('ext_pillar:{0}:timeouts'.format(key))
+                    self.ext_incomplete = True
+                    continue
+                if run['failed']:
+                    self.ext_incomplete = True
+                    continue
+                results[ind] = run['data']
+                if results[ind] is not None and self._ext_opt(
+                        'ext_pillar_cache_ttl', key, 0):
+                    fresh.append((ind, key, results[ind]))
+            if results[ind] is None:
+                continue
+            try:
+                ext.update(results[ind])
+            except (TypeError, ValueError):
+                log.error(
+                    'The ext_pillar {0} did not return a dict'.format(key))
+        if not self.ext_incomplete:
+            for ind, key, data in fresh:
+                self._cache_ext(ind, key, start, data)
         return ext
 
+    def _cache_ext(self, ind, key, start, data):
+        '''
+        Keep the data of an ext_pillar source for the minion
+        '''
+        cache_key = (ind, key, self.opts['id'])
+        self.ext_cache.pop(cache_key, None)
+        self.ext_cache[cache_key] = (start, data)
+        while len(self.ext_cache) > self.opts.get('pillar_cache_size', 1000):
+            self.ext_cache.popitem(last=False)
+
     def compile_pillar(self):
         '''
         Render the pillar dta and return
@@ -344,3 +531,159 @@ class Pillar(object):
                 log.critical('Pillar render error: {0}'.format(error))
             return {}
         return pillar
+
+
+class PillarCache(object):
+    '''
+    Keep the compiled pillar of the minions on the master. An entry is used
+    while the grains of the minion, the files in the pillar_roots and the
+    ext_pillar configuration are unchanged and it is younger than
+    pillar_cache_ttl seconds, the least recently used entries are evicted
+    past pillar_cache_size entries. The last grains of the minions are kept
+    as well, to compile the pillar of the minions which only send the digest
+    of their grains.
+    '''
+    # The pillar_roots are walked again at most once in this many seconds
+    fingerprint_interval = 1
+
+    def __init__(self, opts, stats=None):
+        self.opts = opts
+        self.ttl = opts.get('pillar_cache_ttl', 0)
+        self.size = opts.get('pillar_cache_size', 1000)
+        self.stats = stats
+        # The compiled pillars are only kept if pillar_cache_ttl is set
+        self.entries = None
+        if self.ttl:
+            self.entries = OrderedDict()
+        # minion id -> (digest, grains)
+        self.grains = OrderedDict()
+        self.fingerprint = None
+        self.fingerprint_time = 0
+        self.lock = threading.Lock()
+        # Each thread reuses its own Pillar for every minion, the modules of
+        # each Pillar are loaded under their own name so that the threads
+        # compile concurrently
+        self.local = threading.local()
+        self.pillars = 0
+
+    def _inc(self, key):
+        if self.stats is not None:
+            self.stats.inc('pillar_cache:{0}'.format(key))
+
+    def get_fingerprint(self):
+        '''
+        Return the digest of the files in the pillar_roots and of the
+        configuration of the pillar
+        '''
+        now = time.time()
+        if now - self.fingerprint_time < self.fingerprint_interval:
+            return self.fingerprint
+        files = []
+        for env, roots in sorted(self.opts.get('pillar_roots', {}).items()):
+            for root in roots:
+                for dirpath, dirnames, filenames in os.walk(root):
+                    dirnames.sort()
+                    for name in sorted(filenames):
+                        path = os.path.join(dirpath, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        files.append(
+                            (env, path, stat.st_mtime, stat.st_size))
+        self.fingerprint = salt.utils.digest_data(
+            [files,
+             self.opts.get('ext_pillar', []),
+             self.opts.get('state_top'),
+             self.opts.get('renderer')])
+        self.fingerprint_time = now
+        return self.fingerprint
+
+    def _compile(self, grains, id_, env):
+        '''
+        Compile the pillar of the minion with the modules loaded for the
+        first compilation of the thread
+        '''
+        pillar = getattr(self.local, 'pillar', None)
+        if pillar is None:
+            with self.lock:
+                self.pillars += 1
+                opts = dict(self.opts)
+                opts['loaded_base_name'] = '{0}.pillar{1}'.format(
+                        salt.loader.loaded_base_name, self.pillars)
+            pillar = Pillar(opts, grains, id_, env)
+            pillar.stats = self.stats
+            self.local.pillar = pillar
+        else:
+            pillar.retarget(grains, id_, env)
+        ret = pillar.compile_pillar()
+        if pillar.ext_detached:
+            # An ext_pillar source still runs with the options and grains of
+            # this minion, the modules are loaded again for the next one
+            self.local.pillar = None
+        return ret, not pillar.ext_incomplete
+
+    def get_grains(self, id_, digest):
+        '''
+        Return the last grains of the minion if they have the digest, the
+        grains in the minion data cache are used if the minion is not known
+        to this process. None is returned if the grains are unknown.
+        '''
+        with self.lock:
+            entry = self.grains.get(id_)
+        if entry is not None and entry[0] == digest:
+            self._inc('grains_hits')
+            return entry[1]
+        grains = salt.utils.minions.load_grains(self.opts, id_, digest)
+        if grains is None:
+            self._inc('grains_misses')
+            return None
+        self._inc('grains_hits')
+        self._remember_grains(id_, digest, grains)
+        return grains
+
+    def _remember_grains(self, id_, digest, grains):
+        with self.lock:
+            self.grains.pop(id_, None)
+            self.grains[id_] = (digest, grains)
+            while len(self.grains) > self.size:
+                self.grains.popitem(last=False)
+
+    def compile_pillar(self, grains, id_, env, grains_digest=None):
+        '''
+        Return the pillar of the minion, from the cache if possible
+        '''
+        if grains_digest is None:
+            grains_digest = salt.utils.digest_data(grains)
+            self._remember_grains(id_, grains_digest, grains)
+        if not self.ttl:
+            return self._compile(grains, id_, env)[0]
+        key = (id_, env)
+        tag = (grains_digest, self.get_fingerprint())
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                if entry[1] == tag and time.time() - entry[0] < self.ttl:
+                    # Move the entry to the most recently used end
+                    self.entries[key] = entry
+                    self._inc('hits')
+                    return entry[2]
+                self._inc('expired')
+        self._inc('misses')
+        start = time.time()
+        pillar, complete = self._compile(grains, id_, env)
+        if self.stats is not None:
+            self.stats.timing('pillar_cache:compile', time.time() - start)
+        if not pillar or not complete:
+            # An empty pillar is also returned when the render failed, the
+            # data of an ext_pillar source is missing from an incomplete one
+            self._inc('incomplete')
+            return pillar
+        with self.lock:
+            self.entries[key] = (start, tag, pillar)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self._inc('evictions')
+            if self.stats is not None:
+                self.stats.gauge('pillar_cache:size', len(self.entries))
+        return pillar
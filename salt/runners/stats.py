@@ -0,0 +1,160 @@
+'''
+Report on the performance figures collected by the running salt master
+'''
+
+# Import Python Modules
+import os
+
+# Import Third party libs
+import yaml
+
+# Import Salt Modules
+import salt.payload
+import salt.utils.stats
+
+
+def auth():
+    '''
+    Print the authentication queue depth, the number of admitted and refused
+    authentication requests and the authentication latency
+    '''
+    ret = salt.utils.stats.read(__opts__, 'auth')
+    print(yaml.dump(ret))
+    return ret
+
+
+def master():
+    '''
+    Print the number of requests, the latency, the request and reply sizes
+    and the errors of each command handled by the master workers, the
+    figures of all of the workers are added up
+    '''
+    merged = salt.utils.stats.merge(
+            salt.utils.stats.read(__opts__, name)
+            for name in salt.utils.stats.names(__opts__, 'mworker_'))
+    labels = ['<={0}'.format(bound) for bound in merged['buckets']]
+    labels.append('>{0}'.format(merged['buckets'][-1]))
+    ret = {}
+    for key, timing in merged['timings'].items():
+        enc, cmd = key.split(':', 1)
+        if enc not in ('aes', 'clear'):
+            # Not a command, such as the pillar cache figures
+            continue
+        if ':' in cmd:
+            cmd, figure = cmd.split(':', 1)
+            ret.setdefault(cmd, {})[figure] = {'avg': timing['avg'],
+                                               'max': timing['max']}
+            continue
+        ret.setdefault(cmd, {}).update(
+                {'count': timing['count'],
+                 'latency': {'avg': timing['avg'],
+                             'max': timing['max'],
+                             'histogram': dict(
+                                 zip(labels, timing.get('histogram', [])))},
+                 'errors': merged['counters'].get('{0}:errors'.format(key), 0)})
+    print(yaml.dump(ret))
+    return ret
+
+
+def pools():
+    '''
+    Print the queue depth, the number of requests and the latency of each
+    worker pool
+    '''
+    snapshot = salt.utils.stats.read(__opts__, 'pools')
+    ret = {}
+    for figures in ('counters', 'gauges', 'timings'):
+        for key, value in snapshot.get(figures, {}).items():
+            name, figure = key.split(':', 1)
+            ret.setdefault(name, {})[figure] = value
+    print(yaml.dump(ret))
+    return ret
+
+
+def pillar_cache():
+    '''
+    Print the hits, misses and evictions of the pillar caches of the master
+    workers and the time spent compiling the pillar on a miss
+    '''
+    merged = salt.utils.stats.merge(
+            salt.utils.stats.read(__opts__, name)
+            for name in salt.utils.stats.names(__opts__, 'mworker_'))
+    ret = {}
+    for key, count in merged['counters'].items():
+        if key.startswith('pillar_cache:'):
+            ret[key.split(':', 1)[1]] = count
+    lookups = ret.get('hits', 0) + ret.get('misses', 0)
+    ret['hit_ratio'] = float(ret.get('hits', 0)) / lookups if lookups else 0.0
+    ret['size'] = merged['gauges'].get('pillar_cache:size', 0)
+    compile_ = merged['timings'].get('pillar_cache:compile')
+    if compile_:
+        ret['compile'] = {'avg': compile_['avg'], 'max': compile_['max']}
+    print(yaml.dump(ret))
+    return ret
+
+
+def ext_pillar():
+    '''
+    Print the run time, errors, timeouts and cache hits of each ext_pillar
+    source, the figures of all of the workers are added up
+    '''
+    merged = salt.utils.stats.merge(
+            salt.utils.stats.read(__opts__, name)
+            for name in salt.utils.stats.names(__opts__, 'mworker_'))
+    ret = {}
+    for key, timing in merged['timings'].items():
+        if key.startswith('ext_pillar:'):
+            ret.setdefault(key.split(':', 1)[1], {}).update(
+                    {'count': timing['count'],
+                     'avg': timing['avg'],
+                     'max': timing['max']})
+    for key, count in merged['counters'].items():
+        if key.startswith('ext_pillar:'):
+            source, figure = key.split(':', 2)[1:]
+            ret.setdefault(source, {})[figure] = count
+    print(yaml.dump(ret))
+    return ret
+
+
+def job_cache():
+    '''
+    Print the number of old jobs removed from the job cache and the time
+    spent removing them
+    '''
+    ret = salt.utils.stats.read(__opts__, 'job_cache')
+    print(yaml.dump(ret))
+    return ret
+
+
+def publisher():
+    '''
+    Print the number of publications sent and dropped by the publisher,
+    publications sent to a single minion are reported by minion id. A minion
+    listed under unsubscribed_by_minion was not connected to the publisher,
+    topics is the number of topics at least one minion subscribed to.
+    '''
+    snapshot = salt.utils.stats.read(__opts__, 'publisher')
+    if not snapshot:
+        print(yaml.dump({}))
+        return {}
+    # The publisher only knows the topics, map them back to the minion ids
+    topics = {salt.payload.BROADCAST_TOPIC: salt.payload.BROADCAST_TOPIC}
+    minions_dir = os.path.join(__opts__['pki_dir'], 'minions')
+    if os.path.isdir(minions_dir):
+        for id_ in os.listdir(minions_dir):
+            topics[salt.payload.minion_topic(id_)] = id_
+    ret = {'sent': 0,
+           'dropped': 0,
+           'unsubscribed': 0,
+           'dropped_by_minion': {},
+           'unsubscribed_by_minion': {},
+           'topics': snapshot['gauges'].get('topics', 0),
+           'time': snapshot['time']}
+    for key, count in snapshot['counters'].items():
+        if ':' not in key:
+            ret[key] = count
+            continue
+        kind, topic = key.split(':', 1)
+        ret['{0}_by_minion'.format(kind)][topics.get(topic, topic)] = count
+    print(yaml.dump(ret))
+    return ret
@@ -1748,7 +1748,8 @@ class RemoteHighState(object):
                     'aes',
                     self.auth.crypticle.dumps(load),
                     3,
-                    72000))
+                    72000,
+                    cmd=load['cmd']))
         except SaltReqTimeoutError:
             return {}
 
@@ -372,11 +372,18 @@ def required_modules_error(name, docstring):
     return msg.format(filename, ', '.join(modules))
 
 
+def gen_jid():
+    '''
+    Generate a job id from the current time
+    '''
+    return "{0:%Y%m%d%H%M%S%f}".format(datetime.datetime.now())
+
+
 def prep_jid(cachedir, sum_type):
     '''
     Return a job id and prepare the job id directory
     '''
-    jid = "{0:%Y%m%d%H%M%S%f}".format(datetime.datetime.now())
+    jid = gen_jid()
 
     jid_dir_ = jid_dir(jid, cachedir, sum_type)
     if not os.path.isdir(jid_dir_):
@@ -513,6 +520,34 @@ def pem_finger(path, sum_type='md5'):
     return finger.rstrip(':')
 
 
+def _canonical(data):
+    '''
+    Return a string form of the data which does not depend on the order of
+    the dict keys, nor on the data having been through msgpack
+    '''
+    if isinstance(data, dict):
+        return '{{{0}}}'.format(','.join(sorted(
+            '{0}:{1}'.format(_canonical(key), _canonical(val))
+            for key, val in data.items())))
+    if isinstance(data, (list, tuple)):
+        return '[{0}]'.format(','.join(_canonical(item) for item in data))
+    if isinstance(data, unicode):
+        # msgpack hands back unicode strings as byte strings
+        data = data.encode('utf-8')
+    elif isinstance(data, (int, long)) and not isinstance(data, bool):
+        # Small longs come back as ints
+        return str(data)
+    return repr(data)
+
+
+def digest_data(data, sum_type='md5'):
+    '''
+    Return the hex digest of a data structure, equal data structures have the
+    same digest whatever the order of their dict keys is
+    '''
+    return getattr(hashlib, sum_type)(_canonical(data)).hexdigest()
+
+
 def build_whitepace_splited_regex(text):
     '''
     Create a regular expression at runtime which should match ignoring the
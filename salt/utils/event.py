@@ -37,6 +37,7 @@ class SaltEvent(object):
         self.poller = zmq.Poller()
         self.cpub = False
         self.cpush = False
+        self.subscriptions = set()
         self.puburi, self.pulluri = self.__load_uri(sock_dir, node, **kwargs)
 
     def __load_uri(self, sock_dir, node, **kwargs):
@@ -88,6 +89,24 @@ class SaltEvent(object):
         self.poller.register(self.sub, zmq.POLLIN)
         self.cpub = True
 
+    def subscribe(self, tag=''):
+        '''
+        Subscribe to the events which start with the tag
+        '''
+        if not self.cpub:
+            self.connect_pub()
+        if tag not in self.subscriptions:
+            self.sub.setsockopt(zmq.SUBSCRIBE, tag)
+            self.subscriptions.add(tag)
+
+    def unsubscribe(self, tag=''):
+        '''
+        Stop receiving the events which start with the tag
+        '''
+        if tag in self.subscriptions:
+            self.sub.setsockopt(zmq.UNSUBSCRIBE, tag)
+            self.subscriptions.discard(tag)
+
     def connect_pull(self):
         '''
         Establish a connection with the event pull socket
@@ -101,9 +120,7 @@ class SaltEvent(object):
         Get a single publication
         '''
         wait = wait * 1000
-        if not self.cpub:
-            self.connect_pub()
-        self.sub.setsockopt(zmq.SUBSCRIBE, tag)
+        self.subscribe(tag)
         while True:
             socks = dict(self.poller.poll(wait))
             if self.sub in socks and socks[self.sub] == zmq.POLLIN:
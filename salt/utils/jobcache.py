@@ -0,0 +1,523 @@
+'''
+The master job cache stores the invocation and the returns of the jobs sent
+out by the master. The job cache backend is set with the job_cache_backend
+option:
+
+sqlite
+    The default, the jobs are kept in an indexed SQLite database in the
+    cachedir
+
+legacy
+    The jobs are kept in the directory tree under cachedir/jobs which was
+    used by older versions of salt
+'''
+
+# Import python libs
+import os
+import glob
+import shutil
+import logging
+import datetime
+import threading
+
+# Import salt libs
+import salt.payload
+import salt.utils
+import salt.utils.atomicfile
+
+log = logging.getLogger(__name__)
+
+# Import third party libs
+try:
+    import sqlite3
+    HAS_SQLITE = True
+except ImportError:
+    HAS_SQLITE = False
+
+
+class JobCache(object):
+    '''
+    The interface of the job cache backends
+    '''
+    def __init__(self, opts):
+        self.opts = opts
+        self.serial = salt.payload.Serial(opts)
+
+    def _cutoff(self):
+        '''
+        Return the job id prefix of the oldest hour of jobs which is kept
+        '''
+        oldest = datetime.datetime.now() - datetime.timedelta(
+                hours=self.opts['keep_jobs'])
+        return '{0:%Y%m%d%H}'.format(oldest)
+
+    def prep_jid(self):
+        '''
+        Return a new job id, the job is added to the cache
+        '''
+        raise NotImplementedError
+
+    def usable(self):
+        '''
+        Return False if the cache can not be read by this process
+        '''
+        return True
+
+    def jid_exists(self, jid):
+        '''
+        Return True if the job is in the cache
+        '''
+        raise NotImplementedError
+
+    def save_load(self, jid, load):
+        '''
+        Save the invocation information of a job, the job is added to the
+        cache if it is not present
+        '''
+        raise NotImplementedError
+
+    def get_load(self, jid):
+        '''
+        Return the invocation information of a job
+        '''
+        raise NotImplementedError
+
+    def save_return(self, jid, id_, ret, out=None):
+        '''
+        Save the return of a minion, False is returned if the minion has
+        already returned the job
+        '''
+        raise NotImplementedError
+
+    def get_minions(self, jid):
+        '''
+        Return the ids of the minions which have returned the job
+        '''
+        raise NotImplementedError
+
+    def get_returns(self, jid, skip=()):
+        '''
+        Return the returns of a job, keyed by minion id. The minions in skip
+        are left out.
+        '''
+        raise NotImplementedError
+
+    def list_jobs(self):
+        '''
+        Return the invocation information of all of the cached jobs, keyed by
+        job id
+        '''
+        raise NotImplementedError
+
+    def add_wtag(self, jid, id_):
+        '''
+        Mark that a syndic is writing the returns of a job
+        '''
+        raise NotImplementedError
+
+    def rm_wtag(self, jid, id_):
+        '''
+        Remove the write tag of a syndic
+        '''
+        raise NotImplementedError
+
+    def has_wtag(self, jid):
+        '''
+        Return True if a syndic is writing the returns of a job
+        '''
+        raise NotImplementedError
+
+    def clean_old_jobs(self):
+        '''
+        Remove the jobs older than keep_jobs hours, the number of removed
+        jobs is returned
+        '''
+        raise NotImplementedError
+
+
+class LegacyJobCache(JobCache):
+    '''
+    Keep the jobs in a directory per job id under cachedir/jobs, the job ids
+    are also indexed by the hour they were created in under
+    cachedir/jobs/.hours so that old jobs can be found without a scan of the
+    job directories
+    '''
+    def __init__(self, opts):
+        JobCache.__init__(self, opts)
+        self.root = os.path.join(self.opts['cachedir'], 'jobs')
+        self.hours = os.path.join(self.root, '.hours')
+
+    def _jid_dir(self, jid):
+        return salt.utils.jid_dir(
+                jid,
+                self.opts['cachedir'],
+                self.opts['hash_type']
+                )
+
+    def _index(self, jid):
+        '''
+        Add the job id to the index of the hour it was created in
+        '''
+        hour_dir = os.path.join(self.hours, jid[:10])
+        try:
+            os.makedirs(hour_dir)
+        except OSError:
+            # Another worker created the hour
+            pass
+        open(os.path.join(hour_dir, jid), 'w+').close()
+
+    def prep_jid(self):
+        jid = salt.utils.prep_jid(
+                self.opts['cachedir'],
+                self.opts['hash_type']
+                )
+        self._index(jid)
+        return jid
+
+    def jid_exists(self, jid):
+        return os.path.isdir(self._jid_dir(jid))
+
+    def save_load(self, jid, load):
+        jid_dir = self._jid_dir(jid)
+        if not os.path.isdir(jid_dir):
+            os.makedirs(jid_dir)
+            with open(os.path.join(jid_dir, 'jid'), 'w+') as fn_:
+                fn_.write(jid)
+            self._index(jid)
+        self.serial.dump(
+                load,
+                open(os.path.join(jid_dir, '.load.p'), 'w+')
+                )
+
+    def get_load(self, jid):
+        loadp = os.path.join(self._jid_dir(jid), '.load.p')
+        if not os.path.isfile(loadp):
+            return {}
+        return self.serial.load(open(loadp, 'rb'))
+
+    def save_return(self, jid, id_, ret, out=None):
+        hn_dir = os.path.join(self._jid_dir(jid), id_)
+        if os.path.isdir(hn_dir):
+            return False
+        os.makedirs(hn_dir)
+        self.serial.dump(
+            ret,
+            # Use atomic open here to avoid the file being read before it's
+            # completely written to. Refs #1935
+            salt.utils.atomicfile.atomic_open(
+                os.path.join(hn_dir, 'return.p'), 'w+'
+            )
+        )
+        if out is not None:
+            self.serial.dump(
+                out,
+                # Use atomic open here to avoid the file being read before
+                # it's completely written to. Refs #1935
+                salt.utils.atomicfile.atomic_open(
+                    os.path.join(hn_dir, 'out.p'), 'w+'
+                )
+            )
+        return True
+
+    def get_minions(self, jid):
+        jid_dir = self._jid_dir(jid)
+        if not os.path.isdir(jid_dir):
+            return []
+        return [fn_ for fn_ in os.listdir(jid_dir)
+                if not fn_.startswith('.')
+                and os.path.isdir(os.path.join(jid_dir, fn_))]
+
+    def get_returns(self, jid, skip=()):
+        jid_dir = self._jid_dir(jid)
+        ret = {}
+        for id_ in self.get_minions(jid):
+            if id_ in skip:
+                continue
+            retp = os.path.join(jid_dir, id_, 'return.p')
+            outp = os.path.join(jid_dir, id_, 'out.p')
+            if not os.path.isfile(retp):
+                continue
+            try:
+                ret[id_] = {'ret': self.serial.load(open(retp, 'rb'))}
+                if os.path.isfile(outp):
+                    ret[id_]['out'] = self.serial.load(open(outp, 'rb'))
+            except Exception:
+                # The return is picked up on the next read
+                ret.pop(id_, None)
+        return ret
+
+    def list_jobs(self):
+        ret = {}
+        if not os.path.isdir(self.root):
+            return ret
+        for top in os.listdir(self.root):
+            t_path = os.path.join(self.root, top)
+            if t_path == self.hours:
+                continue
+            for final in os.listdir(t_path):
+                loadp = os.path.join(t_path, final, '.load.p')
+                if not os.path.isfile(loadp):
+                    continue
+                try:
+                    load = self.serial.load(open(loadp, 'rb'))
+                except Exception:
+                    continue
+                ret[load['jid']] = load
+        return ret
+
+    def add_wtag(self, jid, id_):
+        wtag = os.path.join(self._jid_dir(jid), 'wtag_{0}'.format(id_))
+        with open(wtag, 'w+') as fp_:
+            fp_.write('')
+
+    def rm_wtag(self, jid, id_):
+        wtag = os.path.join(self._jid_dir(jid), 'wtag_{0}'.format(id_))
+        if os.path.isfile(wtag):
+            os.remove(wtag)
+
+    def has_wtag(self, jid):
+        return bool(glob.glob(os.path.join(self._jid_dir(jid), 'wtag*')))
+
+    def clean_old_jobs(self):
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        cutoff = self._cutoff()
+        scanned = os.path.join(self.hours, '.scanned')
+        if not os.path.isfile(scanned):
+            # The jobs cached before the hour index was added are only found
+            # by a scan of the job directories, this is done once
+            removed += self._scan_old_jobs(cutoff)
+            if not os.path.isdir(self.hours):
+                os.makedirs(self.hours)
+            open(scanned, 'w+').close()
+        for hour in os.listdir(self.hours):
+            if hour.startswith('.') or hour >= cutoff:
+                continue
+            h_path = os.path.join(self.hours, hour)
+            for jid in os.listdir(h_path):
+                jid_dir = self._jid_dir(jid)
+                if os.path.isdir(jid_dir):
+                    shutil.rmtree(jid_dir)
+                    removed += 1
+            shutil.rmtree(h_path)
+        return removed
+
+    def _scan_old_jobs(self, cutoff):
+        '''
+        Remove the old jobs found by a scan of all of the job directories
+        '''
+        removed = 0
+        for top in os.listdir(self.root):
+            t_path = os.path.join(self.root, top)
+            if t_path == self.hours:
+                continue
+            for final in os.listdir(t_path):
+                f_path = os.path.join(t_path, final)
+                jid_file = os.path.join(f_path, 'jid')
+                if not os.path.isfile(jid_file):
+                    continue
+                with open(jid_file, 'r') as fn_:
+                    jid = fn_.read()
+                if len(jid) < 18 or jid[:10] < cutoff:
+                    # Invalid jids are scrubbed as well
+                    shutil.rmtree(f_path)
+                    removed += 1
+        return removed
+
+
+class SQLiteJobCache(JobCache):
+    '''
+    Keep the jobs in an SQLite database in the cachedir, the database is
+    opened in write-ahead log mode so that the returns written by the master
+    workers do not block the clients reading them
+    '''
+    schema = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            jid TEXT PRIMARY KEY,
+            load BLOB);
+        CREATE TABLE IF NOT EXISTS returns (
+            jid TEXT,
+            id TEXT,
+            ret BLOB,
+            out BLOB,
+            PRIMARY KEY (jid, id));
+        CREATE TABLE IF NOT EXISTS wtags (
+            jid TEXT,
+            id TEXT,
+            PRIMARY KEY (jid, id));
+        '''
+
+    def __init__(self, opts):
+        JobCache.__init__(self, opts)
+        self.path = os.path.join(self.opts['cachedir'], 'jobs.db')
+        # SQLite connections can not be shared between threads or processes
+        self.local = threading.local()
+
+    def _conn(self):
+        '''
+        Return the connection of the current thread
+        '''
+        if getattr(self.local, 'pid', None) == os.getpid():
+            return self.local.conn
+        if os.path.isfile(self.path) and not os.access(self.path, os.W_OK):
+            # The cache is read by a user which can not write it, the
+            # database is left as the master set it up
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        else:
+            if not os.path.isdir(self.opts['cachedir']):
+                os.makedirs(self.opts['cachedir'])
+            conn = sqlite3.connect(
+                    self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.schema)
+        self.local.conn = conn
+        self.local.pid = os.getpid()
+        return conn
+
+    def usable(self):
+        try:
+            self._conn().execute('SELECT 1 FROM jobs LIMIT 1').fetchall()
+        except (OSError, sqlite3.Error) as exc:
+            log.debug('The job database can not be read: {0}'.format(exc))
+            return False
+        return True
+
+    def _dumps(self, obj):
+        return sqlite3.Binary(self.serial.dumps(obj))
+
+    def _loads(self, blob):
+        return self.serial.loads(str(blob))
+
+    def prep_jid(self):
+        while True:
+            jid = salt.utils.gen_jid()
+            cur = self._conn().execute(
+                    'INSERT OR IGNORE INTO jobs (jid) VALUES (?)',
+                    (jid,))
+            if cur.rowcount:
+                return jid
+
+    def jid_exists(self, jid):
+        cur = self._conn().execute(
+                'SELECT 1 FROM jobs WHERE jid = ?',
+                (jid,))
+        return cur.fetchone() is not None
+
+    def save_load(self, jid, load):
+        self._conn().execute(
+                'INSERT OR REPLACE INTO jobs (jid, load) VALUES (?, ?)',
+                (jid, self._dumps(load)))
+
+    def get_load(self, jid):
+        row = self._conn().execute(
+                'SELECT load FROM jobs WHERE jid = ?',
+                (jid,)).fetchone()
+        if row is None or row[0] is None:
+            return {}
+        return self._loads(row[0])
+
+    def save_return(self, jid, id_, ret, out=None):
+        if out is not None:
+            out = self._dumps(out)
+        try:
+            self._conn().execute(
+                    'INSERT INTO returns (jid, id, ret, out) '
+                    'VALUES (?, ?, ?, ?)',
+                    (jid, id_, self._dumps(ret), out))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def get_minions(self, jid):
+        cur = self._conn().execute(
+                'SELECT id FROM returns WHERE jid = ?',
+                (jid,))
+        return [row[0] for row in cur]
+
+    def get_returns(self, jid, skip=()):
+        ret = {}
+        cur = self._conn().execute(
+                'SELECT id, ret, out FROM returns WHERE jid = ?', (jid,))
+        for id_, ret_, out in cur:
+            if id_ in skip:
+                continue
+            ret[id_] = {'ret': self._loads(ret_)}
+            if out is not None:
+                ret[id_]['out'] = self._loads(out)
+        return ret
+
+    def list_jobs(self):
+        cur = self._conn().execute(
+                'SELECT jid, load FROM jobs WHERE load IS NOT NULL')
+        return dict((jid, self._loads(load)) for jid, load in cur)
+
+    def add_wtag(self, jid, id_):
+        self._conn().execute(
+                'INSERT OR IGNORE INTO wtags (jid, id) VALUES (?, ?)',
+                (jid, id_))
+
+    def rm_wtag(self, jid, id_):
+        self._conn().execute(
+                'DELETE FROM wtags WHERE jid = ? AND id = ?',
+                (jid, id_))
+
+    def has_wtag(self, jid):
+        cur = self._conn().execute(
+                'SELECT 1 FROM wtags WHERE jid = ?',
+                (jid,))
+        return cur.fetchone() is not None
+
+    def clean_old_jobs(self):
+        # Job ids start with the hour the job was created in, the primary key
+        # indexes find the jobs of the expired hours without a scan of the
+        # tables
+        cutoff = self._cutoff()
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            removed = conn.execute(
+                    'DELETE FROM jobs WHERE jid < ?',
+                    (cutoff,)).rowcount
+            conn.execute('DELETE FROM returns WHERE jid < ?', (cutoff,))
+            conn.execute('DELETE FROM wtags WHERE jid < ?', (cutoff,))
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return removed
+
+
+BACKENDS = {'legacy': LegacyJobCache}
+if HAS_SQLITE:
+    BACKENDS['sqlite'] = SQLiteJobCache
+
+
+def register_backend(name, backend):
+    '''
+    Register a job cache backend class under the given name, it can then be
+    selected with the job_cache_backend option
+    '''
+    BACKENDS[name] = backend
+
+
+def get_job_cache(opts):
+    '''
+    Return the job cache backend set in the job_cache_backend option
+    '''
+    name = opts.get('job_cache_backend', 'sqlite')
+    if name not in BACKENDS:
+        log.warning(
+            'The job cache backend {0} is unavailable, falling back to the '
+            'legacy job cache'.format(name)
+        )
+        name = 'legacy'
+    job_cache = BACKENDS[name](opts)
+    if not job_cache.usable():
+        log.warning(
+            'The {0} job cache can not be read, falling back to the legacy '
+            'job cache'.format(name)
+        )
+        job_cache = LegacyJobCache(opts)
+    return job_cache
@@ -4,12 +4,370 @@ expected to return
 '''
 # Import Python libs
 import os
-import glob
+import time
+import socket
+import struct
+import bisect
 import fnmatch
 import re
+import threading
 
 # Import Salt libs
+import salt.utils
 import salt.payload
+import salt.utils.atomicfile
+
+# The minion registries of the process, by pki_dir
+REGISTRIES = {}
+# The minion data indexes of the process, by cachedir
+DATA_INDEXES = {}
+# The name of the minion data cache journal and the size it is replaced at
+JOURNAL = '.journal'
+JOURNAL_SIZE = 1048576
+
+
+def get_registry(opts):
+    '''
+    Return the minion registry of the pki_dir, the registry is shared by all of
+    the CkMinions of the process
+    '''
+    if opts['pki_dir'] not in REGISTRIES:
+        REGISTRIES[opts['pki_dir']] = MinionRegistry(opts['pki_dir'])
+    return REGISTRIES[opts['pki_dir']]
+
+
+class MinionRegistry(object):
+    '''
+    Keep the sorted ids of the accepted minions in memory, the ids are only
+    listed again when the mtime of the accepted keys directory changes
+    '''
+    def __init__(self, pki_dir):
+        self.path = os.path.join(pki_dir, 'minions')
+        self.mtime = None
+        self.settled = False
+        self.ids = []
+        self.idset = frozenset()
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        '''
+        List the accepted keys again if they have changed
+        '''
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        with self.lock:
+            if mtime == self.mtime and self.settled:
+                return
+            if mtime is None:
+                ids = []
+            else:
+                ids = sorted(os.listdir(self.path))
+            self.ids = ids
+            self.idset = frozenset(ids)
+            self.mtime = mtime
+            # A key accepted in the same second as the listing does not
+            # always move the mtime, keep listing until the mtime is old
+            self.settled = mtime is None or time.time() - mtime > 1
+
+    def minions(self):
+        '''
+        Return the ids of all of the accepted minions
+        '''
+        self.refresh()
+        return list(self.ids)
+
+    def glob(self, expr):
+        '''
+        Return the ids which match the glob, only the ids which start with
+        the literal prefix of the glob are compared
+        '''
+        self.refresh()
+        ids = self.ids
+        prefix = re.split(r'[*?[]', expr, 1)[0]
+        if prefix == expr:
+            if expr in self.idset:
+                return [expr]
+            return []
+        ret = []
+        for ind in range(bisect.bisect_left(ids, prefix), len(ids)):
+            id_ = ids[ind]
+            if not id_.startswith(prefix):
+                break
+            if id_.startswith('.') and not expr.startswith('.'):
+                # Like glob, wildcards do not match hidden files
+                continue
+            if fnmatch.fnmatchcase(id_, expr):
+                ret.append(id_)
+        return ret
+
+    def pcre(self, expr):
+        '''
+        Return the ids which match the regular expression
+        '''
+        self.refresh()
+        reg = re.compile(expr)
+        return [id_ for id_ in self.ids if reg.match(id_)]
+
+    def list(self, expr):
+        '''
+        Return the ids found in the list, which can be a comma delimited
+        string
+        '''
+        self.refresh()
+        if isinstance(expr, basestring):
+            expr = expr.split(',')
+        return sorted(set(expr).intersection(self.idset))
+
+
+def journal(opts, id_):
+    '''
+    Record in the minion data cache journal that the cached data of the minion
+    changed, the data indexes of the master processes read the journal to
+    stay up to date
+    '''
+    path = os.path.join(opts['cachedir'], 'minions', JOURNAL)
+    try:
+        if os.path.getsize(path) > JOURNAL_SIZE:
+            # Replace the journal by an empty file, the indexes notice the
+            # new inode and are built again
+            tmp = '{0}.{1}'.format(path, os.getpid())
+            open(tmp, 'w+').close()
+            os.rename(tmp, path)
+    except OSError:
+        pass
+    with open(path, 'a') as fp_:
+        fp_.write('{0}\n'.format(id_))
+
+
+def data_digest(opts, id_):
+    '''
+    Return the digest of the cached data of the minion without reading the
+    data, an empty string is returned if the minion has no digest
+    '''
+    path = os.path.join(opts['cachedir'], 'minions', id_, 'data.digest')
+    try:
+        with open(path, 'rb') as fp_:
+            return fp_.read().strip()
+    except (IOError, OSError):
+        return ''
+
+
+def save_data(opts, id_, grains, pillar):
+    '''
+    Write the grains and pillar of the minion to the minion data cache, the
+    data is only written and journaled if its digest changed. Return True if
+    the data was written.
+    '''
+    digest = salt.utils.digest_data({'grains': grains, 'pillar': pillar})
+    if digest == data_digest(opts, id_):
+        return False
+    cdir = os.path.join(opts['cachedir'], 'minions', id_)
+    if not os.path.isdir(cdir):
+        os.makedirs(cdir)
+    salt.payload.Serial(opts).dump(
+            {'grains': grains, 'pillar': pillar},
+            salt.utils.atomicfile.atomic_open(
+                os.path.join(cdir, 'data.p'), 'w+b'))
+    # The digest is written last, a failed write is written again next time
+    with salt.utils.atomicfile.atomic_open(
+            os.path.join(cdir, 'data.digest'), 'w+') as fp_:
+        fp_.write(digest)
+    journal(opts, id_)
+    return True
+
+
+def load_grains(opts, id_, digest):
+    '''
+    Return the grains of the minion from the minion data cache if they have
+    the digest, None is returned otherwise
+    '''
+    datap = os.path.join(opts['cachedir'], 'minions', id_, 'data.p')
+    try:
+        grains = salt.payload.Serial(opts).load(open(datap, 'rb'))['grains']
+    except Exception:
+        return None
+    if not isinstance(grains, dict):
+        return None
+    if salt.utils.digest_data(grains) != digest:
+        return None
+    return grains
+
+
+def get_data_index(opts):
+    '''
+    Return the index of the minion data cache, the index is shared by all of
+    the CkMinions of the process
+    '''
+    if opts['cachedir'] not in DATA_INDEXES:
+        DATA_INDEXES[opts['cachedir']] = DataIndex(opts)
+    return DATA_INDEXES[opts['cachedir']]
+
+
+def _ipv4_net(tgt):
+    '''
+    Return the network address and mask of an IPv4 address or CIDR, None is
+    returned if the target is not IPv4
+    '''
+    addr, _, bits = tgt.partition('/')
+    try:
+        addr = struct.unpack('!I', socket.inet_aton(addr))[0]
+        bits = int(bits or 32)
+    except (socket.error, ValueError):
+        return None
+    if not 0 <= bits <= 32:
+        return None
+    mask = (0xffffffff << (32 - bits)) & 0xffffffff
+    return addr & mask, mask
+
+
+def _in_ipv4_net(addr, net):
+    try:
+        addr = struct.unpack('!I', socket.inet_aton(addr))[0]
+    except socket.error:
+        return False
+    return addr & net[1] == net[0]
+
+
+class DataIndex(object):
+    '''
+    Map the top level grain and pillar values in the minion data cache to the
+    minions which have them. The index is built from the cached data of every
+    minion once, after that only the minions named in the journal since the
+    last look are read again. The values are kept lowercased as they are
+    matched without regard to case.
+    '''
+    sections = ('grains', 'pillar')
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.serial = salt.payload.Serial(opts)
+        self.cdir = os.path.join(opts['cachedir'], 'minions')
+        self.path = os.path.join(self.cdir, JOURNAL)
+        self.inode = None
+        self.offset = 0
+        self.built = False
+        # (section, key) -> lowercased value -> minion ids
+        self.index = {}
+        # minion id -> ((section, key), lowercased value) pairs of the minion
+        self.entries = {}
+        # minion id -> digest of the indexed data
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        '''
+        Read the changes recorded in the journal since the last refresh
+        '''
+        try:
+            stat = os.stat(self.path)
+            inode, size = stat.st_ino, stat.st_size
+        except OSError:
+            inode, size = None, 0
+        with self.lock:
+            if not self.built or inode != self.inode or size < self.offset:
+                self._build(inode, size)
+            elif size > self.offset:
+                self._replay(size)
+
+    def _build(self, inode, size):
+        self.index = {}
+        self.entries = {}
+        self.digests = {}
+        self.inode = inode
+        self.offset = size
+        self.built = True
+        if not os.path.isdir(self.cdir):
+            return
+        for id_ in os.listdir(self.cdir):
+            if not id_ == JOURNAL:
+                self._load(id_)
+
+    def _replay(self, size):
+        with open(self.path, 'rb') as fp_:
+            fp_.seek(self.offset)
+            data = fp_.read(size - self.offset)
+        # Only complete lines are read, a line being written is read later
+        end = data.rfind('\n') + 1
+        self.offset += end
+        for id_ in set(data[:end].splitlines()):
+            if id_:
+                self._load(id_)
+
+    def _load(self, id_):
+        '''
+        Index the cached data of a minion again
+        '''
+        digest = data_digest(self.opts, id_)
+        if digest and id_ in self.entries and digest == self.digests.get(id_):
+            # The data did not change since it was indexed
+            return
+        self.digests.pop(id_, None)
+        for key, value in self.entries.pop(id_, ()):
+            ids = self.index[key][value]
+            ids.discard(id_)
+            if not ids:
+                del self.index[key][value]
+        datap = os.path.join(self.cdir, id_, 'data.p')
+        try:
+            data = self.serial.load(open(datap, 'rb'))
+        except Exception:
+            return
+        if not isinstance(data, dict) or not isinstance(
+                data.get('grains'), dict):
+            return
+        entries = set()
+        for section in self.sections:
+            if not isinstance(data.get(section), dict):
+                continue
+            for key, value in data[section].items():
+                if isinstance(value, list):
+                    values = [str(member).lower() for member in value]
+                else:
+                    values = [str(value).lower()]
+                for value in values:
+                    entries.add(((section, key), value))
+        for key, value in entries:
+            self.index.setdefault(key, {}).setdefault(value, set()).add(id_)
+        self.entries[id_] = entries
+        self.digests[id_] = digest
+
+    def match(self, key, pattern, pcre=False, section='grains'):
+        '''
+        Return the ids of the cached minions and the ids of the cached minions
+        with a value of the key which matches the glob or regular expression
+        '''
+        self.refresh()
+        with self.lock:
+            values = self.index.get((section, key), {})
+            pattern = pattern.lower()
+            if pcre:
+                reg = re.compile(pattern)
+                found = [value for value in values if reg.match(value)]
+            elif re.search(r'[*?[]', pattern):
+                found = fnmatch.filter(values, pattern)
+            else:
+                found = [pattern] if pattern in values else []
+            matched = set()
+            for value in found:
+                matched.update(values[value])
+            return set(self.entries), matched
+
+    def find(self, key, test, section='grains'):
+        '''
+        Return the ids of the cached minions, the ids of the cached minions
+        which have the key and the ids of those with a value passing the test
+        '''
+        self.refresh()
+        with self.lock:
+            found = set()
+            matched = set()
+            for value, ids in self.index.get((section, key), {}).items():
+                found.update(ids)
+                if test(value):
+                    matched.update(ids)
+            return set(self.entries), found, matched
 
 
 class CkMinions(object):
@@ -19,129 +377,143 @@ class CkMinions(object):
     def __init__(self, opts):
         self.opts = opts
         self.serial = salt.payload.Serial(opts)
+        self.registry = get_registry(opts)
 
     def _check_glob_minions(self, expr):
         '''
         Return the minions found by looking via globs
         '''
-        cwd = os.getcwd()
-        os.chdir(os.path.join(self.opts['pki_dir'], 'minions'))
-        ret = set(glob.glob(expr))
-        os.chdir(cwd)
-        return list(ret)
+        return self.registry.glob(expr)
 
     def _check_list_minions(self, expr):
         '''
         Return the minions found by looking via a list
         '''
-        ret = []
-        for fn_ in os.listdir(os.path.join(self.opts['pki_dir'], 'minions')):
-            if fn_ in expr:
-                if fn_ not in ret:
-                    ret.append(fn_)
-        return ret
+        return self.registry.list(expr)
 
     def _check_pcre_minions(self, expr):
         '''
         Return the minions found by looking via regular expressions
         '''
-        ret = set()
-        cwd = os.getcwd()
-        os.chdir(os.path.join(self.opts['pki_dir'], 'minions'))
-        reg = re.compile(expr)
-        for fn_ in os.listdir('.'):
-            if reg.match(fn_):
-                ret.add(fn_)
-        os.chdir(cwd)
-        return list(ret)
+        return self.registry.pcre(expr)
+
+    def _check_data_minions(self, expr, pcre=False, section='grains'):
+        '''
+        Return the minions which match the grain or pillar expression and the
+        minions it is unknown of as they are not in the data cache
+        '''
+        minions = set(self.registry.minions())
+        if not self.opts.get('minion_data_cache', False):
+            return set(), minions
+        comps = expr.split(':')
+        if len(comps) < 2:
+            return set(), minions
+        cached, matched = get_data_index(self.opts).match(
+                comps[0], comps[1], pcre, section)
+        return minions.intersection(matched), minions.difference(cached)
+
+    def _check_ipcidr_data(self, expr):
+        '''
+        Return the minions with a cached ipv4 address in the network and the
+        minions it is unknown of
+        '''
+        minions = set(self.registry.minions())
+        net = _ipv4_net(expr)
+        if net is None or not self.opts.get('minion_data_cache', False):
+            return set(), minions
+        cached, found, matched = get_data_index(self.opts).find(
+                'ipv4', lambda addr: _in_ipv4_net(addr, net))
+        return (minions.intersection(matched),
+                minions.difference(cached.intersection(found)))
 
     def _check_grain_minions(self, expr):
         '''
         Return the minions found by looking via a list
         '''
-        minions = set(os.listdir(os.path.join(self.opts['pki_dir'], 'minions')))
-        if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if not id_ in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                grains = self.serial.load(open(datap)).get('grains')
-                comps = expr.split(':')
-                if len(comps) < 2:
-                    continue
-                if comps[0] not in grains:
-                    minions.remove(id_)
-                    continue
-                if isinstance(grains.get(comps[0]), list):
-                    # We are matching a single component to a single list member
-                    found = False
-                    for member in grains[comps[0]]:
-                        if fnmatch.fnmatch(str(member).lower(), comps[1].lower()):
-                            found = True
-                            break
-                    if found:
-                        continue
-                    minions.remove(id_)
-                    continue
-                if fnmatch.fnmatch(
-                    str(grains.get(comps[0], '').lower()),
-                    comps[1].lower(),
-                    ):
-                    continue
-                else:
-                    minions.remove(id_)
-        return list(minions)
+        return list(set().union(*self._check_data_minions(expr)))
 
     def _check_grain_pcre_minions(self, expr):
         '''
         Return the minions found by looking via a list
         '''
-        minions = set(os.listdir(os.path.join(self.opts['pki_dir'], 'minions')))
-        if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions')
-            if not os.path.isdir(cdir):
-                return list(minions)
-            for id_ in os.listdir(cdir):
-                if not id_ in minions:
-                    continue
-                datap = os.path.join(cdir, id_, 'data.p')
-                if not os.path.isfile(datap):
-                    continue
-                grains = self.serial.load(open(datap)).get('grains')
-                comps = expr.split(':')
-                if len(comps) < 2:
-                    continue
-                if comps[0] not in grains:
-                    minions.remove(id_)
-                if isinstance(grains[comps[0]], list):
-                    # We are matching a single component to a single list member
-                    found = False
-                    for member in grains[comps[0]]:
-                        if re.match(comps[1].lower(), str(member).lower()):
-                            found = True
-                    if found:
-                        continue
-                    minions.remove(id_)
-                    continue
-                if re.match(
-                    comps[1].lower(),
-                    str(grains[comps[0]]).lower()
-                    ):
-                    continue
-                else:
-                    minions.remove(id_)
-        return list(minions)
+        return list(set().union(*self._check_data_minions(expr, True)))
+
+    def _check_pillar_minions(self, expr):
+        '''
+        Return the minions found by looking via the cached pillar
+        '''
+        return list(set().union(*self._check_data_minions(
+            expr, section='pillar')))
+
+    def _check_ipcidr_minions(self, expr):
+        '''
+        Return the minions found by looking via the cached ip addresses
+        '''
+        return list(set().union(*self._check_ipcidr_data(expr)))
+
+    def _check_compound_minions(self, expr):
+        '''
+        Return the minions found by evaluating the compound expression against
+        the cached data, a minion is kept if the expression is true for it or
+        unknown as it lacks cached data
+        '''
+        minions = set(self.registry.minions())
+        ref = {'G': lambda tgt: self._check_data_minions(tgt),
+               'P': lambda tgt: self._check_data_minions(tgt, True),
+               'I': lambda tgt: self._check_data_minions(
+                   tgt, section='pillar'),
+               'S': self._check_ipcidr_data,
+               'X': lambda tgt: (set(), minions),
+               'L': lambda tgt: (set(self._check_list_minions(tgt)), set()),
+               'E': lambda tgt: (set(self._check_pcre_minions(tgt)), set())}
+        tokens = expr.split()
+        if not tokens:
+            return list(minions)
+
+        def term():
+            token = tokens.pop(0)
+            if token == 'not':
+                yes, maybe = term()
+                return minions.difference(yes, maybe), maybe
+            if token in ('and', 'or'):
+                raise ValueError('Unexpected {0} in {1}'.format(token, expr))
+            if '@' in token and token[1] == '@':
+                comps = token.split('@')
+                if comps[0] not in ref:
+                    raise ValueError('Unknown matcher {0}'.format(comps[0]))
+                return ref[comps[0]]('@'.join(comps[1:]))
+            return set(self._check_glob_minions(token)), set()
+
+        def and_term():
+            yes, maybe = term()
+            while tokens and tokens[0] == 'and':
+                tokens.pop(0)
+                r_yes, r_maybe = term()
+                maybe = yes.union(maybe).intersection(r_yes.union(r_maybe))
+                yes = yes.intersection(r_yes)
+                maybe.difference_update(yes)
+            return yes, maybe
+
+        try:
+            yes, maybe = and_term()
+            while tokens and tokens[0] == 'or':
+                tokens.pop(0)
+                r_yes, r_maybe = and_term()
+                yes = yes.union(r_yes)
+                maybe = maybe.union(r_maybe).difference(yes)
+            if tokens:
+                raise ValueError(
+                    'Unexpected {0} in {1}'.format(tokens[0], expr))
+        except (IndexError, ValueError, re.error):
+            # The minions evaluate the expression themselves
+            return list(minions)
+        return list(yes.union(maybe))
 
     def _all_minions(self, expr=None):
         '''
         Return a list of all minions that have auth'd
         '''
-        return os.listdir(os.path.join(self.opts['pki_dir'], 'minions'))
+        return self.registry.minions()
 
     def check_minions(self, expr, expr_form='glob'):
         '''
@@ -156,9 +528,10 @@ class CkMinions(object):
                        'list': self._check_list_minions,
                        'grain': self._check_grain_minions,
                        'grain_pcre': self._check_grain_pcre_minions,
+                       'ipcidr': self._check_ipcidr_minions,
                        'exsel': self._all_minions,
-                       'pillar': self._all_minions,
-                       'compound': self._all_minions,
+                       'pillar': self._check_pillar_minions,
+                       'compound': self._check_compound_minions,
                       }[expr_form](expr)
         except Exception:
             minions = expr
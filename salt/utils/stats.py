@@ -0,0 +1,226 @@
+'''
+Collect counters and timings inside of the salt master processes, the
+figures are periodically written to the cachedir so that runners can report
+on them
+'''
+
+# Import python libs
+import os
+import time
+import bisect
+import logging
+import threading
+
+# Import salt libs
+import salt.payload
+import salt.utils.atomicfile
+
+log = logging.getLogger(__name__)
+
+
+def stats_dir(opts):
+    '''
+    Return the directory the stats snapshots are written to
+    '''
+    return os.path.join(opts['cachedir'], 'stats')
+
+
+def read(opts, name):
+    '''
+    Return the last snapshot written for the named stats, an empty dict is
+    returned if no snapshot is available
+    '''
+    path = os.path.join(stats_dir(opts), '{0}.p'.format(name))
+    if not os.path.isfile(path):
+        return {}
+    serial = salt.payload.Serial(opts)
+    try:
+        return serial.load(open(path, 'rb'))
+    except Exception:
+        log.debug('Failed to read stats snapshot {0}'.format(path))
+        return {}
+
+
+def names(opts, prefix=''):
+    '''
+    Return the names of the snapshots which start with the prefix
+    '''
+    try:
+        paths = os.listdir(stats_dir(opts))
+    except OSError:
+        return []
+    return sorted(
+        path[:-2] for path in paths
+        if path.startswith(prefix) and path.endswith('.p')
+    )
+
+
+def merge(snapshots):
+    '''
+    Add up the snapshots of several processes, the gauges and the peak
+    values are the largest of any of the processes
+    '''
+    ret = {'counters': {},
+           'gauges': {},
+           'timings': {},
+           'buckets': list(Stats.buckets),
+           'processes': 0}
+    for snapshot in snapshots:
+        if not snapshot:
+            continue
+        ret['processes'] += 1
+        for key, count in snapshot.get('counters', {}).items():
+            ret['counters'][key] = ret['counters'].get(key, 0) + count
+        for key, value in snapshot.get('gauges', {}).items():
+            ret['gauges'][key] = max(ret['gauges'].get(key, value), value)
+        for key, timing in snapshot.get('timings', {}).items():
+            if key not in ret['timings']:
+                ret['timings'][key] = {'count': 0,
+                                       'total': 0.0,
+                                       'max': 0.0,
+                                       'avg': 0.0}
+            merged = ret['timings'][key]
+            merged['count'] += timing['count']
+            merged['total'] += timing['total']
+            merged['max'] = max(merged['max'], timing['max'])
+            if merged['count']:
+                merged['avg'] = merged['total'] / merged['count']
+            if 'histogram' in timing:
+                histogram = merged.setdefault(
+                        'histogram', [0] * len(timing['histogram']))
+                for ind, count in enumerate(timing['histogram']):
+                    histogram[ind] += count
+    return ret
+
+
+class Stats(object):
+    '''
+    Keep the counters, gauges and timings of a running process
+    '''
+    # The upper bounds in seconds of the buckets of the timing histograms,
+    # the last bucket holds the durations above the last bound
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+    def __init__(self, opts, name, interval=10):
+        self.opts = opts
+        self.name = name
+        self.interval = interval
+        self.serial = salt.payload.Serial(opts)
+        self.path = os.path.join(stats_dir(opts), '{0}.p'.format(name))
+        self.start = time.time()
+        self.last_flush = 0
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+        # The figures can be recorded from the threads of a worker pool
+        self.lock = threading.Lock()
+
+    def inc(self, key, count=1):
+        '''
+        Increment a counter
+        '''
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + count
+
+    def gauge(self, key, value):
+        '''
+        Set a gauge to the current value, the peak value is also kept
+        '''
+        with self.lock:
+            self.gauges[key] = value
+            peak = '{0}_max'.format(key)
+            if value > self.gauges.get(peak, 0):
+                self.gauges[peak] = value
+
+    def observe(self, key, value):
+        '''
+        Record a value such as the size of a payload, the count, total,
+        average and largest value are kept
+        '''
+        with self.lock:
+            self._observe(key, value)
+
+    def _observe(self, key, value):
+        if key not in self.timings:
+            self.timings[key] = {'count': 0,
+                                 'total': 0.0,
+                                 'max': 0.0,
+                                 'avg': 0.0}
+        timing = self.timings[key]
+        timing['count'] += 1
+        timing['total'] += value
+        timing['avg'] = timing['total'] / timing['count']
+        if value > timing['max']:
+            timing['max'] = value
+        return timing
+
+    def timing(self, key, seconds):
+        '''
+        Record the duration of an operation, the durations are also counted
+        in a histogram
+        '''
+        with self.lock:
+            timing = self._observe(key, seconds)
+            histogram = timing.setdefault(
+                    'histogram', [0] * (len(self.buckets) + 1))
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def request(self, key, seconds, size_in=0, size_out=0, error=False):
+        '''
+        Record a handled request, the latency, the request and reply sizes and
+        the number of failed requests are kept for the key
+        '''
+        self.timing(key, seconds)
+        self.observe('{0}:size_in'.format(key), size_in)
+        self.observe('{0}:size_out'.format(key), size_out)
+        if error:
+            self.inc('{0}:errors'.format(key))
+
+    def average(self, key, default=0.0):
+        '''
+        Return the average duration recorded for the key
+        '''
+        if key not in self.timings:
+            return default
+        return self.timings[key]['avg']
+
+    def snapshot(self):
+        '''
+        Return the current figures
+        '''
+        with self.lock:
+            return {'name': self.name,
+                    'pid': os.getpid(),
+                    'time': time.time(),
+                    'uptime': time.time() - self.start,
+                    'buckets': list(self.buckets),
+                    'counters': dict(self.counters),
+                    'gauges': dict(self.gauges),
+                    'timings': dict(
+                        (key, dict(timing))
+                        for key, timing in self.timings.items())}
+
+    def flush(self, force=False):
+        '''
+        Write a snapshot to the cachedir if the interval has passed since the
+        last snapshot was written
+        '''
+        now = time.time()
+        if not force and now - self.last_flush < self.interval:
+            return False
+        self.last_flush = now
+        try:
+            if not os.path.isdir(stats_dir(self.opts)):
+                os.makedirs(stats_dir(self.opts))
+            self.serial.dump(
+                self.snapshot(),
+                salt.utils.atomicfile.atomic_open(self.path, 'w+b')
+            )
+        except (IOError, OSError) as exc:
+            log.warning(
+                'Failed to write stats snapshot {0}: {1}'.format(
+                    self.path, exc
+                )
+            )
+            return False
+        return True
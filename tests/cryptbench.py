@@ -0,0 +1,108 @@
+#/usr/bin/env python
+'''
+The cryptbench script times the encryption and decryption of payloads of
+different sizes with the salt Crypticle, the single pass implementation used
+before payloads were encrypted in chunks is timed alongside for comparison
+'''
+
+# Import Python Libs
+import os
+import hmac
+import time
+import hashlib
+import optparse
+
+# Import third party libs
+from Crypto.Cipher import AES
+
+# Import salt libs
+import salt.crypt
+
+
+def parse():
+    '''
+    Parse the cli options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-s',
+            '--sizes',
+            dest='sizes',
+            default='1024,65536,1048576,8388608',
+            help='A comma delimited list of payload sizes in bytes')
+    parser.add_option('-i',
+            '--iterations',
+            dest='iterations',
+            default=20,
+            type='int',
+            help='The number of times to run each operation')
+
+    options, args = parser.parse_args()
+    return options
+
+
+def single_pass_encrypt(keys, data):
+    '''
+    Encrypt the way Crypticle did before payloads were encrypted in chunks
+    '''
+    aes_key, hmac_key = keys
+    pad = 16 - len(data) % 16
+    data = data + pad * chr(pad)
+    iv_bytes = os.urandom(16)
+    cypher = AES.new(aes_key, AES.MODE_CBC, iv_bytes)
+    data = iv_bytes + cypher.encrypt(data)
+    sig = hmac.new(hmac_key, data, hashlib.sha256).digest()
+    return data + sig
+
+
+def single_pass_decrypt(keys, data):
+    '''
+    Decrypt the way Crypticle did before payloads were encrypted in chunks
+    '''
+    aes_key, hmac_key = keys
+    sig = data[-32:]
+    data = data[:-32]
+    mac_bytes = hmac.new(hmac_key, data, hashlib.sha256).digest()
+    result = 0
+    for x, y in zip(mac_bytes, sig):
+        result |= ord(x) ^ ord(y)
+    if result != 0:
+        raise ValueError('message authentication failed')
+    cypher = AES.new(aes_key, AES.MODE_CBC, data[:16])
+    data = cypher.decrypt(data[16:])
+    return data[:-ord(data[-1])]
+
+
+def time_it(func, iterations):
+    '''
+    Return the average number of seconds a call takes
+    '''
+    start = time.time()
+    for _ in range(iterations):
+        func()
+    return (time.time() - start) / iterations
+
+
+def main():
+    options = parse()
+    crypticle = salt.crypt.Crypticle(
+            {'serial': 'msgpack'},
+            salt.crypt.Crypticle.generate_key_string())
+    print('{0:>10} {1:>14} {2:>14} {3:>14} {4:>14}'.format(
+        'bytes', 'v1 enc ms', 'enc ms', 'v1 dec ms', 'dec ms'))
+    for size in [int(size) for size in options.sizes.split(',')]:
+        data = os.urandom(size)
+        payload = crypticle.encrypt(data)
+        results = [
+            time_it(lambda: single_pass_encrypt(crypticle.keys, data),
+                    options.iterations),
+            time_it(lambda: crypticle.encrypt(data), options.iterations),
+            time_it(lambda: single_pass_decrypt(crypticle.keys, payload),
+                    options.iterations),
+            time_it(lambda: crypticle.decrypt(payload), options.iterations),
+            ]
+        print('{0:>10} {1:>14.3f} {2:>14.3f} {3:>14.3f} {4:>14.3f}'.format(
+            size, *[result * 1000 for result in results]))
+
+
+if __name__ == '__main__':
+    main()
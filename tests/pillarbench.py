@@ -0,0 +1,126 @@
+#/usr/bin/env python
+'''
+The pillarbench script times the compilation of the pillar of many synthetic
+minions on the master, each minion is compiled with a new Pillar as before the
+loaded modules were reused and with the reused Pillar of the PillarCache
+'''
+
+# Import Python Libs
+import os
+import time
+import shutil
+import optparse
+import tempfile
+
+# Import salt libs
+import salt.config
+import salt.loader
+import salt.pillar
+
+TOP = '''base:
+  '*':
+    - common
+  'web*':
+    - web
+  'G@os:Debian':
+    - match: compound
+    - debian
+'''
+
+COMMON = '''id: {{ grains['id'] }}
+os: {{ grains['os'] }}
+ntp_servers:
+{% for ind in range(3) %}
+  - ntp{{ ind }}.example.com
+{% endfor %}
+'''
+
+WEB = '''web:
+  port: 80
+  workers: {{ grains['num_cpus'] * 2 }}
+'''
+
+DEBIAN = '''apt_mirror: http://ftp.debian.org/debian
+'''
+
+
+def parse():
+    '''
+    Parse the cli options
+    '''
+    parser = optparse.OptionParser()
+    parser.add_option('-m',
+            '--minions',
+            dest='minions',
+            default=1000,
+            type='int',
+            help='The number of minions to compile the pillar of')
+    parser.add_option('-c',
+            '--cold',
+            dest='cold',
+            default=50,
+            type='int',
+            help='The number of minions to compile with a new Pillar each')
+
+    options, args = parser.parse_args()
+    return options
+
+
+def make_roots(root):
+    '''
+    Write the pillar top file and sls files
+    '''
+    for name, data in (('top', TOP),
+                       ('common', COMMON),
+                       ('web', WEB),
+                       ('debian', DEBIAN)):
+        with open(os.path.join(root, '{0}.sls'.format(name)), 'w+') as fp_:
+            fp_.write(data)
+
+
+def minion_grains(base, ind):
+    '''
+    Return the grains of a synthetic minion
+    '''
+    grains = dict(base)
+    grains['id'] = '{0}{1}'.format(('web', 'db')[ind % 2], ind)
+    grains['os'] = ('Debian', 'CentOS', 'Ubuntu')[ind % 3]
+    grains['num_cpus'] = 1 + ind % 16
+    return grains
+
+
+def main():
+    options = parse()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        opts = salt.config.master_config('/etc/salt/master')
+        opts['pillar_roots'] = {'base': [os.path.join(tmpdir, 'pillar')]}
+        opts['cachedir'] = os.path.join(tmpdir, 'cache')
+        opts['extension_modules'] = os.path.join(tmpdir, 'extmods')
+        opts['pillar_cache_ttl'] = 0
+        os.makedirs(opts['pillar_roots']['base'][0])
+        make_roots(opts['pillar_roots']['base'][0])
+        base = salt.loader.grains(opts)
+        start = time.time()
+        for ind in range(options.cold):
+            grains = minion_grains(base, ind)
+            salt.pillar.Pillar(
+                    opts, grains, grains['id'], None).compile_pillar()
+        cold = (time.time() - start) / options.cold
+        cache = salt.pillar.PillarCache(opts)
+        start = time.time()
+        for ind in range(options.minions):
+            grains = minion_grains(base, ind)
+            cache.compile_pillar(grains, grains['id'], None)
+        reused = (time.time() - start) / options.minions
+    finally:
+        shutil.rmtree(tmpdir)
+    print('{0:>10} {1:>14} {2:>14}'.format('minions', 'new ms', 'reused ms'))
+    print('{0:>10} {1:>14.3f} {2:>14.3f}'.format(
+        options.minions, cold * 1000, reused * 1000))
+    print('{0} minions take {1:.1f}s with new and {2:.1f}s reused'.format(
+        options.minions, cold * options.minions, reused * options.minions))
+
+
+if __name__ == '__main__':
+    main()
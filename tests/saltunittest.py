@@ -45,6 +45,27 @@ for dir_ in [TEST_DIR, SALT_LIBS]:
         sys.path.insert(0, dir_)
 
 
+def write_master_config(root, **kwargs):
+    '''
+    Write the configuration file of a master which keeps all of its files
+    under root, kwargs are added to the options. The path of the file is
+    returned.
+    '''
+    import yaml
+    opts = {'cachedir': root,
+            'pki_dir': root,
+            'sock_dir': root,
+            'log_file': os.path.join(root, 'master.log'),
+            'key_logfile': os.path.join(root, 'key.log'),
+            'file_roots': {'base': [os.path.join(root, 'salt')]},
+            'pillar_roots': {'base': [os.path.join(root, 'pillar')]}}
+    opts.update(kwargs)
+    path = os.path.join(root, 'master')
+    with open(path, 'w+') as fp_:
+        yaml.safe_dump(opts, fp_, default_flow_style=False)
+    return path
+
+
 def destructiveTest(func):
     def wrap(cls):
         if os.environ.get('DESTRUCTIVE_TESTS', 'False').lower() == 'false':
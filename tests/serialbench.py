@@ -0,0 +1,121 @@
+#/usr/bin/env python
+'''
+The serialbench script compares the speed and size of the registered salt
+serializers on state run returns, pass the paths to return.p files from a
+master job cache to benchmark real data or a generated highstate return is
+used
+'''
+
+# Import Python Libs
+import os
+import time
+import optparse
+import tempfile
+
+# Import salt libs
+import salt.payload
+
+
+def parse():
+    '''
+    Parse the cli options
+    '''
+    parser = optparse.OptionParser(
+            usage='%prog [options] [return.p ...]')
+    parser.add_option('-s',
+            '--states',
+            dest='states',
+            default=500,
+            type='int',
+            help='The number of states in the generated state run return')
+    parser.add_option('-i',
+            '--iterations',
+            dest='iterations',
+            default=20,
+            type='int',
+            help='The number of times to run each operation')
+    parser.add_option('--serial',
+            dest='serial',
+            default='msgpack',
+            help='The serializer the return.p files were written with')
+
+    options, args = parser.parse_args()
+    return options, args
+
+
+def gen_state_return(states):
+    '''
+    Generate a return resembling a highstate run
+    '''
+    ret = {}
+    for ind in range(states):
+        name = '/etc/salt/managed/file_{0}.conf'.format(ind)
+        ret['file_|-{0}_|-{0}_|-managed'.format(name)] = {
+                'name': name,
+                'result': True,
+                'comment': 'File {0} updated'.format(name),
+                '__run_num__': ind,
+                'changes': {
+                    'diff': '--- \n+++ \n@@ -1,3 +1,3 @@\n'
+                            '-option = old\n+option = new\n' * 10,
+                    'mode': '0644',
+                    },
+                }
+    return {'return': ret, 'fun': 'state.highstate', 'id': 'bench-minion'}
+
+
+def time_it(func, iterations):
+    '''
+    Return the average number of seconds a call takes
+    '''
+    start = time.time()
+    for _ in range(iterations):
+        func()
+    return (time.time() - start) / iterations
+
+
+def bench(data, iterations):
+    '''
+    Run the benchmarks for all of the registered serializers on the data
+    '''
+    results = []
+    for name in salt.payload.available_serializers('msgpack'):
+        serial = salt.payload.Serial(name)
+        package = serial.dumps(data)
+        fd_, path = tempfile.mkstemp()
+        os.write(fd_, package)
+        os.close(fd_)
+        try:
+            dumps = time_it(lambda: serial.dumps(data), iterations)
+            loads = time_it(lambda: serial.loads(package), iterations)
+            load = time_it(lambda: serial.load(open(path, 'rb')), iterations)
+        finally:
+            os.remove(path)
+        results.append((name, len(package), dumps, loads, load))
+    return results
+
+
+def report(title, results):
+    print(title)
+    print('  {0:<10} {1:>12} {2:>12} {3:>12} {4:>12}'.format(
+        'serial', 'bytes', 'dumps ms', 'loads ms', 'load ms'))
+    for name, size, dumps, loads, load in results:
+        print('  {0:<10} {1:>12} {2:>12.3f} {3:>12.3f} {4:>12.3f}'.format(
+            name, size, dumps * 1000, loads * 1000, load * 1000))
+
+
+def main():
+    options, args = parse()
+    if args:
+        serial = salt.payload.Serial(options.serial)
+        for path in args:
+            report(path, bench(serial.load(open(path, 'rb')),
+                               options.iterations))
+    else:
+        report('Generated highstate return with {0} states'.format(
+                   options.states),
+               bench(gen_state_return(options.states), options.iterations))
+
+
+if __name__ == '__main__':
+    main()
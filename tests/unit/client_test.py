@@ -0,0 +1,130 @@
+'''
+Test the gathering of the job returns by the LocalClient and the
+AsyncLocalClient
+'''
+
+# Import python libs
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import (TestCase, TestLoader, TextTestRunner, skipIf,
+                          write_master_config)
+
+import salt.client
+
+# Import third party libs
+try:
+    from mock import patch
+    has_mock = True
+except ImportError:
+    has_mock = False
+
+
+class StubEvent(object):
+    '''
+    Hand out queued events the way the MasterEvent does
+    '''
+    def __init__(self, events):
+        self.events = events
+        self.subscriptions = set()
+
+    def subscribe(self, tag=''):
+        self.subscriptions.add(tag)
+
+    def unsubscribe(self, tag=''):
+        self.subscriptions.discard(tag)
+
+    def get_event(self, wait=5, tag='', full=False):
+        if self.events:
+            return self.events.pop(0)
+        return None
+
+
+@skipIf(has_mock is False, "mock python module is unavailable")
+class EventReturnsTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf_file = write_master_config(self.tmpdir)
+        self.client = self._client(salt.client.LocalClient)
+
+    def _client(self, cls):
+        # The master event bus is not running
+        with patch('salt.utils.event.MasterEvent'):
+            return cls(self.conf_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_full_returns(self):
+        jid = self.client.job_cache.prep_jid()
+        other = '20010101000000000000'
+        self.client.event_backlog[other] = []
+        # web1 returned before the client subscribed to the job
+        self.client.job_cache.save_return(jid, 'web1', True)
+        self.client.event = StubEvent([
+            {'tag': jid, 'data': {'id': 'web1', 'jid': jid, 'return': True}},
+            {'tag': other, 'data': {'id': 'web1', 'return': 'other'}},
+            {'tag': jid, 'data': {'id': 'web2', 'jid': jid, 'return': 2,
+                                  'out': 'txt'}},
+            ])
+        self.assertEqual(
+            self.client.get_full_returns(jid, ['web1', 'web2'], 5),
+            {'web1': {'ret': True}, 'web2': {'ret': 2, 'out': 'txt'}})
+        # The event of the other job is kept for it
+        self.assertEqual(len(self.client.event_backlog[other]), 1)
+        self.assertEqual(self.client.event.subscriptions, set())
+
+    def test_saved_returns(self):
+        # This is how the jobs runner looks up a finished job
+        jid = self.client.job_cache.prep_jid()
+        for ind in range(5):
+            self.client.job_cache.save_return(jid, 'web{0}'.format(ind), ind)
+        self.client.event = StubEvent([])
+        self.assertEqual(
+            self.client.get_full_returns(jid, [], 0),
+            dict(('web{0}'.format(ind), {'ret': ind}) for ind in range(5)))
+
+    def test_async_job(self):
+        client = self._client(salt.client.AsyncLocalClient)
+        done = []
+        job = salt.client.AsyncJob(client.job_cache.prep_jid(), 5)
+        job.add_done_callback(done.append)
+        job.minions.update(['web1', 'web2'])
+        job.published = True
+        client.jobs[job.jid] = job
+        client._dispatch(job, {'id': 'web1', 'return': True})
+        self.assertFalse(job.done())
+        # web2 returned while its event was missed
+        client.job_cache.save_return(job.jid, 'web2', False)
+        job.start -= 10
+        client._expire()
+        self.assertTrue(job.done())
+        self.assertEqual(done, [job])
+        self.assertEqual(job.result(), {'web1': True, 'web2': False})
+        self.assertEqual(
+            sorted(list(job)),
+            [{'web1': {'ret': True}}, {'web2': {'ret': False}}])
+        self.assertEqual(client.jobs, {})
+
+    def test_async_early_return(self):
+        client = self._client(salt.client.AsyncLocalClient)
+
+        def pub(tgt, fun, arg, expr_form, ret, jid, timeout, **kwargs):
+            # web1 returned before the publication was acknowledged
+            client.job_cache.save_return(jid, 'web1', True)
+            return {'jid': jid, 'minions': ['web1']}
+
+        client.pub = pub
+        # The reader is not started, the events are not received
+        with patch.object(client, '_start_reader'):
+            job = client.submit('web1', 'test.ping')
+        self.assertTrue(job.done())
+        self.assertEqual(job.result(), {'web1': True})
+        self.assertEqual(client.jobs, {})
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(EventReturnsTest)
+    TextTestRunner(verbosity=1).run(tests)
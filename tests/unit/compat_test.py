@@ -0,0 +1,30 @@
+'''
+Test the python compatibility helpers
+'''
+
+# Import Salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+
+from salt._compat import _OrderedDict
+
+
+class OrderedDictTest(TestCase):
+    def test_lru(self):
+        lru = _OrderedDict()
+        for key in ('a', 'b', 'c'):
+            lru[key] = key.upper()
+        # Move a to the most recently used end
+        lru['a'] = lru.pop('a')
+        self.assertEqual(lru.keys(), ['b', 'c', 'a'])
+        self.assertEqual(lru.popitem(last=False), ('b', 'B'))
+        self.assertEqual(lru.popitem(), ('a', 'A'))
+        self.assertEqual(lru.pop('missing', None), None)
+        del lru['c']
+        self.assertEqual((len(lru), list(lru)), (0, []))
+        self.assertRaises(KeyError, lru.popitem)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(OrderedDictTest)
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,169 @@
+'''
+Test the salt crypticle payload envelope
+'''
+
+# Import Python libs
+import os
+import hmac
+import shutil
+import hashlib
+import tempfile
+
+# Import Third Party libs
+from Crypto.Cipher import AES
+from M2Crypto import RSA
+
+# Import Salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+
+import salt.crypt
+from salt.exceptions import AuthenticationError
+
+
+def v1_encrypt(keys, data):
+    '''
+    The single pass encryption used before payloads were encrypted in chunks
+    '''
+    aes_key, hmac_key = keys
+    pad = 16 - len(data) % 16
+    data = data + pad * chr(pad)
+    iv_bytes = os.urandom(16)
+    cypher = AES.new(aes_key, AES.MODE_CBC, iv_bytes)
+    data = iv_bytes + cypher.encrypt(data)
+    return data + hmac.new(hmac_key, data, hashlib.sha256).digest()
+
+
+def v1_decrypt(keys, data):
+    aes_key, hmac_key = keys
+    sig = data[-32:]
+    data = data[:-32]
+    assert hmac.new(hmac_key, data, hashlib.sha256).digest() == sig
+    cypher = AES.new(aes_key, AES.MODE_CBC, data[:16])
+    data = cypher.decrypt(data[16:])
+    return data[:-ord(data[-1])]
+
+
+class CrypticleTest(TestCase):
+    def setUp(self):
+        self.key = salt.crypt.Crypticle.generate_key_string()
+        self.opts = {'serial': 'msgpack',
+                     'payload_compress_threshold': 1024}
+        self.data = {'return': dict(('state_{0}'.format(ind), 'x' * 100)
+                                    for ind in range(100))}
+
+    def test_legacy_envelope(self):
+        crypticle = salt.crypt.Crypticle(self.opts, self.key)
+        payload = crypticle.dumps(self.data)
+        self.assertTrue(
+            crypticle.decrypt(payload).startswith(crypticle.PICKLE_PAD))
+        self.assertEqual(crypticle.loads_envelope(payload), (self.data, False))
+
+    def test_compressed_envelope(self):
+        sender = salt.crypt.Crypticle(self.opts, self.key, peer_compress=True)
+        receiver = salt.crypt.Crypticle(self.opts, self.key)
+        payload = sender.dumps(self.data)
+        self.assertTrue(
+            sender.decrypt(payload).startswith(sender.ZLIB_PAD))
+        self.assertEqual(sender.stats['compressed'], 1)
+        self.assertTrue(sender.stats['bytes_out'] < sender.stats['bytes_in'])
+        self.assertEqual(receiver.loads_envelope(payload), (self.data, True))
+        self.assertEqual(receiver.stats['decompressed'], 1)
+
+    def test_small_payload_not_compressed(self):
+        sender = salt.crypt.Crypticle(self.opts, self.key, peer_compress=True)
+        payload = sender.dumps({'small': True})
+        self.assertTrue(sender.decrypt(payload).startswith(sender.RAW_PAD))
+        self.assertEqual(sender.loads(payload), {'small': True})
+
+    def test_target_signature(self):
+        crypticle = salt.crypt.Crypticle(self.opts, self.key)
+        payload = crypticle.dumps(self.data)
+        sig = crypticle.sign_target('web*', 'glob', payload)
+        self.assertTrue(crypticle.verify_target('web*', 'glob', payload, sig))
+        # The target cannot be altered or moved to another publication
+        self.assertFalse(crypticle.verify_target('*', 'glob', payload, sig))
+        self.assertFalse(crypticle.verify_target('web*', 'pcre', payload, sig))
+        other = crypticle.dumps(self.data)
+        self.assertFalse(crypticle.verify_target('web*', 'glob', other, sig))
+        # A different key does not verify
+        rotated = salt.crypt.Crypticle(
+                self.opts,
+                salt.crypt.Crypticle.generate_key_string())
+        self.assertFalse(rotated.verify_target('web*', 'glob', payload, sig))
+
+    def test_chunked_compatible(self):
+        crypticle = salt.crypt.Crypticle(self.opts, self.key)
+        crypticle.CHUNK_SIZE = 64
+        for size in (0, 1, 15, 16, 17, 63, 64, 65, 1000):
+            data = os.urandom(size)
+            self.assertEqual(
+                crypticle.decrypt(v1_encrypt(crypticle.keys, data)), data)
+            self.assertEqual(
+                v1_decrypt(crypticle.keys, crypticle.encrypt(data)), data)
+
+    def test_encrypt_parts(self):
+        crypticle = salt.crypt.Crypticle(self.opts, self.key)
+        crypticle.CHUNK_SIZE = 32
+        parts = ['pickle::', os.urandom(5), '', os.urandom(100), 'x']
+        self.assertEqual(
+            crypticle.decrypt(crypticle.encrypt_parts(parts)),
+            ''.join(parts))
+
+    def test_decrypt_tampered(self):
+        crypticle = salt.crypt.Crypticle(self.opts, self.key)
+        payload = crypticle.encrypt('data')
+        self.assertRaises(
+            AuthenticationError,
+            crypticle.decrypt,
+            payload[:20] + chr(ord(payload[20]) ^ 1) + payload[21:])
+        self.assertRaises(AuthenticationError, crypticle.decrypt, 'short')
+
+
+class TicketKeyTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # Skip the constructor, it generates the master RSA keys
+        self.keys = salt.crypt.MasterKeys.__new__(salt.crypt.MasterKeys)
+        self.keys.ticket_path = os.path.join(self.tmpdir, 'ticket.key')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ticket_key(self):
+        open(self.keys.ticket_path, 'w+').close()
+        os.chmod(self.keys.ticket_path, 420)
+        key = self.keys._MasterKeys__get_ticket_key()
+        self.assertEqual(os.stat(self.keys.ticket_path).st_mode & 511, 384)
+        # The key is kept across restarts
+        self.assertEqual(self.keys._MasterKeys__get_ticket_key(), key)
+
+
+class SignInPayloadTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        key = RSA.gen_key(1024, 65537, callback=lambda *args: None)
+        key.save_key(os.path.join(self.tmpdir, 'minion.pem'), None)
+        self.opts = {'pki_dir': self.tmpdir,
+                     'id': 'web1',
+                     'serial': 'msgpack'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_session_tickets(self):
+        # The short lived sign ins do not ask for a ticket
+        auth = salt.crypt.Auth(self.opts)
+        self.assertFalse('ticket' in auth.minion_sign_in_payload()['load'])
+        auth = salt.crypt.Auth(self.opts, session_tickets=True)
+        self.assertEqual(auth.minion_sign_in_payload()['load']['ticket'], '')
+        auth.session = {'ticket': 'ticket', 'secret': 'secret'}
+        self.assertEqual(
+            auth.minion_sign_in_payload()['load']['ticket'], 'ticket')
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(CrypticleTest)
+    tests.addTests(loader.loadTestsFromTestCase(TicketKeyTest))
+    tests.addTests(loader.loadTestsFromTestCase(SignInPayloadTest))
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,511 @@
+'''
+Test the salt master worker helpers
+'''
+
+# Import Python libs
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Import Third Party libs
+import zmq
+
+# Import Salt libs
+from saltunittest import (TestCase, TestLoader, TextTestRunner, skipIf,
+                          write_master_config)
+try:
+    from mock import MagicMock, patch
+    has_mock = True
+except ImportError:
+    has_mock = False
+
+import salt.config
+import salt.crypt
+import salt.master
+import salt.payload
+import salt.pillar
+import salt.utils.stats
+
+
+class PubChannelTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.tmpdir,
+                     'serial': 'msgpack',
+                     'zmq_filtering': False,
+                     'order_masters': False}
+        self.context = zmq.Context()
+        self.pull = self.context.socket(zmq.PULL)
+        self.pull.linger = 0
+        self.pull.bind(
+            'ipc://{0}'.format(os.path.join(self.tmpdir, 'publish_pull.ipc'))
+        )
+        self.serial = salt.payload.Serial('msgpack')
+
+    def tearDown(self):
+        self.pull.close()
+        self.context.term()
+        shutil.rmtree(self.tmpdir)
+
+    def _recv(self):
+        poller = zmq.Poller()
+        poller.register(self.pull, zmq.POLLIN)
+        self.assertTrue(poller.poll(5000))
+        return self.serial.loads(self.pull.recv())
+
+    def test_send_reuses_connection(self):
+        channel = salt.master.PubChannel(self.opts)
+        for ind in range(3):
+            self.assertTrue(channel.send({'load': ind}))
+            self.assertEqual(self._recv(), {'load': ind})
+            socket = channel.socket
+            if ind:
+                self.assertTrue(socket is last)
+            last = socket
+        self.assertEqual(channel.stats['count'], 3)
+        self.assertEqual(channel.stats['reconnects'], 0)
+        channel.close()
+
+    def test_send_reconnects(self):
+        channel = salt.master.PubChannel(self.opts)
+        self.assertTrue(channel.send({'load': 1}))
+        self._recv()
+        first = channel.socket
+        # Simulate a broken connection
+        first.close()
+        self.assertTrue(channel.send({'load': 2}))
+        self.assertEqual(self._recv(), {'load': 2})
+        self.assertFalse(channel.socket is first)
+        self.assertEqual(channel.stats['reconnects'], 1)
+        channel.close()
+
+    def test_topics(self):
+        channel = salt.master.PubChannel(self.opts)
+        self.assertEqual(channel.topics('web1', 'glob'), None)
+        self.opts['zmq_filtering'] = True
+        web1 = salt.payload.minion_topic('web1')
+        web2 = salt.payload.minion_topic('web2')
+        self.assertEqual(channel.topics('web1', 'glob'), [web1])
+        self.assertEqual(channel.topics('web1,web2', 'list'), [web1, web2])
+        self.assertEqual(channel.topics(['web1', 'web2'], 'list'),
+                         [web1, web2])
+        self.assertEqual(channel.topics('web*', 'glob'), None)
+        self.assertEqual(channel.topics('web1', 'pcre'), None)
+        self.opts['order_masters'] = True
+        self.assertEqual(channel.topics('web1', 'glob'), None)
+
+    def test_send_topics(self):
+        self.opts['zmq_filtering'] = True
+        channel = salt.master.PubChannel(self.opts)
+        self.assertTrue(channel.send({'load': 1}, ['topic']))
+        self.assertEqual(
+            self._recv(),
+            {'payload': self.serial.dumps({'load': 1}),
+             'topic_lst': ['topic']})
+        self.assertTrue(channel.send({'load': 2}))
+        self.assertEqual(
+            self._recv()['topic_lst'],
+            [salt.payload.BROADCAST_TOPIC])
+        channel.close()
+
+
+@skipIf(has_mock is False, "mock python module is unavailable")
+class SessionTicketTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, 'minions'))
+        self.pubfn = os.path.join(self.tmpdir, 'minions', 'web1')
+        with open(self.pubfn, 'w+') as fp_:
+            fp_.write('public key')
+        self.opts = salt.config.master_config(write_master_config(
+                self.tmpdir, publish_port=4505, session_ticket_ttl=60))
+        master_key = MagicMock(
+                token='token',
+                ticket_key=salt.crypt.Crypticle.generate_key_string())
+        master_key.get_pub_str.return_value = 'master pub'
+        # The master event bus and the publisher are not running
+        with patch('salt.utils.event.MasterEvent'):
+            self.funcs = salt.master.ClearFuncs(
+                    self.opts,
+                    {'root': 'key'},
+                    master_key,
+                    salt.crypt.Crypticle(
+                        self.opts,
+                        salt.crypt.Crypticle.generate_key_string()),
+                    MagicMock())
+        self.secret = salt.crypt.Crypticle.generate_key_string()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resume(self):
+        ticket = self.funcs._gen_ticket('web1', self.secret, self.pubfn)
+        ret = self.funcs._resume_session({'id': 'web1', 'ticket': ticket})
+        self.assertEqual(ret['publish_port'], 4505)
+        aes = salt.crypt.Crypticle(self.opts, self.secret).loads(
+                ret['session_aes'])
+        self.assertEqual(aes, self.opts['aes'])
+
+    def test_resume_rejected(self):
+        ticket = self.funcs._gen_ticket('web1', self.secret, self.pubfn)
+        # The ticket belongs to another minion
+        self.assertEqual(
+            self.funcs._resume_session({'id': 'web2', 'ticket': ticket}),
+            None)
+        # The ticket was tampered with
+        self.assertEqual(
+            self.funcs._resume_session(
+                {'id': 'web1',
+                 'ticket': ticket[:-1] + chr(ord(ticket[-1]) ^ 1)}),
+            None)
+        # The key was removed from the accepted keys
+        os.remove(self.pubfn)
+        self.assertEqual(
+            self.funcs._resume_session({'id': 'web1', 'ticket': ticket}),
+            None)
+
+    def test_resume_expired(self):
+        self.opts['session_ticket_ttl'] = -1
+        ticket = self.funcs._gen_ticket('web1', self.secret, self.pubfn)
+        self.assertEqual(
+            self.funcs._resume_session({'id': 'web1', 'ticket': ticket}),
+            None)
+
+
+class ReqServerRouteTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.tmpdir,
+                     'cachedir': self.tmpdir,
+                     'serial': 'msgpack',
+                     'worker_threads': 1,
+                     'auth_workers': 1,
+                     'auth_queue_size': 1,
+                     'worker_pools': {
+                         'fileserver': {'workers': 1,
+                                        'commands': ['_serve_file']}},
+                     'interface': '127.0.0.1',
+                     'ret_port': 4506}
+        self.serial = salt.payload.Serial('msgpack')
+        self.reqserv = salt.master.ReqServer(self.opts, None, None, None)
+        self.uri = 'ipc://{0}'.format(os.path.join(self.tmpdir, 'ret.ipc'))
+        self.reqserv.clients.bind(self.uri)
+        self.reqserv.workers.bind(self.reqserv.w_uri)
+        self.reqserv.auth_workers.bind(self.reqserv.a_uri)
+        self.f_uri = self.reqserv._pool_uri('fileserver')
+        self.reqserv.pools['fileserver'].bind(self.f_uri)
+        self.context = zmq.Context()
+        self.sockets = []
+        router = threading.Thread(target=self.reqserv._ReqServer__route)
+        router.daemon = True
+        router.start()
+
+    def tearDown(self):
+        for socket in self.sockets:
+            socket.close()
+        self.context.term()
+        shutil.rmtree(self.tmpdir)
+
+    def _socket(self, type_, uri):
+        socket = self.context.socket(type_)
+        socket.linger = 0
+        socket.connect(uri)
+        self.sockets.append(socket)
+        return socket
+
+    def _recv(self, socket):
+        poller = zmq.Poller()
+        poller.register(socket, zmq.POLLIN)
+        self.assertTrue(poller.poll(5000))
+        return self.serial.loads(socket.recv())
+
+    def test_auth_admission(self):
+        auth_worker = self._socket(zmq.REP, self.reqserv.a_uri)
+        worker = self._socket(zmq.REP, self.reqserv.w_uri)
+        auth = {'enc': 'clear', 'load': {'cmd': '_auth', 'id': 'web1'}}
+        first = self._socket(zmq.REQ, self.uri)
+        first.send(self.serial.dumps(auth))
+        # The authentication request reached the authentication worker
+        self.assertEqual(self._recv(auth_worker), auth)
+        # The queue is full, the next minion is told to try again
+        second = self._socket(zmq.REQ, self.uri)
+        second.send(self.serial.dumps(auth))
+        ret = self._recv(second)
+        self.assertTrue(ret['load']['ret'])
+        self.assertTrue(ret['load']['try_again'] >= 1)
+        # Other requests still go to the workers
+        req = {'enc': 'aes', 'load': 'data'}
+        third = self._socket(zmq.REQ, self.uri)
+        third.send(self.serial.dumps(req))
+        self.assertEqual(self._recv(worker), req)
+        worker.send(self.serial.dumps('ok'))
+        self.assertEqual(self._recv(third), 'ok')
+        # Replies from the authentication worker free the queue
+        auth_worker.send(self.serial.dumps({'enc': 'pub'}))
+        self.assertEqual(self._recv(first), {'enc': 'pub'})
+        second.send(self.serial.dumps(auth))
+        self.assertEqual(self._recv(auth_worker), auth)
+
+    def test_pool_routing(self):
+        worker = self._socket(zmq.REP, self.reqserv.w_uri)
+        fileserver = self._socket(zmq.REP, self.f_uri)
+        serve = {'enc': 'aes', 'load': 'data', 'cmd': '_serve_file'}
+        ret = {'enc': 'aes', 'load': 'data', 'cmd': '_return'}
+        first = self._socket(zmq.REQ, self.uri)
+        first.send(self.serial.dumps(serve))
+        second = self._socket(zmq.REQ, self.uri)
+        second.send(self.serial.dumps(ret))
+        # The file server request went to its own pool, the return is not
+        # held up behind it
+        self.assertEqual(self._recv(worker), ret)
+        worker.send(self.serial.dumps('returned'))
+        self.assertEqual(self._recv(second), 'returned')
+        self.assertEqual(self._recv(fileserver), serve)
+        fileserver.send(self.serial.dumps('served'))
+        self.assertEqual(self._recv(first), 'served')
+
+
+class StubClearFuncs(object):
+    def __init__(self, event):
+        self.event = event
+
+    def slow(self, load):
+        self.event.wait(5)
+        return 'slow'
+
+
+class StubAESFuncs(object):
+    def run_func(self, func, load, compress=False, size=0):
+        return func
+
+
+class AsyncMWorker(salt.master.MWorker):
+    '''
+    Run the async worker loop with stub functions
+    '''
+    def _make_funcs(self):
+        return StubClearFuncs(self.event), StubAESFuncs()
+
+
+class AsyncMWorkerTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.tmpdir,
+                     'cachedir': self.tmpdir,
+                     'serial': 'msgpack',
+                     'worker_mode': 'async',
+                     'worker_async_threads': 2}
+        self.serial = salt.payload.Serial('msgpack')
+        self.crypticle = salt.crypt.Crypticle(
+                self.opts,
+                salt.crypt.Crypticle.generate_key_string())
+        self.context = zmq.Context()
+        self.workers = self.context.socket(zmq.DEALER)
+        self.workers.linger = 0
+        worker = AsyncMWorker(self.opts, None, None, self.crypticle)
+        worker.event = threading.Event()
+        self.event = worker.event
+        self.workers.bind(worker.w_uri)
+        thread = threading.Thread(target=worker.run)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.event.set()
+        self.workers.close()
+        self.context.term()
+        shutil.rmtree(self.tmpdir)
+
+    def _send(self, client, payload):
+        self.workers.send_multipart(
+                [client, '', self.serial.dumps(payload)])
+
+    def _recv(self):
+        poller = zmq.Poller()
+        poller.register(self.workers, zmq.POLLIN)
+        self.assertTrue(poller.poll(5000))
+        client, delim, ret = self.workers.recv_multipart()
+        return client, self.serial.loads(ret)
+
+    def test_inline_while_blocked(self):
+        self._send('first', {'enc': 'clear', 'load': {'cmd': 'slow'}})
+        load = self.crypticle.dumps({'cmd': '_return', 'id': 'web1'})
+        self._send('second', {'enc': 'aes', 'load': load})
+        # The quick command is answered while the slow one is still running
+        self.assertEqual(self._recv(), ('second', '_return'))
+        self.event.set()
+        self.assertEqual(self._recv(), ('first', 'slow'))
+
+
+class PublisherTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.tmpdir,
+                     'cachedir': self.tmpdir,
+                     'serial': 'msgpack',
+                     'pub_hwm': 2}
+        self.publisher = salt.master.Publisher(self.opts)
+        self.publisher.stats = salt.utils.stats.Stats(self.opts, 'publisher')
+        self.context = zmq.Context()
+        self.uri = 'ipc://{0}'.format(os.path.join(self.tmpdir, 'pub.ipc'))
+        self.pub_sock = self.publisher._pub_socket(self.context)
+        self.pub_sock.linger = 0
+        self.pub_sock.bind(self.uri)
+        self.sub_sock = self.context.socket(zmq.SUB)
+        self.sub_sock.linger = 0
+        self.sub_sock.setsockopt(zmq.RCVHWM, 1)
+        self.sub_sock.setsockopt(zmq.SUBSCRIBE, 'web1')
+        self.sub_sock.connect(self.uri)
+
+    def tearDown(self):
+        self.sub_sock.close()
+        self.pub_sock.close()
+        self.context.term()
+        shutil.rmtree(self.tmpdir)
+
+    def _subscribe(self):
+        poller = zmq.Poller()
+        poller.register(self.pub_sock, zmq.POLLIN)
+        self.assertTrue(poller.poll(5000))
+        self.publisher._drain_subscriptions(self.pub_sock)
+
+    @skipIf(not hasattr(zmq, 'XPUB_NODROP'), 'XPUB_NODROP is unavailable')
+    def test_drops_counted(self):
+        self._subscribe()
+        self.assertEqual(self.publisher.topics, set(['web1']))
+        # Nobody subscribed to this minion topic
+        self.publisher._publish(self.pub_sock, ['web2', 'data'], 'web2')
+        counters = self.publisher.stats.counters
+        self.assertEqual(counters['unsubscribed:web2'], 1)
+        # The subscriber never reads, the publications back up
+        data = 'x' * 65536
+        for ind in range(1000):
+            self.publisher._publish(self.pub_sock, ['web1', data], 'web1')
+            if counters.get('dropped'):
+                break
+        self.assertTrue(counters['dropped:web1'] >= 1)
+        self.assertTrue(counters['sent'] >= 1)
+
+    @skipIf(not hasattr(zmq, 'XPUB_NODROP'), 'XPUB_NODROP is unavailable')
+    def test_queued_subscriptions(self):
+        socks = []
+        for topic in ('web2', 'web3'):
+            sock = self.context.socket(zmq.SUB)
+            sock.linger = 0
+            sock.setsockopt(zmq.SUBSCRIBE, topic)
+            sock.connect(self.uri)
+            socks.append(sock)
+        try:
+            for ind in range(50):
+                time.sleep(0.1)
+                self.publisher._drain_subscriptions(self.pub_sock)
+                if len(self.publisher.topics) == 3:
+                    break
+            # The queued subscriptions are all read before publishing
+            self.assertEqual(self.publisher.topics,
+                             set(['web1', 'web2', 'web3']))
+            self.publisher._publish(self.pub_sock, ['web3', 'data'], 'web3')
+            counters = self.publisher.stats.counters
+            self.assertFalse(counters.get('unsubscribed'))
+            self.assertEqual(socks[1].recv_multipart(), ['web3', 'data'])
+        finally:
+            for sock in socks:
+                sock.close()
+
+
+class StubMasterEvent(object):
+    def __init__(self, sock_dir):
+        self.fired = []
+
+    def fire_event(self, data, tag):
+        self.fired.append(tag)
+
+
+@skipIf(has_mock is False, "mock python module is unavailable")
+class ReturnTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        opts = salt.config.master_config(write_master_config(self.tmpdir))
+        # The master event bus and the publisher are not running
+        with patch('salt.utils.event.MasterEvent',
+                   side_effect=StubMasterEvent):
+            self.aes_funcs = salt.master.AESFuncs(
+                    opts,
+                    salt.crypt.Crypticle(
+                        opts,
+                        salt.crypt.Crypticle.generate_key_string()),
+                    MagicMock())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_unsaved_returns_fired(self):
+        jid = self.aes_funcs.job_cache.prep_jid()
+        load = {'jid': jid, 'id': 'web1', 'return': True}
+        self.assertEqual(self.aes_funcs._return(dict(load)), None)
+        # The duplicate and the unknown job are not saved but still fired
+        self.assertFalse(self.aes_funcs._return(dict(load)))
+        load['jid'] = '20010101000000000000'
+        self.assertFalse(self.aes_funcs._return(dict(load)))
+        self.assertEqual(
+            self.aes_funcs.event.fired, [jid, jid, '20010101000000000000'])
+        self.assertEqual(
+            self.aes_funcs.job_cache.get_returns(jid), {'web1': {'ret': True}})
+
+    def test_pillar_cache(self):
+        # Only the last grains are kept while pillar_cache_ttl is not set
+        pillar_cache = self.aes_funcs.pillar_cache
+        self.assertTrue(isinstance(pillar_cache, salt.pillar.PillarCache))
+        self.assertEqual(pillar_cache.entries, None)
+
+
+@skipIf(has_mock is False, "mock python module is unavailable")
+class DroppedPublishTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, 'minions'))
+        with open(os.path.join(self.tmpdir, 'minions', 'web1'), 'w+') as fp_:
+            fp_.write('public key')
+        self.opts = salt.config.master_config(
+                write_master_config(self.tmpdir))
+        master_key = MagicMock(
+                ticket_key=salt.crypt.Crypticle.generate_key_string())
+        # The master event bus and the publisher are not running
+        with patch('salt.utils.event.MasterEvent'):
+            self.funcs = salt.master.ClearFuncs(
+                    self.opts,
+                    {'root': 'key'},
+                    master_key,
+                    salt.crypt.Crypticle(
+                        self.opts,
+                        salt.crypt.Crypticle.generate_key_string()),
+                    MagicMock())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_publish(self):
+        load = {'fun': 'test.ping', 'arg': [], 'tgt': 'web1', 'jid': '',
+                'ret': '', 'user': 'root', 'key': 'key'}
+        self.funcs.pub_channel.send.return_value = True
+        ret = self.funcs.publish(dict(load))
+        self.assertEqual(ret['load']['minions'], ['web1'])
+        self.assertNotEqual(ret['load']['jid'], '0')
+        # The LocalClient sees the dropped publication as failed
+        self.funcs.pub_channel.send.return_value = False
+        ret = self.funcs.publish(dict(load))
+        self.assertEqual(ret['load'], {'jid': '0', 'minions': []})
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(PubChannelTest)
+    tests.addTests(loader.loadTestsFromTestCase(SessionTicketTest))
+    tests.addTests(loader.loadTestsFromTestCase(ReqServerRouteTest))
+    tests.addTests(loader.loadTestsFromTestCase(AsyncMWorkerTest))
+    tests.addTests(loader.loadTestsFromTestCase(PublisherTest))
+    tests.addTests(loader.loadTestsFromTestCase(ReturnTest))
+    tests.addTests(loader.loadTestsFromTestCase(DroppedPublishTest))
+    TextTestRunner(verbosity=1).run(tests)
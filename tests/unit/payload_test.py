@@ -0,0 +1,150 @@
+'''
+Test the salt payload serialization and request channels
+'''
+
+# Import Python libs
+import os
+import shutil
+import tempfile
+import threading
+
+# Import Third Party libs
+import zmq
+
+# Import Salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+
+import salt.payload
+from salt.exceptions import SaltReqTimeoutError
+
+
+class ReqResponder(threading.Thread):
+    '''
+    Answer requests on a ROUTER socket, the first ``skip`` requests are
+    swallowed to simulate a master which never replies
+    '''
+    def __init__(self, uri, skip=0, count=1):
+        super(ReqResponder, self).__init__()
+        self.daemon = True
+        self.serial = salt.payload.Serial('msgpack')
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.linger = 0
+        self.socket.bind(uri)
+        self.skip = skip
+        self.count = count
+        self.peers = set()
+
+    def run(self):
+        seen = 0
+        while seen < self.skip + self.count:
+            frames = self.socket.recv_multipart()
+            seen += 1
+            self.peers.add(frames[0])
+            if seen <= self.skip:
+                continue
+            payload = self.serial.loads(frames[-1])
+            frames[-1] = self.serial.dumps({'echo': payload['load']})
+            self.socket.send_multipart(frames)
+        self.socket.close()
+        self.context.term()
+
+
+class SerialTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'return.p')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_registry(self):
+        names = salt.payload.available_serializers('pickle')
+        self.assertEqual(names[0], 'pickle')
+        self.assertTrue('msgpack' in names)
+        self.assertEqual(salt.payload.Serial('nonexistent').serial, 'msgpack')
+
+    def test_load_streams_file(self):
+        serial = salt.payload.Serial('msgpack')
+        # A serializer of its own, the registered one is shared
+        serial.serializer = salt.payload.MsgpackSerializer()
+        serial.serializer.read_size = 16
+        data = {'return': dict(('state_{0}'.format(ind), {'result': True})
+                               for ind in range(100))}
+        serial.dump(data, open(self.path, 'w+b'))
+        self.assertEqual(serial.load(open(self.path, 'rb')), data)
+
+    def test_iter_load(self):
+        serial = salt.payload.Serial('msgpack')
+        with open(self.path, 'w+b') as fp_:
+            for ind in range(3):
+                fp_.write(serial.dumps({'num': ind}))
+        self.assertEqual(
+            list(serial.iter_load(open(self.path, 'rb'))),
+            [{'num': 0}, {'num': 1}, {'num': 2}]
+        )
+
+    def test_pickle_falls_back(self):
+        salt.payload.Serial('msgpack').dump([1, 2], open(self.path, 'w+b'))
+        serial = salt.payload.Serial('pickle')
+        self.assertEqual(serial.load(open(self.path, 'rb')), [1, 2])
+
+
+class SREQTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.uri = 'ipc://{0}'.format(os.path.join(self.tmpdir, 'req.ipc'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_send_reuses_socket(self):
+        responder = ReqResponder(self.uri, count=3)
+        responder.start()
+        for ind in range(3):
+            sreq = salt.payload.SREQ(self.uri)
+            ret = sreq.send('clear', {'num': ind}, timeout=5)
+            self.assertEqual(ret, {'echo': {'num': ind}})
+        responder.join(5)
+        # All three requests were sent over a single pooled connection
+        self.assertEqual(len(responder.peers), 1)
+
+    def test_timeout_recovers(self):
+        responder = ReqResponder(self.uri, skip=1, count=1)
+        responder.start()
+        sreq = salt.payload.SREQ(self.uri)
+        ret = sreq.send(
+                'clear', {'num': 1}, tries=2, timeout=1, cmd='_file_list')
+        self.assertEqual(ret, {'echo': {'num': 1}})
+        responder.join(5)
+        # The stuck socket was dropped and the retry used a new connection
+        self.assertEqual(len(responder.peers), 2)
+
+    def test_publish_not_resent(self):
+        responder = ReqResponder(self.uri, skip=1, count=1)
+        responder.start()
+        sreq = salt.payload.SREQ(self.uri)
+        self.assertRaises(
+            SaltReqTimeoutError,
+            sreq.send, 'clear', {'num': 1}, 2, 1, 'publish'
+        )
+        # The publication was not sent again
+        responder.join(1)
+        self.assertEqual(len(responder.peers), 1)
+
+    def test_timeout_raises(self):
+        responder = ReqResponder(self.uri, skip=1, count=0)
+        responder.start()
+        sreq = salt.payload.SREQ(self.uri)
+        self.assertRaises(
+            SaltReqTimeoutError,
+            sreq.send, 'clear', {'num': 1}, 1, 1
+        )
+        responder.join(5)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(SerialTest)
+    tests.addTests(loader.loadTestsFromTestCase(SREQTest))
+    TextTestRunner(verbosity=1).run(tests)
@@ -0,0 +1,279 @@
+'''
+Test the master side pillar cache
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+# Import salt libs
+from saltunittest import (TestCase, TestLoader, TextTestRunner, skipIf,
+                          write_master_config)
+
+import salt.config
+import salt.utils
+import salt.pillar
+import salt.payload
+import salt.utils.stats
+import salt.utils.minions
+
+# Import third party libs
+try:
+    from mock import patch
+    has_mock = True
+except ImportError:
+    has_mock = False
+
+
+class CountingPillar(object):
+    '''
+    Stand in for the Pillar, count the compilations
+    '''
+    compiled = []
+    base_names = []
+    ext_incomplete = False
+    ext_detached = False
+    # The compilations wait until this many compilations started
+    gate = 0
+
+    def __init__(self, opts, grains, id_, env):
+        self.id_ = id_
+        self.grains = grains
+        self.base_names.append(opts['loaded_base_name'])
+
+    def retarget(self, grains, id_, env):
+        self.id_ = id_
+        self.grains = grains
+
+    def compile_pillar(self):
+        self.compiled.append(self.id_)
+        end = time.time() + 5
+        while len(self.compiled) < self.gate and time.time() < end:
+            time.sleep(0.01)
+        return {'id': self.id_, 'os': self.grains['os']}
+
+
+class PillarCacheTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.tmpdir,
+                     'serial': 'msgpack',
+                     'pillar_roots': {'base': [self.tmpdir]},
+                     'pillar_cache_ttl': 60,
+                     'pillar_cache_size': 2}
+        self.stats = salt.utils.stats.Stats(self.opts, 'test')
+        self.cache = salt.pillar.PillarCache(self.opts, self.stats)
+        self.cache.fingerprint_interval = 0
+        self.pillar = salt.pillar.Pillar
+        salt.pillar.Pillar = CountingPillar
+        CountingPillar.compiled = []
+        CountingPillar.base_names = []
+        CountingPillar.gate = 0
+
+    def tearDown(self):
+        salt.pillar.Pillar = self.pillar
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache(self):
+        grains = {'os': 'Debian', 'roles': ['web', 'db']}
+        self.assertEqual(
+            self.cache.compile_pillar(grains, 'web1', None),
+            {'id': 'web1', 'os': 'Debian'})
+        self.cache.compile_pillar(
+            {'roles': ['web', 'db'], 'os': 'Debian'}, 'web1', None)
+        self.assertEqual(CountingPillar.compiled, ['web1'])
+        # Changed grains and pillar files are compiled again
+        grains['os'] = 'CentOS'
+        self.cache.compile_pillar(grains, 'web1', None)
+        open(os.path.join(self.tmpdir, 'top.sls'), 'w+').close()
+        self.cache.compile_pillar(grains, 'web1', None)
+        self.assertEqual(CountingPillar.compiled, ['web1'] * 3)
+        # The least recently used minion is evicted
+        self.cache.compile_pillar(grains, 'web2', None)
+        self.cache.compile_pillar(grains, 'web1', None)
+        self.cache.compile_pillar(grains, 'web3', None)
+        self.assertEqual(self.cache.entries.keys(),
+                         [('web1', None), ('web3', None)])
+        self.assertEqual(self.stats.counters['pillar_cache:hits'], 2)
+        self.assertEqual(self.stats.counters['pillar_cache:misses'], 5)
+        self.assertEqual(self.stats.counters['pillar_cache:evictions'], 1)
+
+    def test_concurrent(self):
+        # Two threads compile at the same time with their own modules
+        CountingPillar.gate = 2
+        self.cache.ttl = 0
+        start = time.time()
+        threads = []
+        for id_ in ('web1', 'web2'):
+            thread = threading.Thread(
+                    target=self.cache.compile_pillar,
+                    args=({'os': 'Debian'}, id_, None))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join(10)
+        self.assertTrue(time.time() - start < 4)
+        self.assertEqual(sorted(CountingPillar.compiled), ['web1', 'web2'])
+        self.assertEqual(len(set(CountingPillar.base_names)), 2)
+        # The Pillar of the thread is reused
+        CountingPillar.gate = 0
+        self.cache.compile_pillar({'os': 'Debian'}, 'web3', None)
+        self.cache.compile_pillar({'os': 'Debian'}, 'web4', None)
+        self.assertEqual(len(CountingPillar.base_names), 3)
+
+    def test_disabled(self):
+        self.opts['pillar_cache_ttl'] = 0
+        cache = salt.pillar.PillarCache(self.opts, self.stats)
+        self.assertEqual(cache.entries, None)
+        cache.compile_pillar({'os': 'Debian'}, 'web1', None)
+        cache.compile_pillar({'os': 'Debian'}, 'web1', None)
+        self.assertEqual(CountingPillar.compiled, ['web1', 'web1'])
+
+    def test_grains(self):
+        grains = {'os': 'Debian', 'id': 'web1'}
+        digest = salt.utils.digest_data(grains)
+        self.assertEqual(self.cache.get_grains('web1', digest), None)
+        self.cache.compile_pillar(grains, 'web1', None)
+        self.assertEqual(self.cache.get_grains('web1', digest), grains)
+        self.assertEqual(self.cache.get_grains('web1', 'stale'), None)
+        # Another process knows the grains from the minion data cache
+        salt.utils.minions.save_data(self.opts, 'web2', grains, {})
+        self.assertEqual(self.cache.get_grains('web2', digest), grains)
+        self.assertEqual(self.stats.counters['pillar_cache:grains_hits'], 2)
+        self.assertEqual(self.stats.counters['pillar_cache:grains_misses'], 2)
+
+    @skipIf(has_mock is False, "mock python module is unavailable")
+    def test_remote_pillar(self):
+        sent = []
+
+        def send(enc, load, tries, timeout, cmd):
+            sent.append(sorted(load))
+            if 'grains' in load:
+                return {'os': load['grains']['os']}
+            return False
+
+        opts = {'master_uri': 'tcp://127.0.0.1:4506', 'serial': 'msgpack'}
+        # The master is not running
+        with patch('salt.crypt.SAuth') as auth:
+            with patch('salt.payload.SREQ') as sreq:
+                remote = salt.pillar.RemotePillar(
+                        opts, {'os': 'Debian'}, 'web1', None)
+        sreq.return_value.send.side_effect = send
+        remote.auth.grains_digest = True
+        remote.auth.crypticle.dumps.side_effect = lambda data: data
+        remote.auth.crypticle.loads.side_effect = lambda data: data
+        auth.assert_called_once_with(opts)
+        self.assertEqual(remote.compile_pillar(), {'os': 'Debian'})
+        self.assertEqual(sent, [['cmd', 'env', 'grains_digest', 'id'],
+                                ['cmd', 'env', 'grains', 'id']])
+        remote.auth.grains_digest = False
+        sent[:] = []
+        remote.compile_pillar()
+        self.assertEqual(sent, [['cmd', 'env', 'grains', 'id']])
+
+    def test_ext_pillar(self):
+        calls = []
+        release = threading.Event()
+
+        def fast(val):
+            calls.append(val)
+            return {'fast': val}
+
+        def slow(val):
+            calls.append(val)
+            release.wait(5)
+            return {'slow': val}
+
+        def boom(val):
+            raise ValueError(val)
+
+        opts = salt.config.master_config(write_master_config(
+                self.tmpdir,
+                ext_pillar=[{'fast': 1}, {'slow': 2}, {'bad': 3}],
+                ext_pillar_timeout={'default': 5, 'slow': 0.2},
+                ext_pillar_cache_ttl={'fast': 60}))
+        grains = {'kernel': 'Linux', 'os': 'Debian', 'os_family': 'Debian'}
+        pillar = self.pillar(opts, grains, 'web1', None)
+        pillar.ext_pillars = {'fast': fast, 'slow': slow, 'boom': boom}
+        pillar.stats = self.stats
+        start = time.time()
+        self.assertEqual(pillar.ext_pillar(), {'fast': 1})
+        self.assertTrue(pillar.ext_incomplete)
+        self.assertTrue(pillar.ext_detached)
+        # The hung source is waited on instead of being started again
+        self.assertEqual(pillar.ext_pillar(), {'fast': 1})
+        self.assertEqual(sorted(calls), [1, 1, 2])
+        self.assertEqual(self.stats.counters['ext_pillar:slow:joined'], 1)
+        # Once the pillar was retargeted the run is stale, even for the
+        # same minion
+        pillar.retarget(grains, 'web1', None)
+        self.assertEqual(pillar.ext_pillar(), {'fast': 1})
+        self.assertEqual(sorted(calls), [1, 1, 1, 2, 2])
+        self.assertEqual(self.stats.counters['ext_pillar:slow:joined'], 1)
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(self.stats.counters['ext_pillar:slow:timeouts'], 3)
+        # Nothing is cached from the incomplete compilations
+        self.assertEqual(len(pillar.ext_cache), 0)
+        release.set()
+        self.assertEqual(pillar.ext_pillar(), {'fast': 1, 'slow': 2})
+        self.assertFalse(pillar.ext_incomplete)
+        # The data of the fast source is cached for the minion
+        calls[:] = []
+        self.assertEqual(pillar.ext_pillar(), {'fast': 1, 'slow': 2})
+        self.assertEqual(calls, [2])
+        self.assertEqual(self.stats.counters['ext_pillar:fast:cache_hits'], 1)
+        pillar.retarget(grains, 'web2', None)
+        pillar.ext_pillar()
+        self.assertEqual(sorted(calls), [1, 2, 2])
+        self.assertEqual(self.stats.timings['ext_pillar:fast']['count'], 5)
+        # A failed source also leaves the compilation incomplete
+        pillar.opts['ext_pillar'].append({'boom': 4})
+        pillar.ext_pillar()
+        self.assertTrue(pillar.ext_incomplete)
+        self.assertEqual(self.stats.counters['ext_pillar:boom:errors'], 1)
+
+    def test_detached_not_reused(self):
+        CountingPillar.ext_detached = True
+        try:
+            self.cache.compile_pillar({'os': 'Debian'}, 'web1', None)
+        finally:
+            CountingPillar.ext_detached = False
+        self.cache.compile_pillar({'os': 'Debian'}, 'web2', None)
+        self.cache.compile_pillar({'os': 'Debian'}, 'web3', None)
+        # The pillar left with a running source was not pointed at web2
+        self.assertEqual(len(CountingPillar.base_names), 2)
+
+    def test_incomplete_not_cached(self):
+        CountingPillar.ext_incomplete = True
+        try:
+            grains = {'os': 'Debian'}
+            self.cache.compile_pillar(grains, 'web1', None)
+            self.cache.compile_pillar(grains, 'web1', None)
+        finally:
+            CountingPillar.ext_incomplete = False
+        self.assertEqual(CountingPillar.compiled, ['web1', 'web1'])
+        self.assertEqual(self.stats.counters['pillar_cache:incomplete'], 2)
+
+    def test_digest_data(self):
+        self.assertEqual(
+            salt.utils.digest_data({'a': [1, {'b': 2, 'c': 3}], 'd': 'e'}),
+            salt.utils.digest_data({'d': 'e', 'a': [1, {'c': 3, 'b': 2}]}))
+        self.assertNotEqual(
+            salt.utils.digest_data({'a': [1, 2]}),
+            salt.utils.digest_data({'a': [2, 1]}))
+        # The master digests the grains decoded from msgpack
+        grains = {u'locale': u'en_US', 'mem': 3L, 'cpus': (2, True),
+                  'os': u'Ubuntu \xe9'}
+        serial = salt.payload.Serial('msgpack')
+        self.assertEqual(
+            salt.utils.digest_data(grains),
+            salt.utils.digest_data(serial.loads(serial.dumps(grains))))
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(PillarCacheTest)
+    TextTestRunner(verbosity=1).run(tests)
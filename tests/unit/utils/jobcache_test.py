@@ -0,0 +1,154 @@
+'''
+Test the master job cache backends
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import third party libs
+try:
+    from mock import Mock, patch
+    has_mock = True
+except ImportError:
+    has_mock = False
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner, skipIf
+
+import salt.utils
+import salt.utils.jobcache
+
+
+class JobCacheTests(object):
+    '''
+    The tests every job cache backend has to pass
+    '''
+    backend = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.tmpdir,
+                     'hash_type': 'md5',
+                     'keep_jobs': 24,
+                     'serial': 'msgpack'}
+        self.job_cache = self.backend(self.opts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_returns(self):
+        jid = self.job_cache.prep_jid()
+        self.assertTrue(self.job_cache.jid_exists(jid))
+        self.assertFalse(self.job_cache.jid_exists('20010101000000000000'))
+        load = {'jid': jid, 'fun': 'test.ping', 'arg': [], 'tgt': '*',
+                'tgt_type': 'glob'}
+        self.job_cache.save_load(jid, load)
+        self.assertEqual(self.job_cache.get_load(jid), load)
+        self.assertTrue(self.job_cache.save_return(jid, 'web1', True))
+        self.assertTrue(
+            self.job_cache.save_return(jid, 'web2', {'a': 1}, 'yaml'))
+        # A second return from the same minion is refused
+        self.assertFalse(self.job_cache.save_return(jid, 'web1', False))
+        self.assertEqual(
+            sorted(self.job_cache.get_minions(jid)), ['web1', 'web2'])
+        self.assertEqual(
+            self.job_cache.get_returns(jid),
+            {'web1': {'ret': True},
+             'web2': {'ret': {'a': 1}, 'out': 'yaml'}})
+        self.assertEqual(
+            self.job_cache.get_returns(jid, set(['web1'])).keys(), ['web2'])
+        self.assertEqual(self.job_cache.list_jobs(), {jid: load})
+
+    def test_wtag(self):
+        jid = self.job_cache.prep_jid()
+        self.assertFalse(self.job_cache.has_wtag(jid))
+        self.job_cache.add_wtag(jid, 'syndic1')
+        self.assertTrue(self.job_cache.has_wtag(jid))
+        self.job_cache.rm_wtag(jid, 'syndic1')
+        self.assertFalse(self.job_cache.has_wtag(jid))
+
+    def test_clean_old_jobs(self):
+        old = '20010101000000000000'
+        self.job_cache.save_load(old, {'jid': old})
+        self.job_cache.save_return(old, 'web1', True)
+        jid = self.job_cache.prep_jid()
+        self.job_cache.save_load(jid, {'jid': jid})
+        self.assertEqual(self.job_cache.clean_old_jobs(), 1)
+        self.assertFalse(self.job_cache.jid_exists(old))
+        self.assertEqual(self.job_cache.get_returns(old), {})
+        self.assertTrue(self.job_cache.jid_exists(jid))
+
+
+class LegacyJobCacheTest(JobCacheTests, TestCase):
+    backend = salt.utils.jobcache.LegacyJobCache
+
+    def test_hour_index(self):
+        old = '20010101000000000000'
+        # A job cached before the hour index existed
+        salt.utils.prep_jid(self.tmpdir, 'md5')
+        jid_dir = self.job_cache._jid_dir(old)
+        os.makedirs(jid_dir)
+        with open(os.path.join(jid_dir, 'jid'), 'w+') as fp_:
+            fp_.write(old)
+        # The first clean scans the job directories
+        self.assertEqual(self.job_cache.clean_old_jobs(), 1)
+        self.job_cache.save_load(old, {'jid': old})
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.job_cache.hours, old[:10], old)))
+        # Later cleans only look at the expired hours
+        self.assertEqual(self.job_cache.clean_old_jobs(), 1)
+        self.assertFalse(self.job_cache.jid_exists(old))
+        self.assertEqual(
+            os.listdir(self.job_cache.hours).count(old[:10]), 0)
+
+
+@skipIf(not salt.utils.jobcache.HAS_SQLITE, 'sqlite3 is unavailable')
+class SQLiteJobCacheTest(JobCacheTests, TestCase):
+    backend = salt.utils.jobcache.SQLiteJobCache
+
+    def test_get_job_cache(self):
+        self.assertTrue(isinstance(
+            salt.utils.jobcache.get_job_cache(self.opts),
+            salt.utils.jobcache.SQLiteJobCache))
+        self.opts['job_cache_backend'] = 'nonexistent'
+        self.assertTrue(isinstance(
+            salt.utils.jobcache.get_job_cache(self.opts),
+            salt.utils.jobcache.LegacyJobCache))
+
+    @skipIf(has_mock is False, 'mock python module is unavailable')
+    def test_read_only(self):
+        jid = self.job_cache.prep_jid()
+        self.job_cache.save_return(jid, 'web1', True)
+        # A user which can not write the database, like a non root user
+        # running salt
+        access = os.access
+        with patch('os.access',
+                   lambda path, mode: mode != os.W_OK and access(path, mode)):
+            job_cache = self.backend(self.opts)
+            with patch.object(job_cache, 'schema', 'CREATE TABLE x (y);'):
+                self.assertTrue(job_cache.usable())
+                self.assertTrue(job_cache.jid_exists(jid))
+                self.assertEqual(
+                    job_cache.get_returns(jid), {'web1': {'ret': True}})
+        # The schema was not run
+        cur = job_cache._conn().execute(
+                "SELECT name FROM sqlite_master WHERE name = 'x'")
+        self.assertEqual(cur.fetchall(), [])
+
+    @skipIf(has_mock is False, 'mock python module is unavailable')
+    def test_unreadable(self):
+        exc = salt.utils.jobcache.sqlite3.OperationalError(
+                'attempt to write a readonly database')
+        with patch.object(self.backend, '_conn', Mock(side_effect=exc)):
+            self.assertTrue(isinstance(
+                salt.utils.jobcache.get_job_cache(self.opts),
+                salt.utils.jobcache.LegacyJobCache))
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(LegacyJobCacheTest)
+    tests.addTests(loader.loadTestsFromTestCase(SQLiteJobCacheTest))
+    TextTestRunner(verbosity=1).run(tests)
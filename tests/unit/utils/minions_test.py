@@ -0,0 +1,137 @@
+'''
+Test the resolution of the targeted minions
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+
+import salt.utils.minions
+
+
+class MinionRegistryTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pki_dir = os.path.join(self.tmpdir, 'pki')
+        os.makedirs(os.path.join(self.pki_dir, 'minions'))
+        for id_ in ('web1', 'web2', 'web10', 'db1'):
+            self.accept(id_)
+        self.opts = {'pki_dir': self.pki_dir,
+                     'cachedir': os.path.join(self.tmpdir, 'cache'),
+                     'minion_data_cache': True,
+                     'serial': 'msgpack'}
+        self.ckminions = salt.utils.minions.CkMinions(self.opts)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        salt.utils.minions.REGISTRIES.pop(self.opts['pki_dir'], None)
+        salt.utils.minions.DATA_INDEXES.pop(self.opts['cachedir'], None)
+
+    def accept(self, id_):
+        open(os.path.join(self.pki_dir, 'minions', id_), 'w+').close()
+
+    def check(self, expr, expr_form):
+        return sorted(self.ckminions.check_minions(expr, expr_form))
+
+    def test_match(self):
+        self.assertEqual(self.check('web*', 'glob'), ['web1', 'web10', 'web2'])
+        self.assertEqual(self.check('web?', 'glob'), ['web1', 'web2'])
+        self.assertEqual(self.check('*1', 'glob'), ['db1', 'web1'])
+        self.assertEqual(self.check('web1', 'glob'), ['web1'])
+        self.assertEqual(self.check('web3', 'glob'), [])
+        self.assertEqual(self.check('web\\d$', 'pcre'), ['web1', 'web2'])
+        self.assertEqual(self.check('web1,db1,web3', 'list'), ['db1', 'web1'])
+        self.assertEqual(self.check(['web10'], 'list'), ['web10'])
+
+    def test_refresh(self):
+        self.assertEqual(self.check('db*', 'glob'), ['db1'])
+        self.accept('db2')
+        self.assertEqual(self.check('db*', 'glob'), ['db1', 'db2'])
+        os.remove(os.path.join(self.pki_dir, 'minions', 'db1'))
+        self.assertEqual(self.check('db*', 'glob'), ['db2'])
+
+    def cache(self, id_, grains, pillar=None):
+        return salt.utils.minions.save_data(
+                self.opts, id_, grains, pillar or {})
+
+    def test_grains(self):
+        self.cache('web1', {'os': 'Ubuntu', 'roles': ['web', 'LB']})
+        self.cache('web2', {'os': 'CentOS', 'roles': ['web']})
+        self.cache('db1', {'os': 'CentOS', 'num_cpus': 8})
+        # web10 has no cached data and could match anything
+        self.assertEqual(
+            self.check('os:centos', 'grain'), ['db1', 'web10', 'web2'])
+        self.assertEqual(self.check('os:Ub*', 'grain'), ['web1', 'web10'])
+        self.assertEqual(self.check('roles:lb', 'grain'), ['web1', 'web10'])
+        self.assertEqual(self.check('num_cpus:8', 'grain'), ['db1', 'web10'])
+        self.assertEqual(
+            self.check('os:(ubuntu|debian)', 'grain_pcre'), ['web1', 'web10'])
+        # Changes are read from the journal
+        self.cache('web1', {'os': 'CentOS', 'roles': []})
+        self.cache('web10', {'os': 'Debian'})
+        self.assertEqual(
+            self.check('os:centos', 'grain'), ['db1', 'web1', 'web2'])
+        self.assertEqual(self.check('roles:lb', 'grain'), [])
+        index = salt.utils.minions.get_data_index(self.opts)
+        self.assertEqual(index.index[('grains', 'roles')].keys(), ['web'])
+
+    def test_save_data(self):
+        journal = os.path.join(
+                self.opts['cachedir'], 'minions', salt.utils.minions.JOURNAL)
+        self.assertTrue(self.cache('web1', {'os': 'Debian'}))
+        digest = salt.utils.minions.data_digest(self.opts, 'web1')
+        self.assertTrue(digest)
+        # Unchanged data is neither written nor journaled
+        self.assertFalse(self.cache('web1', {'os': 'Debian'}))
+        self.assertEqual(open(journal).read(), 'web1\n')
+        self.assertTrue(self.cache('web1', {'os': 'CentOS'}))
+        self.assertNotEqual(
+            salt.utils.minions.data_digest(self.opts, 'web1'), digest)
+        self.assertEqual(open(journal).read(), 'web1\nweb1\n')
+        self.assertEqual(self.check('os:centos', 'grain'),
+                         ['db1', 'web1', 'web10', 'web2'])
+        self.assertEqual(self.check('os:debian', 'grain'),
+                         ['db1', 'web10', 'web2'])
+
+    def test_compound(self):
+        self.cache('web1', {'os': 'Debian', 'ipv4': ['10.0.0.1']},
+                   {'role': 'frontend'})
+        self.cache('web2', {'os': 'CentOS', 'ipv4': ['10.0.1.2']},
+                   {'role': 'frontend'})
+        self.cache('db1', {'os': 'Debian'}, {'role': 'db'})
+        # web10 has no cached data, its result is unknown
+        self.assertEqual(
+            self.check('G@os:debian and web*', 'compound'),
+            ['web1', 'web10'])
+        self.assertEqual(
+            self.check('I@role:db or L@web2', 'compound'),
+            ['db1', 'web10', 'web2'])
+        self.assertEqual(
+            self.check('web* and not G@os:debian', 'compound'),
+            ['web10', 'web2'])
+        self.assertEqual(
+            self.check('E@db.* and not I@role:db', 'compound'), [])
+        self.assertEqual(self.check('role:front*', 'pillar'),
+                         ['web1', 'web10', 'web2'])
+        # db1 has no cached ip address
+        self.assertEqual(self.check('10.0.0.0/24', 'ipcidr'),
+                         ['db1', 'web1', 'web10'])
+        self.assertEqual(self.check('S@10.0.1.2 and web*', 'compound'),
+                         ['web10', 'web2'])
+        # Expressions the master can not evaluate target every minion
+        self.assertEqual(self.check('X@test.true and db*', 'compound'),
+                         ['db1'])
+        self.assertEqual(self.check('web1 and', 'compound'),
+                         ['db1', 'web1', 'web10', 'web2'])
+        self.assertEqual(self.check('Z@foo', 'compound'),
+                         ['db1', 'web1', 'web10', 'web2'])
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(MinionRegistryTest)
+    TextTestRunner(verbosity=1).run(tests)
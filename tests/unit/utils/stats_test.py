@@ -0,0 +1,87 @@
+'''
+Test the master stats collection
+'''
+
+# Import python libs
+import shutil
+import tempfile
+
+# Import salt libs
+from saltunittest import TestCase, TestLoader, TextTestRunner
+
+import salt.utils.stats
+
+
+class StatsTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.tmpdir, 'serial': 'msgpack'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_collect(self):
+        stats = salt.utils.stats.Stats(self.opts, 'test')
+        stats.inc('admitted')
+        stats.inc('admitted', 2)
+        stats.gauge('queue_depth', 5)
+        stats.gauge('queue_depth', 2)
+        stats.timing('latency', 1.0)
+        stats.timing('latency', 3.0)
+        self.assertEqual(stats.counters['admitted'], 3)
+        self.assertEqual(stats.gauges['queue_depth'], 2)
+        self.assertEqual(stats.gauges['queue_depth_max'], 5)
+        self.assertEqual(stats.average('latency'), 2.0)
+        self.assertEqual(stats.timings['latency']['max'], 3.0)
+        self.assertEqual(stats.average('missing'), 0.0)
+
+    def test_flush(self):
+        self.assertEqual(salt.utils.stats.read(self.opts, 'test'), {})
+        stats = salt.utils.stats.Stats(self.opts, 'test')
+        stats.inc('admitted')
+        self.assertTrue(stats.flush())
+        # The interval has not passed
+        self.assertFalse(stats.flush())
+        snapshot = salt.utils.stats.read(self.opts, 'test')
+        self.assertEqual(snapshot['counters'], {'admitted': 1})
+        self.assertEqual(snapshot['name'], 'test')
+
+    def test_histogram(self):
+        stats = salt.utils.stats.Stats(self.opts, 'test')
+        stats.timing('latency', 0.0005)
+        stats.timing('latency', 0.001)
+        stats.timing('latency', 2.0)
+        stats.timing('latency', 120.0)
+        histogram = stats.timings['latency']['histogram']
+        self.assertEqual(histogram[0], 2)
+        self.assertEqual(histogram[stats.buckets.index(5)], 1)
+        self.assertEqual(histogram[-1], 1)
+
+    def test_merge(self):
+        first = salt.utils.stats.Stats(self.opts, 'first')
+        first.request('aes:_return', 0.5, 100, 0)
+        second = salt.utils.stats.Stats(self.opts, 'second')
+        second.request('aes:_return', 1.5, 300, 0, error=True)
+        second.gauge('queue_depth', 4)
+        first.flush()
+        second.flush()
+        names = salt.utils.stats.names(self.opts)
+        self.assertEqual(names, ['first', 'second'])
+        merged = salt.utils.stats.merge(
+                salt.utils.stats.read(self.opts, name) for name in names)
+        self.assertEqual(merged['processes'], 2)
+        timing = merged['timings']['aes:_return']
+        self.assertEqual(timing['count'], 2)
+        self.assertEqual(timing['avg'], 1.0)
+        self.assertEqual(timing['max'], 1.5)
+        self.assertEqual(sum(timing['histogram']), 2)
+        self.assertEqual(
+            merged['timings']['aes:_return:size_in']['avg'], 200.0)
+        self.assertEqual(merged['counters']['aes:_return:errors'], 1)
+        self.assertEqual(merged['gauges']['queue_depth'], 4)
+
+
+if __name__ == "__main__":
+    loader = TestLoader()
+    tests = loader.loadTestsFromTestCase(StatsTest)
+    TextTestRunner(verbosity=1).run(tests)